@@ -4,9 +4,12 @@ Initializes Flask application and registers blueprints.
 """
 
 import os
+import logging
+import time
+import click
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, make_response
 from dotenv import load_dotenv
-from flask_login import login_user, logout_user, login_required, current_user
+from flask_login import logout_user, login_required, current_user
 from urllib.parse import urlparse
 from extensions import db, login_manager, cache, scheduler, migrate, csrf
 from models import User
@@ -15,15 +18,25 @@ from forms import LoginForm, RegistrationForm, APICredentialsForm, SyncSettingsF
 from services.canvas_api import CanvasAPI
 from services.todoist_api import TodoistClient
 from services.sync_service import SyncService
+from services.history_writer import history_writer
+from services import user_loader
 from functools import wraps
 from datetime import datetime, timedelta
-import stripe
+from concurrent.futures import ThreadPoolExecutor
 import socket
 from config import Config, config
+from utils.logging_config import configure_logging
+from utils.metrics import metrics, SYNC_DURATION_SECONDS, SCHEDULER_QUEUE_DEPTH, SCHEDULER_RUNS
+from utils.db import configure_pool, connection_label, unit_of_work
+from utils.query_counter import query_counter
+from utils.profiling import profiler
+from utils.passwords import password_hasher
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # URL parsing helper
 def url_parse(url):
     return urlparse(url)
@@ -42,15 +55,17 @@ def premium_required(f):
     return decorated_function
 
 # API client initialization helper
-def get_api_clients():
+def get_api_clients(timer=None):
     if current_user.is_authenticated:
         try:
             canvas_api_client = CanvasAPI(
                 api_url=current_user.canvas_api_url,
-                api_token=current_user.get_canvas_token()
+                api_token=current_user.get_canvas_token(),
+                timer=timer
             )
             todoist_client = TodoistClient(
-                api_token=current_user.get_todoist_token()
+                api_token=current_user.get_todoist_token(),
+                timer=timer
             )
             sync_service_client = SyncService(canvas_api_client, todoist_client)
             return canvas_api_client, todoist_client, sync_service_client
@@ -66,7 +81,7 @@ def get_canvas_courses(api_client):
     try:
         return api_client.get_courses()
     except Exception as e:
-        print(f"Error fetching Canvas courses: {str(e)}")
+        logger.error('Error fetching Canvas courses: %s', e)
         return []
 
 def get_todoist_projects(api_client):
@@ -75,7 +90,7 @@ def get_todoist_projects(api_client):
     try:
         return api_client.get_projects()
     except Exception as e:
-        print(f"Error fetching Todoist projects: {str(e)}")
+        logger.error('Error fetching Todoist projects: %s', e)
         return []
 
 # Global cached functions to be used by routes
@@ -86,7 +101,7 @@ def get_cached_canvas_courses(api_client):
     try:
         return get_canvas_courses(api_client)
     except Exception as e:
-        print(f"Error in cached Canvas courses: {str(e)}")
+        logger.error('Error in cached Canvas courses: %s', e)
         return []
     
 def get_cached_todoist_projects(api_client):
@@ -96,34 +111,24 @@ def get_cached_todoist_projects(api_client):
     try:
         return get_todoist_projects(api_client)
     except Exception as e:
-        print(f"Error in cached Todoist projects: {str(e)}")
+        logger.error('Error in cached Todoist projects: %s', e)
         return []
 
-def create_app(config_name='default'):
+def default_config_name():
+    """Configuration used when none is given: FLASK_CONFIG, else picked by host."""
+    if os.environ.get('FLASK_CONFIG'):
+        return os.environ['FLASK_CONFIG']
+    return 'pythonanywhere' if 'pythonanywhere' in socket.gethostname().lower() else 'development'
+
+def create_app(config_name=None):
     """Create and configure the Flask application."""
     app = Flask(__name__)
     
     # Load the appropriate configuration
-    app.config.from_object(config[config_name])
-    
-    # Set up logging
-    import logging
-    from logging.handlers import RotatingFileHandler
-    import os
-    
-    # Ensure the logs directory exists
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    
-    # Set up the main application log file
-    file_handler = RotatingFileHandler('logs/canvas_todoist.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.DEBUG)
-    app.logger.addHandler(file_handler)
-    
-    app.logger.setLevel(logging.DEBUG)
+    app.config.from_object(config[config_name or default_config_name()])
+    
+    # Set up logging - non-blocking queue handler, levels from config
+    configure_logging(app)
     app.logger.info('Canvas-Todoist startup')
     
     # Add scheduler configuration
@@ -136,7 +141,8 @@ def create_app(config_name='default'):
     # Session configuration - use only one consistent session cookie name
     app.config['SESSION_COOKIE_NAME'] = 'session'  # Use default Flask session cookie name
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-    app.config['SESSION_REFRESH_EACH_REQUEST'] = True
+    # Only send the cookie when the session changes; Flask-Login and flashes mark it modified
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False
     
     # Get domain from environment or config
     domain = os.environ.get('DOMAIN') or app.config.get('DOMAIN')
@@ -170,16 +176,19 @@ def create_app(config_name='default'):
     login_manager.login_message_category = 'info'
     login_manager.session_protection = 'basic'  # Use basic protection instead of None
     
-    # Debug mode configuration
-    app.debug = True  # Enable debug mode
-    
     # Initialize extensions with login_manager first
     login_manager.init_app(app)
+    configure_pool(app)
     db.init_app(app)
     migrate.init_app(app)
     cache.init_app(app)
     csrf.init_app(app)
     scheduler.init_app(app)
+    metrics.init_app(app)
+    query_counter.init_app(app)
+    profiler.init_app(app)
+    history_writer.init_app(app)
+    password_hasher.init_app(app)
     
     # Disable CSRF protection for API routes
     app.config['WTF_CSRF_CHECK_DEFAULT'] = False
@@ -192,61 +201,29 @@ def create_app(config_name='default'):
             return True
         return False
     
-    # User loader for Flask-Login - simplified and more reliable
-    @login_manager.user_loader
-    def load_user(user_id):
-        try:
-            app.logger.debug('Loading user with ID: %s', user_id)
-            user = User.query.get(int(user_id))
-            if user:
-                app.logger.debug('User loaded successfully: %s', user.username)
-            else:
-                app.logger.warning('No user found with ID: %s', user_id)
-            return user
-        except Exception as e:
-            app.logger.error('Error loading user: %s', str(e))
-            return None
+    # User loader for Flask-Login, cached per request and briefly across requests
+    user_loader.init_app(app)
 
-    # Debug logging for session and auth
-    if app.debug:
+    # Request details are only logged in profiles that opt in (never headers, cookies or session)
+    if app.config.get('LOG_REQUEST_DETAILS'):
         @app.before_request
         def log_request_info():
-            app.logger.debug('Request method: %s, path: %s', request.method, request.path)
-            app.logger.debug('Headers: %s', request.headers)
-            app.logger.debug('Session: %s', dict(session))
-            app.logger.debug('User: %s', current_user)
-            
-            # Check session cookie
-            if 'session' in request.cookies:
-                app.logger.debug('Session cookie found: %s', request.cookies.get('session'))
-            else:
-                app.logger.warning('No session cookie found in request')
-            
-            # Clear old session cookie if present - this is causing problems
-            if 'canvas_todoist_session' in request.cookies:
-                app.logger.debug('Detected old canvas_todoist_session cookie, marking for deletion')
-                g.delete_old_cookie = True
-            
-            # Force load the user if in session but not recognized by Flask-Login
-            if not current_user.is_authenticated and 'user_id' in session:
-                user_id = session.get('user_id')
-                app.logger.debug('Attempting to restore user session for user_id: %s', user_id)
-                user = User.query.get(user_id)
-                if user:
-                    login_user(user)
-                    app.logger.debug('Restored user session for: %s', user.username)
-                
-        # After request handler to ensure session is saved
-        @app.after_request
-        def after_request_func(response):
-            # Always save the session
-            session.modified = True
-            
-            # Delete the old cookie if needed
-            if hasattr(g, 'delete_old_cookie') and g.delete_old_cookie:
-                response.delete_cookie('canvas_todoist_session')
-            
-            return response
+            app.logger.debug('Request %s %s (user_id=%s)', request.method, request.path,
+                             session.get('_user_id'))
+    
+    @app.before_request
+    def check_old_session_cookie():
+        # Clear old session cookie if present - this is causing problems
+        if 'canvas_todoist_session' in request.cookies:
+            g.delete_old_cookie = True
+    
+    @app.after_request
+    def after_request_func(response):
+        # Delete the old cookie if needed
+        if hasattr(g, 'delete_old_cookie') and g.delete_old_cookie:
+            response.delete_cookie('canvas_todoist_session')
+        
+        return response
 
     # Add a debug route to check session and authentication status
     @app.route('/debug/auth-status')
@@ -282,7 +259,7 @@ def create_app(config_name='default'):
         return render_template('errors/500.html'), 500
     
     # Register blueprints
-    from blueprints import main_bp, auth_bp, dashboard_bp, settings_bp, admin_bp, sync_bp, payments_bp, history_bp
+    from blueprints import main_bp, auth_bp, dashboard_bp, settings_bp, admin_bp, sync_bp, payments_bp, history_bp, metrics_bp
     app.register_blueprint(main_bp)  # No url_prefix for main blueprint
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
@@ -291,6 +268,7 @@ def create_app(config_name='default'):
     app.register_blueprint(sync_bp, url_prefix='/sync')
     app.register_blueprint(payments_bp, url_prefix='/payments')
     app.register_blueprint(history_bp, url_prefix='/history')
+    app.register_blueprint(metrics_bp)  # Serves /metrics
     
     # Add a direct_sync route at the application level
     @app.route('/direct_sync', methods=['POST'])
@@ -301,50 +279,58 @@ def create_app(config_name='default'):
         import json
         import datetime
         from models import SyncHistory, db
+        from services.instrumentation import SyncTimer
         
-        current_app.logger.debug(f"Direct sync endpoint accessed")
-        current_app.logger.debug(f"Headers: {request.headers}")
+        timer = SyncTimer()
+        
+        def save_sync_history(sync_history, details, error_label):
+            """Insert the history row with the sync's timings; never fails the request."""
+            try:
+                with timer.span('db', 'INSERT sync_history'):
+                    db.session.add(sync_history)
+                    db.session.flush()
+                # Timings are attached after the insert so the waterfall includes it
+                details['timings'] = timer.to_dict()
+                sync_history.details = json.dumps(details)
+                db.session.commit()
+            except Exception as db_error:
+                # Log the database error but don't fail the API call
+                current_app.logger.error('Error saving %s: %s', error_label, db_error)
+                db.session.rollback()
         
         # Get data from request
         try:
             # Try parsing JSON data
             try:
-                data = request.get_json(force=True, silent=True)
-                if data:
-                    current_app.logger.debug(f"JSON data received: {data}")
-                else:
-                    current_app.logger.debug("No JSON data found, trying form data")
-                    data = {}
+                data = request.get_json(force=True, silent=True) or {}
             except Exception as e:
-                current_app.logger.error(f"Error parsing JSON: {e}")
+                current_app.logger.error('Error parsing JSON: %s', e)
                 data = {}
                 
             # Try form data as fallback
             form_data = request.form.to_dict()
             if form_data:
-                current_app.logger.debug(f"Form data received: {form_data}")
                 data.update(form_data)
                 
             # Try URL parameters as last resort
             url_params = request.args.to_dict()
             if url_params:
-                current_app.logger.debug(f"URL parameters received: {url_params}")
                 data.update(url_params)
                 
             # Extract course_id and project_id from combined data
             course_id = data.get('course_id')
             project_id = data.get('project_id')
             
-            current_app.logger.debug(f"Course ID: {course_id}, Project ID: {project_id}")
-            
             if not course_id or not project_id:
                 return jsonify({
                     'success': False,
                     'error': 'Missing required parameters: course_id and project_id'
                 }), 400
             
-            # Get API clients for the current user
-            canvas_client, todoist_client, sync_service = get_api_clients()
+            # Credentials are read in a short unit of work that also ends the transaction opened by
+            # loading the user, so no pooled connection is held during the Canvas and Todoist calls
+            with unit_of_work(), timer.span('setup', 'init API clients'):
+                canvas_client, todoist_client, sync_service = get_api_clients(timer)
             
             if not canvas_client or not todoist_client or not sync_service:
                 return jsonify({
@@ -352,23 +338,23 @@ def create_app(config_name='default'):
                     'error': 'API clients not initialized. Please check your API credentials.'
                 }), 400
             
-            current_app.logger.debug(f"Starting sync from Canvas course {course_id} to Todoist project {project_id}")
+            current_app.logger.debug('Starting sync from Canvas course %s to Todoist project %s',
+                                     course_id, project_id)
             
             # Perform the actual sync
             start_time = datetime.datetime.now()
             try:
                 # Get course assignments
-                current_app.logger.debug(f"Fetching assignments for course {course_id}")
                 assignments = canvas_client.get_assignments(course_id)
-                current_app.logger.debug(f"Found {len(assignments)} assignments")
                 
                 # Sync assignments to Todoist
-                current_app.logger.debug(f"Syncing {len(assignments)} assignments to Todoist project {project_id}")
                 result = sync_service.sync_assignments_to_todoist(assignments, project_id)
-                current_app.logger.debug(f"Sync result: {result}")
+                current_app.logger.debug('Synced %d of %d assignments to project %s',
+                                         len(result), len(assignments), project_id)
                 
                 end_time = datetime.datetime.now()
                 duration = (end_time - start_time).total_seconds()
+                SYNC_DURATION_SECONDS.observe(duration, trigger='manual', outcome='success')
                 
                 # Create sync history record
                 sync_history = SyncHistory(
@@ -378,24 +364,16 @@ def create_app(config_name='default'):
                     items_synced=len(assignments),
                     source_id=course_id,
                     destination_id=project_id,
-                    details=json.dumps({
-                        'course_id': course_id,
-                        'project_id': project_id,
-                        'assignments_count': len(assignments),
-                        'duration_seconds': duration
-                    }),
                     timestamp=datetime.datetime.now(),
                     started_at=start_time,
                     completed_at=end_time
                 )
-                db.session.add(sync_history)
-                try:
-                    db.session.commit()
-                except Exception as db_error:
-                    # Log the database error but don't fail the API call
-                    current_app.logger.error(f"Error saving sync history: {str(db_error)}")
-                    current_app.logger.error(f"This is likely a database schema mismatch issue. The sync itself was successful.")
-                    db.session.rollback()
+                save_sync_history(sync_history, {
+                    'course_id': course_id,
+                    'project_id': project_id,
+                    'assignments_count': len(assignments),
+                    'duration_seconds': duration
+                }, 'sync history (the sync itself succeeded)')
                 
                 # Clear caches to ensure data is fresh
                 try:
@@ -405,9 +383,8 @@ def create_app(config_name='default'):
                         user_projects_key = f"projects_{current_user.id}"
                         current_app.cache.delete(user_courses_key)
                         current_app.cache.delete(user_projects_key)
-                        current_app.logger.debug(f"Cleared cache keys: {user_courses_key}, {user_projects_key}")
                 except Exception as cache_error:
-                    current_app.logger.error(f"Error clearing cache: {str(cache_error)}")
+                    current_app.logger.error('Error clearing cache: %s', cache_error)
                 
                 return jsonify({
                     'success': True,
@@ -421,9 +398,9 @@ def create_app(config_name='default'):
                 })
                 
             except Exception as e:
-                current_app.logger.error(f"Error syncing assignments: {str(e)}")
-                import traceback
-                current_app.logger.error(traceback.format_exc())
+                current_app.logger.exception('Error syncing assignments: %s', e)
+                SYNC_DURATION_SECONDS.observe((datetime.datetime.now() - start_time).total_seconds(),
+                                              trigger='manual', outcome='error')
                 
                 # Create error sync history record
                 sync_history = SyncHistory(
@@ -433,23 +410,15 @@ def create_app(config_name='default'):
                     items_synced=0,
                     source_id=course_id,
                     destination_id=project_id,
-                    details=json.dumps({
-                        'course_id': course_id,
-                        'project_id': project_id,
-                        'error': str(e)
-                    }),
                     timestamp=datetime.datetime.now(),
                     started_at=start_time,
                     completed_at=datetime.datetime.now()
                 )
-                db.session.add(sync_history)
-                try:
-                    db.session.commit()
-                except Exception as db_error:
-                    # Log the database error but don't fail the API call
-                    current_app.logger.error(f"Error saving error sync history: {str(db_error)}")
-                    current_app.logger.error(f"This is likely a database schema mismatch issue. The sync failed but this is only a logging issue.")
-                    db.session.rollback()
+                save_sync_history(sync_history, {
+                    'course_id': course_id,
+                    'project_id': project_id,
+                    'error': str(e)
+                }, 'error sync history')
                 
                 return jsonify({
                     'success': False,
@@ -457,9 +426,7 @@ def create_app(config_name='default'):
                 }), 500
             
         except Exception as e:
-            current_app.logger.error(f"Error in direct sync endpoint: {str(e)}")
-            import traceback
-            current_app.logger.error(traceback.format_exc())
+            current_app.logger.exception('Error in direct sync endpoint: %s', e)
             return jsonify({
                 'success': False,
                 'error': f"Direct sync error: {str(e)}"
@@ -474,26 +441,16 @@ def create_app(config_name='default'):
         """Direct route for the sync API endpoint."""
         from flask import jsonify, request
         
-        # Simple debug response to test route reachability
-        app.logger.debug("--- DIRECT API SYNC ROUTE ACCESSED ---")
-        app.logger.debug(f"Headers: {request.headers}")
-        app.logger.debug(f"CSRF Token in URL: {csrf_token}")
-        
         try:
-            body = request.get_data(as_text=True)
-            app.logger.debug(f"Request body: {body[:100]}")  # Log first 100 chars only
-            
             # Get JSON data with fallback
             try:
                 json_data = request.get_json(force=True, silent=True)
-                app.logger.debug(f"JSON data: {json_data}")
             except Exception as e:
-                app.logger.error(f"Error parsing JSON: {e}")
+                app.logger.error('Error parsing JSON: %s', e)
                 json_data = None
                 
             # Try to get form data as fallback
             form_data = request.form.to_dict()
-            app.logger.debug(f"Form data: {form_data}")
             
             # Try to get course_id and project_id from any source
             course_id = None
@@ -512,20 +469,17 @@ def create_app(config_name='default'):
                 course_id = request.args.get('course_id', course_id)
                 project_id = request.args.get('project_id', project_id)
                 
-            app.logger.debug(f"Final course_id: {course_id}, project_id: {project_id}")
-            
             return jsonify({
                 'success': True,
                 'message': f'Direct API sync debug - course_id: {course_id}, project_id: {project_id}',
                 'route': 'direct',
                 'received_data': {
-                    'body': body[:100] if body else None,
                     'course_id': course_id,
                     'project_id': project_id
                 }
             })
         except Exception as e:
-            app.logger.error(f"Error in direct API sync route: {str(e)}")
+            app.logger.error('Error in direct API sync route: %s', e)
             return jsonify({
                 'success': False,
                 'error': f"Direct API error: {str(e)}"
@@ -535,7 +489,6 @@ def create_app(config_name='default'):
     @app.route('/api/refresh_data/<csrf_token>', methods=['POST'])
     def api_refresh(csrf_token=None):
         """Direct route for the refresh data API endpoint."""
-        app.logger.debug(f"CSRF Token in URL for refresh: {csrf_token}")
         return refresh_data()
         
     @app.route('/api/test_canvas', methods=['POST'])
@@ -553,9 +506,6 @@ def create_app(config_name='default'):
     for view in api_views:
         csrf.exempt(view)
     
-    # Initialize Stripe
-    stripe.api_key = app.config['STRIPE_SECRET_KEY']
-    
     # Set up cache functions with proper decorators now that we have app context
     @cache.cached(timeout=app.config['CACHE_DEFAULT_TIMEOUT'], key_prefix=lambda: f"courses_{current_user.id}" if current_user.is_authenticated else "courses_anonymous")
     def get_cached_canvas_courses_with_app(api_client):
@@ -573,87 +523,209 @@ def create_app(config_name='default'):
     # Scheduled task for automated syncing
     @scheduler.task('interval', id='sync_assignments', seconds=60*15)  # Run every 15 minutes
     def scheduled_sync():
-        with app.app_context():
+        with app.app_context(), connection_label('scheduled_sync'):
             try:
-                now = datetime.utcnow()
-                
                 # Import here to avoid circular imports
-                from models import SyncSettings
+                from models import SyncSettings, active_mappings_by_user
                 
-                # Get all enabled sync settings
-                settings = SyncSettings.query.filter_by(enabled=True).all()
+                # Claimed rows are committed (leased) before syncing; keep them loaded
+                # instead of re-selecting every row after each commit
+                db.session().expire_on_commit = False
                 
-                for setting in settings:
-                    user = User.query.get(setting.user_id)
-                    
-                    # Skip if user is not premium
-                    if not user.is_premium:
-                        continue
+                batch_size = app.config['SCHEDULER_BATCH_SIZE']
+                lease = timedelta(seconds=app.config['SCHEDULER_LEASE_SECONDS'])
+                
+                SCHEDULER_QUEUE_DEPTH.set(SyncSettings.count_due(datetime.utcnow()))
+                
+                # Users are synced in parallel; workers only call the APIs and hand their
+                # results to the history writer, which writes them in batches
+                with ThreadPoolExecutor(max_workers=app.config['SCHEDULER_SYNC_WORKERS'],
+                                        thread_name_prefix='scheduled-sync') as executor:
+                    while True:
+                        now = datetime.utcnow()
                         
-                    # Check if it's time to sync based on frequency
-                    should_sync = False
-                    
-                    if setting.last_sync is None:
-                        should_sync = True
-                    elif setting.frequency == 'hourly' and (now - setting.last_sync).total_seconds() >= 3600:
-                        should_sync = True
-                    elif setting.frequency == 'daily' and (now - setting.last_sync).total_seconds() >= 86400:
-                        should_sync = True
-                    elif setting.frequency == 'weekly' and (now - setting.last_sync).total_seconds() >= 604800:
-                        should_sync = True
+                        # Due settings joined with their users in one query, oldest due first
+                        claimed = SyncSettings.claim_due(now, batch_size, lease)
+                        if not claimed:
+                            break
                         
-                    if should_sync:
-                        try:
-                            # Initialize API clients for the user
-                            canvas_api_client = CanvasAPI(
-                                api_url=user.canvas_api_url,
-                                api_token=user.get_canvas_token()
-                            )
-                            todoist_client = TodoistClient(
-                                api_token=user.get_todoist_token()
-                            )
-                            sync_service_client = SyncService(canvas_api_client, todoist_client)
-                            
-                            # Get all courses
-                            courses = canvas_api_client.get_courses()
-                            
-                            # Sync assignments for each course
-                            for course in courses:
-                                sync_service_client.sync_course_assignments(course['id'])
-                            
-                            # Update last sync time
-                            setting.last_sync = now
-                            db.session.commit()
-                            
-                            app.logger.info(f"Automatic sync completed for user {user.username}")
-                        except Exception as e:
-                            app.logger.error(f"Error syncing for user {user.username}: {str(e)}")
+                        # Everything the syncs need is read up front, in one short unit of work
+                        with unit_of_work():
+                            # One query for every claimed user's mappings instead of one per user
+                            mappings_by_user = active_mappings_by_user([user.id for _, user in claimed])
+                            jobs = [_prepare_scheduled_sync(setting, user, mappings_by_user.get(user.id, []), now)
+                                    for setting, user in claimed]
+                        
+                        # claim_due() only returns premium users; wait for the batch before claiming more
+                        list(executor.map(_run_scheduled_sync, [job for job in jobs if job is not None]))
+                
+                SCHEDULER_RUNS.inc(outcome='success')
+            except Exception as e:
+                SCHEDULER_RUNS.inc(outcome='error')
+                app.logger.exception('Scheduled sync run failed: %s', e)
             finally:
+                history_writer.flush()
                 # Ensure database connections are properly closed
                 db.session.remove()
     
-    # Ensure database connections are properly closed
-    with app.app_context():
-        db.create_all()
-        
-        # Clean up any existing MySQL connections - this helps when redeploying
+    def _prepare_scheduled_sync(setting, user, mappings, now):
+        """Read what a user's scheduled sync needs into a plain dict (no lazy loads later)."""
         try:
-            # Force SQLAlchemy to create a fresh connection pool
-            db.engine.dispose()
-            print("Database connection pool refreshed at startup")
+            return {
+                'setting_id': setting.id,
+                'user_id': user.id,
+                'username': user.username,
+                'canvas_api_url': user.canvas_api_url,
+                'canvas_token': user.get_canvas_token(),
+                'todoist_token': user.get_todoist_token(),
+                'courses': [{
+                    'mapping_id': mapping.id,
+                    'course_id': mapping.course_id,
+                    'project_id': mapping.project_id,
+                    'course_name': mapping.course_name,
+                    'due_date_buffer': mapping.due_date_buffer or 0,
+                    'skip_submitted': mapping.skip_submitted,
+                } for mapping in mappings],
+                'now': now,
+                'next_run_at': setting.next_run_time(now),
+            }
+        except Exception as e:
+            # Leave the lease in place; the row becomes due again when it expires
+            app.logger.error('Error preparing sync for user %s: %s', setting.user_id, e)
+            return None
+    
+    def _run_scheduled_sync(job):
+        """Sync one user's courses (worker thread, no database access) and queue the results."""
+        sync_started = time.perf_counter()
+        try:
+            canvas_api_client = CanvasAPI(api_url=job['canvas_api_url'], api_token=job['canvas_token'])
+            todoist_client = TodoistClient(api_token=job['todoist_token'])
+            sync_service_client = SyncService(canvas_api_client, todoist_client)
+            
+            # Sync assignments for each mapped course into its project
+            failed = False
+            for course in job['courses']:
+                started_at = datetime.utcnow()
+                history = {
+                    'user_id': job['user_id'],
+                    'sync_type': 'canvas_to_todoist',
+                    'source_id': course['course_id'],
+                    'destination_id': course['project_id'],
+                    'started_at': started_at,
+                }
+                try:
+                    created = sync_service_client.sync_course_assignments(
+                        course['course_id'],
+                        project_id=course['project_id'],
+                        course_name=course['course_name'],
+                        due_date_buffer=course['due_date_buffer'],
+                        skip_submitted=course['skip_submitted']
+                    )
+                except Exception as e:
+                    failed = True
+                    history_writer.add_history(status='error', items_synced=0, error_message=str(e),
+                                               completed_at=datetime.utcnow(), **history)
+                    app.logger.error('Error syncing course %s for user %s: %s',
+                                     course['course_id'], job['username'], e)
+                    continue
+                history_writer.add_history(status='success', items_synced=len(created),
+                                           completed_at=datetime.utcnow(), **history)
+            
+            if failed:
+                # Leave the lease in place; the row becomes due again when it expires
+                SYNC_DURATION_SECONDS.observe(time.perf_counter() - sync_started,
+                                              trigger='scheduled', outcome='error')
+                return False
+            
+            # Update last sync times and release the lease when the writer flushes
+            history_writer.update_mappings([course['mapping_id'] for course in job['courses']], job['now'])
+            history_writer.update_settings(job['setting_id'], last_sync=job['now'], next_run_at=job['next_run_at'])
+            
+            SYNC_DURATION_SECONDS.observe(time.perf_counter() - sync_started,
+                                          trigger='scheduled', outcome='success')
+            app.logger.info('Automatic sync completed for user %s', job['username'])
+            return True
         except Exception as e:
-            print(f"Warning: Could not refresh connection pool: {str(e)}")
+            SYNC_DURATION_SECONDS.observe(time.perf_counter() - sync_started,
+                                          trigger='scheduled', outcome='error')
+            app.logger.error('Error syncing for user %s: %s', job['username'], e)
+            return False
+    
+    # Stripe webhook events are stored by the webhook and applied here, outside the request
+    @scheduler.task('interval', id='process_stripe_events', seconds=app.config['STRIPE_EVENT_POLL_SECONDS'])
+    def scheduled_stripe_events():
+        with app.app_context():
+            from services.stripe_events import process_pending_events
+            try:
+                process_pending_events()
+            except Exception as e:
+                app.logger.exception('Stripe event run failed: %s', e)
+            finally:
+                db.session.remove()
+    
+    @scheduler.task('cron', id='purge_stripe_events', hour=3, minute=17)
+    def scheduled_purge_stripe_events():
+        with app.app_context():
+            from services.stripe_events import purge_old_events
+            try:
+                purge_old_events()
+            except Exception as e:
+                app.logger.exception('Purging Stripe events failed: %s', e)
+            finally:
+                db.session.remove()
+    
+    # Corrects local subscription state that missed webhook events
+    @scheduler.task('interval', id='reconcile_subscriptions', hours=app.config['SUBSCRIPTION_RECONCILE_HOURS'])
+    def scheduled_reconcile_subscriptions():
+        with app.app_context():
+            from services.subscriptions import reconcile_subscriptions
+            try:
+                reconcile_subscriptions()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Subscription reconciliation failed: %s', e)
+            finally:
+                db.session.remove()
+    
+    @app.cli.command('reconcile-subscriptions')
+    def reconcile_subscriptions_command():
+        """Update local subscription rows from Stripe."""
+        from services.subscriptions import reconcile_subscriptions
+        counts = reconcile_subscriptions()
+        click.echo(', '.join(f"{key} {value}" for key, value in counts.items()))
+    
+    # For deployments without the scheduler (uWSGI), e.g. as an always-on task
+    @app.cli.command('process-stripe-events')
+    @click.option('--loop', is_flag=True, help='Keep polling every STRIPE_EVENT_POLL_SECONDS.')
+    def process_stripe_events_command(loop):
+        """Apply pending Stripe webhook events."""
+        from services.stripe_events import process_pending_events, purge_old_events
+        purge_old_events()
+        while True:
+            counts = process_pending_events()
+            click.echo(', '.join(f"{key} {value}" for key, value in counts.items()))
+            if not loop:
+                break
+            db.session.remove()
+            time.sleep(app.config['STRIPE_EVENT_POLL_SECONDS'])
+    
+    # Schema creation is an explicit deploy step rather than part of every worker's startup
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing database tables."""
+        db.create_all()
+        click.echo('Database tables created.')
     
     # Check if running under uWSGI
     try:
         import uwsgi
         # Running under uWSGI - don't start the scheduler
-        print("Detected uWSGI environment - scheduler will not start automatically")
+        app.logger.info('Detected uWSGI environment - scheduler will not start automatically')
         # The scheduler can be run separately using a scheduled task in PythonAnywhere
     except ImportError:
         # Not running under uWSGI, safe to start scheduler
         if not os.environ.get('FLASK_RUN_FROM_CLI') and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
-            print("Starting scheduler in non-uWSGI environment")
+            app.logger.info('Starting scheduler in non-uWSGI environment')
             scheduler.start()
     
     # Add a direct refresh endpoint that bypasses CSRF protection
@@ -663,15 +735,13 @@ def create_app(config_name='default'):
         """Direct refresh endpoint that completely bypasses CSRF protection."""
         from flask import jsonify, current_app
         
-        current_app.logger.debug("Direct refresh endpoint accessed")
-        
         try:
             return jsonify({
                 'success': True,
                 'message': 'Data refreshed successfully'
             })
         except Exception as e:
-            current_app.logger.error(f"Error in direct refresh endpoint: {str(e)}")
+            current_app.logger.error('Error in direct refresh endpoint: %s', e)
             return jsonify({
                 'success': False,
                 'error': str(e)
@@ -679,11 +749,9 @@ def create_app(config_name='default'):
     
     return app
 
-# Create application instance
-app = create_app('pythonanywhere' if 'pythonanywhere' in socket.gethostname().lower() else 'development')
-
-# Only used when running directly with Python
+# Only used when running directly with Python; WSGI servers and `flask` call create_app()
 if __name__ == '__main__':
+    app = create_app()
     app.jinja_env.cache = {}
     app.run()
 
@@ -14,6 +14,7 @@ admin_bp = Blueprint('admin', __name__)
 sync_bp = Blueprint('sync', __name__)
 payments_bp = Blueprint('payments', __name__)
 history_bp = Blueprint('history', __name__)
+metrics_bp = Blueprint('metrics', __name__)
 
 # Import routes after blueprint creation to avoid circular imports
-from blueprints import main, auth, dashboard, settings, admin, sync, payments, history 
\ No newline at end of file
+from blueprints import main, auth, dashboard, settings, admin, sync, payments, history, metrics 
\ No newline at end of file
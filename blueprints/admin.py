@@ -3,13 +3,20 @@ Admin blueprint.
 Handles administrative functionality and system management.
 """
 
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from functools import wraps
 from blueprints import admin_bp
-from models import User, db, SyncSettings, SyncHistory
+from models import User, db, SyncSettings, SyncHistory, load_user_overviews, paginate_user_overviews, system_stats
+from extensions import cache
+from utils.db import pool_monitor
+from utils.metrics import record_cache_lookup
+from utils.passwords import PasswordHasherBusy
+from utils.profiling import profiler, build_flame_tree
 from datetime import datetime, timedelta
 
+SYSTEM_STATS_CACHE_KEY = 'admin_system_stats'
+
 def admin_required(f):
     """Decorator to require admin privileges."""
     @wraps(f)
@@ -25,7 +32,8 @@ def admin_required(f):
 @admin_required
 def index():
     """Display admin dashboard."""
-    users = User.query.all()
+    # Newest users only; the full list lives on the paginated users page
+    users = load_user_overviews(User.query.order_by(User.id.desc()).limit(20))
     return render_template('admin/index.html', users=users)
 
 @admin_bp.route('/admin/users')
@@ -33,8 +41,26 @@ def index():
 @admin_required
 def users():
     """Display user management page."""
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    search = request.args.get('q', '').strip()
+    status = request.args.get('status', '').strip()
+    after_id = request.args.get('after', type=int)
+    before_id = request.args.get('before', type=int)
+    per_page = current_app.config.get('ADMIN_USERS_PER_PAGE', 50)
+    
+    users, prev_cursor, next_cursor = paginate_user_overviews(
+        after_id=after_id,
+        before_id=before_id,
+        search=search or None,
+        status=status or None,
+        per_page=per_page
+    )
+    
+    return render_template('admin/users.html',
+                          users=users,
+                          search=search,
+                          status=status,
+                          prev_cursor=prev_cursor,
+                          next_cursor=next_cursor)
 
 @admin_bp.route('/admin/users/<int:user_id>', methods=['GET', 'POST'])
 @login_required
@@ -56,6 +82,10 @@ def edit_user(user_id):
             db.session.commit()
             flash('User updated successfully', 'success')
             return redirect(url_for('admin.users'))
+        except PasswordHasherBusy:
+            db.session.rollback()
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return redirect(url_for('admin.users'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error updating user: {str(e)}', 'danger')
@@ -90,15 +120,16 @@ def delete_user(user_id):
 def system_status():
     """Display system status and health information."""
     try:
-        # Get system statistics
-        stats = {
-            'total_users': User.query.count(),
-            'active_users': User.query.filter_by(is_active=True).count(),
-            'admin_users': User.query.filter_by(is_admin=True).count(),
-            'subscribed_users': User.query.filter_by(subscription_status='active').count(),
-        }
+        # Cached briefly so repeated refreshes don't rerun the aggregate queries
+        stats = cache.get(SYSTEM_STATS_CACHE_KEY)
+        record_cache_lookup('admin_system_stats', stats is not None)
+        if stats is None:
+            stats = system_stats(window_hours=current_app.config.get('ADMIN_STATS_WINDOW_HOURS', 24))
+            cache.set(SYSTEM_STATS_CACHE_KEY, stats,
+                      timeout=current_app.config.get('ADMIN_STATS_CACHE_SECONDS', 30))
         
-        return render_template('admin/system.html', stats=stats)
+        # Live per-process pool state; not cached
+        return render_template('admin/system.html', stats=stats, pool=pool_monitor.snapshot())
     except Exception as e:
         flash(f'Error retrieving system status: {str(e)}', 'danger')
         return redirect(url_for('admin.index'))
@@ -110,4 +141,49 @@ def view_logs():
     """Display system logs."""
     # This would typically read from a log file or database
     # For now, we'll just show a placeholder
-    return render_template('admin/logs.html') 
\ No newline at end of file
+    return render_template('admin/logs.html')
+
+@admin_bp.route('/admin/profiles')
+@login_required
+@admin_required
+def profiles():
+    """List the slowest profiled requests per endpoint."""
+    return render_template('admin/profiles.html',
+                           enabled=profiler.enabled,
+                           groups=profiler.summaries(),
+                           header=current_app.config.get('PROFILING_HEADER', 'X-Profile'),
+                           sample_rate=current_app.config.get('PROFILING_SAMPLE_RATE', 0.0))
+
+@admin_bp.route('/admin/profiles/<profile_id>')
+@login_required
+@admin_required
+def profile_detail(profile_id):
+    """Display one request profile: functions, SQL and flame graph."""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        flash('Profile not found; it may have been replaced by a slower one.', 'warning')
+        return redirect(url_for('admin.profiles'))
+    flame = build_flame_tree(profile['collapsed']) if profile.get('collapsed') else None
+    return render_template('admin/profile_detail.html', profile=profile, flame=flame)
+
+@admin_bp.route('/admin/profiles/<profile_id>/collapsed.txt')
+@login_required
+@admin_required
+def profile_collapsed(profile_id):
+    """Download the stack samples in collapsed format (flamegraph.pl, speedscope)."""
+    profile = profiler.get(profile_id)
+    if profile is None or not profile.get('collapsed'):
+        return 'No stack samples for this profile.', 404
+    body = '\n'.join(f"{stack} {count}" for stack, count in profile['collapsed']) + '\n'
+    return current_app.response_class(body, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile_id}.txt'
+    })
+
+@admin_bp.route('/admin/profiles/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_profiles():
+    """Discard all kept profiles."""
+    profiler.clear()
+    flash('Request profiles cleared.', 'success')
+    return redirect(url_for('admin.profiles'))
@@ -9,6 +9,9 @@ from urllib.parse import urlparse
 from blueprints import auth_bp
 from forms import LoginForm, RegistrationForm
 from models import User, db
+from utils.passwords import PasswordHasherBusy
+from utils.rate_limit import client_ip, login_ip_limiter, login_username_limiter
+import math
 from datetime import datetime
 from sqlalchemy import func
 
@@ -33,59 +36,33 @@ def login():
         username_lower = form.username.data.lower()
         current_app.logger.debug('Attempting login with username (converted to lowercase): %s', username_lower)
         
+        # Throttle before any database lookup or hash verification
+        ip = client_ip()
+        retry_after = login_ip_limiter.retry_after(ip) or login_username_limiter.retry_after(username_lower)
+        if retry_after:
+            current_app.logger.info('Login throttled for %s from %s', username_lower, ip)
+            flash(f'Too many login attempts. Please try again in {math.ceil(retry_after / 60)} minute(s).', 'danger')
+            return render_template('login.html', title='Sign In', form=form), 429, {'Retry-After': str(retry_after)}
+        login_ip_limiter.hit(ip)
+        
         # Try to find the user with case-insensitive search
         user = User.query.filter(func.lower(User.username) == username_lower).first()
         
         if user is None:
             current_app.logger.debug('Login failed: User not found')
+            login_username_limiter.hit(username_lower)
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
             
-        if not user.check_password(form.password.data):
+        try:
+            password_ok = user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return redirect(url_for('auth.login'))
+        
+        if not password_ok:
             current_app.logger.debug('Login failed: Incorrect password for user: %s', user.username)
-            
-            # Add detailed debugging for password validation
-            current_app.logger.debug('Password debug info:')
-            current_app.logger.debug('- Input password length: %s', len(form.password.data))
-            current_app.logger.debug('- First/last chars: %s...%s', 
-                                 form.password.data[:1] if form.password.data else '', 
-                                 form.password.data[-1:] if form.password.data else '')
-            
-            # Check if there are any non-ascii characters
-            has_non_ascii = any(ord(c) > 127 for c in form.password.data)
-            current_app.logger.debug('- Contains non-ASCII chars: %s', has_non_ascii)
-            
-            # Check for leading/trailing whitespace
-            has_leading_whitespace = form.password.data.startswith(' ')
-            has_trailing_whitespace = form.password.data.endswith(' ')
-            current_app.logger.debug('- Has leading/trailing whitespace: %s/%s', 
-                                 has_leading_whitespace, has_trailing_whitespace)
-            
-            # Get password hash info (safely)
-            if user.password_hash:
-                hash_len = len(user.password_hash)
-                hash_start = user.password_hash[:10] if hash_len > 10 else ''
-                current_app.logger.debug('- Stored hash length: %s, starts with: %s...', 
-                                     hash_len, hash_start)
-                
-                # TEMPORARY TESTING CODE - Only for debugging
-                if current_app.config.get('DEBUG', False) and form.password.data == 'debug_master_override':
-                    current_app.logger.warning('Using debug override - REMOVE THIS IN PRODUCTION')
-                    
-                    # Simulate a successful login for debugging
-                    try:
-                        login_success = login_user(user)
-                        current_app.logger.debug('Debug override login result: %s', login_success)
-                        if login_success:
-                            user.last_login = datetime.utcnow()
-                            db.session.commit()
-                            flash('Login successful (DEBUG MODE)!', 'success')
-                            return redirect(url_for('main.index'))
-                    except Exception as e:
-                        current_app.logger.error('Error in debug login: %s', str(e))
-            else:
-                current_app.logger.debug('- No password hash stored!')
-                
+            login_username_limiter.hit(username_lower)
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
         
@@ -106,14 +83,6 @@ def login():
         current_app.logger.debug('User attempting login: ID=%s, Username=%s, Active=%s', 
                              user.id, user.username, user.is_active)
         
-        # Make sure Flask-Login's session management is using the right cookie name
-        # These should match config settings
-        current_app.logger.debug('Session cookie name: %s', current_app.config.get('SESSION_COOKIE_NAME'))
-        current_app.logger.debug('Remember cookie name: %s', current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
-        
-        # Try to get the secret key - don't log the actual key, just check if it exists
-        current_app.logger.debug('Secret key exists: %s', bool(current_app.config.get('SECRET_KEY')))
-        
         # Make sure the session is ready for login
         session.permanent = True
         
@@ -122,16 +91,24 @@ def login():
             login_success = login_user(user, remember=form.remember_me.data)
             current_app.logger.debug('login_user() result: %s', login_success)
             
-            # Check for flask_login messages in session
-            current_app.logger.debug('Session after login: %s', dict(session))
-            
             if not login_success:
                 current_app.logger.error('Login user failed despite valid credentials')
                 flash('Login failed. Please try again.', 'danger')
                 return redirect(url_for('auth.login'))
             
-            # Update last login time
+            login_username_limiter.reset(username_lower)
+            
+            # Update last login time, and replace a hash made with old PASSWORD_HASH_METHOD parameters
             user.last_login = datetime.utcnow()
+            try:
+                if user.password_needs_rehash():
+                    user.set_password(form.password.data)
+                    current_app.logger.info('Rehashed password of user %s', user.id)
+            except PasswordHasherBusy:
+                pass  # Done at a later login
+            except Exception as e:
+                # Never fail a login over the rehash; the old hash still works
+                current_app.logger.error('Could not rehash password of user %s: %s', user.id, str(e))
             db.session.commit()
             
             # Explicitly check if user was added to session by Flask-Login
@@ -139,10 +116,6 @@ def login():
                 current_app.logger.debug('User ID in session: %s', session.get('_user_id'))
             else:
                 current_app.logger.error('Flask-Login did not add _user_id to session')
-                
-            # Force Flask-Login to set cookies correctly
-            if hasattr(current_app, 'login_manager'):
-                current_app.logger.debug('Login manager exists')
             
             current_app.logger.debug('Current authentication status: %s', current_user.is_authenticated)
         except Exception as e:
@@ -205,20 +178,14 @@ def register():
         current_app.logger.debug('Registering new user with username: %s, email: %s', 
                              form.username.data, form.email.data)
         
-        # Log password details (safely)
-        current_app.logger.debug('Password info:')
-        current_app.logger.debug('- Length: %d', len(form.password.data))
-        current_app.logger.debug('- First/last chars: %s...%s', 
-                             form.password.data[:1] if form.password.data else '',
-                             form.password.data[-1:] if form.password.data else '')
-        current_app.logger.debug('- Contains non-ASCII: %s', 
-                             any(ord(c) > 127 for c in form.password.data))
-        current_app.logger.debug('- Has whitespace: %s', 
-                             any(c.isspace() for c in form.password.data))
-        
         # Create user with preserved username display but normalized internal representation
         user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            # The user was not added to the session; nothing to roll back
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('register.html', title='Register', form=form)
         
         try:
             db.session.add(user)
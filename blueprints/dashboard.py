@@ -7,6 +7,7 @@ from flask import render_template, redirect, url_for, flash, request, jsonify, s
 from flask_login import login_required, current_user
 from blueprints import dashboard_bp
 from models import User, db
+from extensions import cache
 from services.canvas_api import CanvasAPI
 from services.todoist_api import TodoistClient
 from utils.api import get_api_clients
@@ -47,7 +48,6 @@ def index():
             # Canvas data
             current_app.logger.debug('Fetching Canvas courses')
             canvas_data = canvas_client.get_courses()
-            current_app.logger.debug(f'Canvas raw data type: {type(canvas_data)}')
             
             # Process Canvas data to ensure we have consistent structure
             courses = []
@@ -64,8 +64,6 @@ def index():
                 }
                 courses.append(course_obj)
             
-            current_app.logger.debug(f'Processed courses: {courses[:2]}')  # Log first 2 courses only
-            
             # Todoist data
             current_app.logger.debug('Fetching Todoist projects')
             todoist_projects = todoist_client.get_projects()
@@ -82,8 +80,6 @@ def index():
                 }
                 projects.append(project_obj)
                 
-            current_app.logger.debug(f'Processed projects: {projects[:2]}')  # Log first 2 projects only
-            
             # Get tasks
             tasks = todoist_client.get_tasks()
             
@@ -128,6 +124,7 @@ def api_credentials():
         
         try:
             db.session.commit()
+            cache.delete(f"sync_choices_{current_user.id}")
             flash('API credentials saved successfully', 'success')
             return redirect(url_for('dashboard.index'))
         except Exception as e:
@@ -180,26 +177,15 @@ def sync_assignments(csrf_token=None):
     import datetime
     from models import SyncHistory, db
     
-    current_app.logger.debug(f"Request method: {request.method}, path: {request.path}")
-    current_app.logger.debug(f"Headers: {request.headers}")
-    current_app.logger.debug(f"CSRF Token in URL: {csrf_token}")
-    current_app.logger.debug(f"Session: {session}")
-    
     # Return a simple response immediately just to test if the route is accessible
     try:
-        # Basic info about the request
-        current_app.logger.debug("--- SYNC DEBUG START ---")
-        request_body = request.get_data(as_text=True)
-        current_app.logger.debug(f"Raw request body: {request_body}")
         form_data = request.form.to_dict()
-        current_app.logger.debug(f"Form data: {form_data}")
         json_data = None
         
         try:
             json_data = request.get_json(force=True, silent=True)
-            current_app.logger.debug(f"JSON data: {json_data}")
         except Exception as e:
-            current_app.logger.error(f"Error parsing JSON: {e}")
+            current_app.logger.error('Error parsing JSON: %s', e)
             
         # Return a simple test response to see if it gets back to the browser
         return jsonify({
@@ -207,15 +193,12 @@ def sync_assignments(csrf_token=None):
             'message': 'Debug response - route is reachable',
             'received_data': {
                 'json': json_data,
-                'form': form_data,
-                'raw': request_body[:100] if request_body else None  # First 100 chars only
+                'form': form_data
             }
         })
         
     except Exception as e:
-        current_app.logger.error(f"Error in debug response: {str(e)}")
-        import traceback
-        current_app.logger.error(traceback.format_exc())
+        current_app.logger.exception('Error in debug response: %s', e)
         return jsonify({
             'success': False,
             'error': f"Debug error: {str(e)}"
@@ -229,7 +212,6 @@ def sync_assignments(csrf_token=None):
 def refresh_data(csrf_token=None):
     """Refresh dashboard data."""
     from flask import current_app
-    current_app.logger.debug(f"Refresh data endpoint accessed with CSRF token: {csrf_token}")
     try:
         return jsonify({
             'success': True,
@@ -7,6 +7,7 @@ from flask import render_template, redirect, url_for, flash, request, jsonify, c
 from flask_login import login_required, current_user
 from blueprints import history_bp
 from models import SyncHistory, db
+import json
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc, text
 
@@ -27,7 +28,7 @@ def index():
             WHERE user_id = :user_id
             ORDER BY started_at DESC
             LIMIT 20
-        """)
+        """).columns(started_at=db.DateTime, completed_at=db.DateTime)
         result = db.session.execute(query, {'user_id': current_user.id})
         history = []
         
@@ -88,7 +89,7 @@ def index():
             WHERE user_id = :user_id AND status = 'success'
             ORDER BY completed_at DESC
             LIMIT 1
-        """)
+        """).columns(started_at=db.DateTime, completed_at=db.DateTime)
         last_sync_result = db.session.execute(last_sync_query, {'user_id': current_user.id})
         
         # Convert to dictionary if found
@@ -117,31 +118,32 @@ def index():
     chart_values = []
     
     try:
+        # One grouped query for the whole window instead of one COUNT per day
+        day_query = text("""
+            SELECT DATE(started_at) AS day, COUNT(*)
+            FROM sync_history
+            WHERE user_id = :user_id
+              AND started_at >= :day_start
+              AND started_at < :day_end
+            GROUP BY DATE(started_at)
+        """)
+        day_result = db.session.execute(
+            day_query,
+            {
+                'user_id': current_user.id,
+                'day_start': fourteen_days_ago,
+                'day_end': today + timedelta(days=1)
+            }
+        )
+        # DATE() returns a date on MySQL and an ISO string on SQLite
+        counts = {str(row[0]): int(row[1]) for row in day_result}
+        
         for i in range(14):
             day = fourteen_days_ago + timedelta(days=i)
-            next_day = day + timedelta(days=1)
-            
-            # Count syncs on this day using raw SQL
-            day_query = text("""
-                SELECT COUNT(*) 
-                FROM sync_history 
-                WHERE user_id = :user_id 
-                  AND started_at >= :day_start 
-                  AND started_at < :day_end
-            """)
-            day_result = db.session.execute(
-                day_query, 
-                {
-                    'user_id': current_user.id,
-                    'day_start': day,
-                    'day_end': next_day
-                }
-            )
-            count = day_result.scalar() or 0
             
             # Add to chart data (ensure all values are simple Python primitives)
             chart_labels.append(day.strftime('%m/%d'))
-            chart_values.append(int(count))  # Ensure count is a standard int, not a SQLAlchemy Integer
+            chart_values.append(counts.get(day.isoformat(), 0))
     except Exception as e:
         current_app.logger.error('Error building chart data: %s', str(e))
         # Provide empty chart data if there's an error
@@ -189,7 +191,8 @@ def detail(history_id):
     try:
         # Get the history item and ensure it belongs to the current user
         query = text("""
-            SELECT id, user_id, sync_type, status, items_synced, started_at, completed_at
+            SELECT id, user_id, sync_type, status, items_synced, started_at, completed_at,
+                   details, error_message
             FROM sync_history
             WHERE id = :history_id AND user_id = :user_id
             LIMIT 1
@@ -205,14 +208,25 @@ def detail(history_id):
                 'status': row[3],
                 'items_synced': row[4],
                 'started_at': row[5],
-                'completed_at': row[6]
+                'completed_at': row[6],
+                'error_message': row[8]
             }
             break
             
         if not history:
             return render_template('errors/404.html'), 404
-            
-        return render_template('history_detail.html', history=history)
+        
+        # Details are stored as JSON; older rows may have none or invalid JSON
+        try:
+            details = json.loads(row[7]) if row[7] else {}
+        except (TypeError, ValueError):
+            details = {}
+        history['details'] = details
+        
+        return render_template('history_detail.html',
+                              history=history,
+                              details=details,
+                              timings=details.get('timings'))
     except Exception as e:
         current_app.logger.error('Error getting history detail: %s', str(e))
         flash('Error retrieving history details.', 'danger')
@@ -0,0 +1,29 @@
+"""
+Metrics blueprint.
+Exposes the process metrics registry in the Prometheus text format.
+"""
+
+import hmac
+from flask import Response, request, current_app, abort
+from blueprints import metrics_bp
+from utils.metrics import metrics
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+def _scrape_allowed():
+    """Require METRICS_TOKEN as a bearer token if set, otherwise only allow local scrapes."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied, f"Bearer {token}")
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+@metrics_bp.route('/metrics')
+def index():
+    """Render all metrics, merged across worker processes when METRICS_DIR is set."""
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    if not _scrape_allowed():
+        abort(403)
+
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
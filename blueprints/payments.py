@@ -3,11 +3,14 @@ Payments blueprint.
 Handles subscription and payment processing.
 """
 
+import json
 from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from blueprints import payments_bp
-from models import User, db, Subscription
-import stripe
+from sqlalchemy.exc import IntegrityError
+from models import db, Subscription, StripeEvent
+from services.stripe_api import get_stripe
+from utils.metrics import STRIPE_EVENTS
 from datetime import datetime, timedelta
 
 @payments_bp.route('/pricing')
@@ -33,14 +36,11 @@ def pricing():
 def create_checkout_session():
     """Create a Stripe checkout session for subscription."""
     try:
-        # Use Stripe API initialized in app.py
         price_id = request.form.get('price_id')
         if not price_id:
             return jsonify({'error': 'Price ID is required'}), 400
         
-        # Initialize Stripe if not already done
-        stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
-        
+        stripe = get_stripe()
         checkout_session = stripe.checkout.Session.create(
             payment_method_types=['card'],
             line_items=[{
@@ -75,74 +75,60 @@ def cancel():
 
 @payments_bp.route('/webhook', methods=['POST'])
 def webhook():
-    """Handle Stripe webhook events."""
-    payload = request.get_data()
+    """
+    Receive Stripe webhook events.
+    
+    Events are verified and stored, then acknowledged right away; the
+    account changes they cause are applied by services/stripe_events.py.
+    A repeated event id (Stripe retries) is acknowledged without storing it
+    again.
+    """
+    payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
-    stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
     webhook_secret = current_app.config.get('STRIPE_WEBHOOK_SECRET')
+    if not webhook_secret:
+        current_app.logger.error('Rejecting Stripe webhook: STRIPE_WEBHOOK_SECRET is not set')
+        return jsonify({'error': 'Webhook not configured'}), 500
     
+    stripe = get_stripe()
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, webhook_secret
-        )
-    except ValueError as e:
-        current_app.logger.error(f"Invalid payload in webhook: {str(e)}")
-        return jsonify({'error': 'Invalid payload'}), 400
+        # Verify only; building a stripe.Event is unnecessary for storing the payload
+        stripe.WebhookSignature.verify_header(payload, sig_header, webhook_secret,
+                                              stripe.Webhook.DEFAULT_TOLERANCE)
+        event = json.loads(payload)
+        stripe_event = StripeEvent.from_payload(event, payload)
     except stripe.error.SignatureVerificationError as e:
-        current_app.logger.error(f"Invalid signature in webhook: {str(e)}")
+        current_app.logger.error('Invalid signature in webhook: %s', e)
         return jsonify({'error': 'Invalid signature'}), 400
+    except (ValueError, KeyError, TypeError) as e:
+        current_app.logger.error('Invalid payload in webhook: %s', e)
+        return jsonify({'error': 'Invalid payload'}), 400
     
-    # Handle the event based on type
-    event_type = event['type']
-    current_app.logger.info(f"Processing webhook event: {event_type}")
-    
-    if event_type == 'checkout.session.completed':
-        session = event['data']['object']
-        
-        # Verify session has required fields before accessing
-        if 'client_reference_id' in session and session['client_reference_id']:
-            user_id = session['client_reference_id']
-            user = User.query.get(user_id)
-            
-            if user:
-                # Update user subscription status
-                user.subscription_status = 'active'
-                
-                # Store Stripe identifiers for future reference
-                if 'customer' in session:
-                    user.stripe_customer_id = session['customer']
-                if 'subscription' in session:
-                    user.stripe_subscription_id = session['subscription']
-                
-                db.session.commit()
-                current_app.logger.info(f"User {user_id} subscription activated")
-    
-    elif event_type == 'customer.subscription.deleted':
-        subscription_obj = event['data']['object']
-        
-        # Find user by subscription ID
-        if 'id' in subscription_obj:
-            user = User.query.filter_by(stripe_subscription_id=subscription_obj['id']).first()
-            
-            if user:
-                user.subscription_status = 'inactive'
-                db.session.commit()
-                current_app.logger.info(f"User {user.id} subscription deactivated")
+    db.session.add(stripe_event)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Unique stripe_event_id: this is a retry of an event already stored
+        db.session.rollback()
+        STRIPE_EVENTS.inc(outcome='duplicate')
+        current_app.logger.info('Duplicate Stripe event %s ignored', event['id'])
+        return jsonify({'status': 'duplicate'})
     
-    return jsonify({'status': 'success'})
+    STRIPE_EVENTS.inc(outcome='received')
+    current_app.logger.info('Stored Stripe event %s (%s)', event['id'], stripe_event.event_type)
+    return jsonify({'status': 'received'})
 
 @payments_bp.route('/manage-subscription')
 @login_required
 def manage_subscription():
     """Redirect user to Stripe Customer Portal to manage their subscription."""
     try:
-        stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
-        
         if not current_user.stripe_customer_id:
             flash('You do not have an active subscription to manage.', 'warning')
             return redirect(url_for('payments.pricing'))
         
         # Create a Stripe portal session
+        stripe = get_stripe()
         session = stripe.billing_portal.Session.create(
             customer=current_user.stripe_customer_id,
             return_url=url_for('payments.subscription', _external=True)
@@ -159,14 +145,8 @@ def manage_subscription():
 @login_required
 def subscription():
     """Display user subscription details."""
-    # Get subscription data from Stripe if available
-    subscription = None
-    if current_user.stripe_subscription_id:
-        try:
-            stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
-            subscription = stripe.Subscription.retrieve(current_user.stripe_subscription_id)
-        except Exception as e:
-            current_app.logger.error(f"Error retrieving subscription: {str(e)}")
+    # Local copy kept current by webhook events and the reconciliation sweep
+    subscription = Subscription.current_for(current_user)
     
     # Define trial days for display
     trial_days = current_app.config.get('TRIAL_DAYS', 14)
@@ -6,9 +6,11 @@ Handles user settings and preferences management.
 from flask import render_template, redirect, url_for, flash, request, current_app, session
 from flask_login import login_required, current_user
 from blueprints import settings_bp
-from models import User, db
+from models import User, db, CourseMapping, SyncSettings
+from extensions import cache
 from forms import UserSettingsForm, APICredentialsForm, SyncSettingsForm, AccountUpdateForm, PasswordChangeForm
-from utils.api import get_api_clients
+from utils.api import get_api_clients, get_sync_choices
+from utils.passwords import PasswordHasherBusy
 
 @settings_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -18,9 +20,12 @@ def index():
     form = UserSettingsForm(obj=current_user)
     api_form = APICredentialsForm(obj=current_user)
     
-    # For the sync form, we would typically load actual values from the database
-    # For now, just create an empty form
-    sync_form = SyncSettingsForm()
+    # Sync form course/project choices come from the (cached) Canvas and Todoist APIs
+    sync_settings = SyncSettings.query.filter_by(user_id=current_user.id).first()
+    sync_form = SyncSettingsForm(obj=sync_settings)
+    sync_form.canvas_courses.choices, sync_form.todoist_project.choices = get_sync_choices(current_user)
+    course_mappings = CourseMapping.query.filter_by(user_id=current_user.id)\
+        .order_by(CourseMapping.course_name).all()
     
     # Initialize the account form with the current user's data
     account_form = AccountUpdateForm(
@@ -63,6 +68,7 @@ def index():
             
             # Save to database
             db.session.commit()
+            cache.delete(f"sync_choices_{current_user.id}")
             current_app.logger.debug('API credentials saved successfully')
             flash('API credentials saved successfully', 'success')
             
@@ -87,6 +93,9 @@ def index():
             db.session.commit()
             flash('Settings updated successfully', 'success')
             return redirect(url_for('settings.index'))
+        except PasswordHasherBusy:
+            db.session.rollback()
+            flash('The server is busy. Please try again in a moment.', 'warning')
         except Exception as e:
             db.session.rollback()
             current_app.logger.error('Error updating settings: %s', str(e))
@@ -121,6 +130,9 @@ def index():
             db.session.commit()
             flash('Password updated successfully', 'success')
             return redirect(url_for('settings.index'))
+        except PasswordHasherBusy:
+            db.session.rollback()
+            flash('The server is busy. Please try again in a moment.', 'warning')
         except Exception as e:
             db.session.rollback()
             current_app.logger.error('Error changing password: %s', str(e))
@@ -134,6 +146,7 @@ def index():
                           form=form,
                           api_form=api_form,
                           sync_form=sync_form,
+                          course_mappings=course_mappings,
                           account_form=account_form,
                           password_form=password_form,
                           trial_days=trial_days,
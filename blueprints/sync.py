@@ -6,11 +6,11 @@ Handles synchronization between Canvas and Todoist.
 from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from blueprints import sync_bp
-from models import User, db, SyncSettings, SyncHistory
+from models import User, db, SyncSettings, SyncHistory, CourseMapping
 from services.canvas_api import CanvasAPI
 from services.todoist_api import TodoistClient
 from services.sync_service import SyncService
-from utils.api import get_api_clients
+from utils.api import get_api_clients, get_sync_choices
 from datetime import datetime
 
 @sync_bp.route('/sync', methods=['GET', 'POST'])
@@ -115,10 +115,14 @@ def force_sync():
 @sync_bp.route('/update_sync_settings', methods=['POST'])
 @login_required
 def update_sync_settings():
-    """Update user sync settings."""
+    """Update user sync settings and the selected course-to-project mapping."""
     from forms import SyncSettingsForm
     
     form = SyncSettingsForm()
+    course_choices, project_choices = get_sync_choices(current_user)
+    form.canvas_courses.choices = course_choices
+    form.todoist_project.choices = project_choices
+    
     if form.validate_on_submit():
         try:
             # Get or create sync settings for user
@@ -128,7 +132,14 @@ def update_sync_settings():
                 db.session.add(sync_settings)
             
             # Update settings from form
-            sync_settings.sync_frequency = form.frequency.data
+            sync_settings.enabled = form.enabled.data
+            sync_settings.frequency = form.frequency.data
+            
+            # First automatic run happens right away, then every interval
+            if sync_settings.enabled and sync_settings.last_sync is None:
+                sync_settings.next_run_at = datetime.utcnow()
+            else:
+                sync_settings.schedule_next_run()
             
             # Handle enabled state
             if form.enabled.data:
@@ -136,6 +147,25 @@ def update_sync_settings():
             else:
                 current_user.sync_preferences = 'manual'
             
+            # Persist the course-to-project mapping if both sides were selected
+            course_id = form.canvas_courses.data
+            project_id = form.todoist_project.data
+            if course_id and project_id:
+                mapping = CourseMapping.query.filter_by(user_id=current_user.id,
+                                                        course_id=course_id).first()
+                if not mapping:
+                    mapping = CourseMapping(user_id=current_user.id, course_id=course_id)
+                    db.session.add(mapping)
+                
+                mapping.course_name = dict(course_choices).get(course_id)
+                mapping.project_id = project_id
+                mapping.project_name = dict(project_choices).get(project_id)
+                mapping.due_date_buffer = int(form.due_date_buffer.data or 0)
+                mapping.skip_submitted = form.skip_submitted.data
+                mapping.is_active = True
+            elif course_id or project_id:
+                flash('Select both a Canvas course and a Todoist project to add a course mapping', 'warning')
+            
             # Save changes
             db.session.commit()
             flash('Sync settings updated successfully', 'success')
@@ -147,4 +177,37 @@ def update_sync_settings():
             for error in errors:
                 flash(f"{getattr(form, field).label.text}: {error}", 'danger')
     
-    return redirect(url_for('settings.index')) 
\ No newline at end of file
+    return redirect(url_for('settings.index'))
+
+@sync_bp.route('/mappings/<int:mapping_id>/toggle', methods=['POST'])
+@login_required
+def toggle_course_mapping(mapping_id):
+    """Pause or resume automatic sync for a course mapping."""
+    mapping = CourseMapping.query.filter_by(id=mapping_id, user_id=current_user.id).first_or_404()
+    
+    try:
+        mapping.is_active = not mapping.is_active
+        db.session.commit()
+        state = 'resumed' if mapping.is_active else 'paused'
+        flash(f'Sync for {mapping.course_name or mapping.course_id} {state}', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating course mapping: {str(e)}', 'danger')
+    
+    return redirect(url_for('settings.index'))
+
+@sync_bp.route('/mappings/<int:mapping_id>/delete', methods=['POST'])
+@login_required
+def delete_course_mapping(mapping_id):
+    """Remove a course mapping."""
+    mapping = CourseMapping.query.filter_by(id=mapping_id, user_id=current_user.id).first_or_404()
+    
+    try:
+        db.session.delete(mapping)
+        db.session.commit()
+        flash('Course mapping removed', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error removing course mapping: {str(e)}', 'danger')
+    
+    return redirect(url_for('settings.index'))
@@ -17,13 +17,101 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///canvas_todoist.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Logging configuration (see utils/logging_config.py)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_LEVELS = {  # Per-module overrides
+        'sqlalchemy.engine': 'WARNING',
+        'utils.db.InstrumentedQueuePool': 'WARNING',  # SQLAlchemy's per-checkout pool logging
+        'apscheduler': 'WARNING',
+        'urllib3': 'WARNING',
+    }
+    LOG_FILE = 'logs/canvas_todoist.log'
+    LOG_MAX_BYTES = 1048576
+    LOG_BACKUP_COUNT = 10
+    LOG_STREAM_LEVEL = 'WARNING'  # stderr handler level; None disables it
+    LOG_SAMPLE_MAX_PER_WINDOW = 10  # Debug records allowed per call site per window
+    LOG_SAMPLE_WINDOW_SECONDS = 60
+    LOG_REQUEST_DETAILS = False  # Per-request method/path/user debug line
+    
     # Flask-Caching configuration
     CACHE_TYPE = 'SimpleCache'
     CACHE_DEFAULT_TIMEOUT = 300
     
+    # Password hashing (see utils/passwords.py); hashes with other parameters are replaced at login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))  # Processes per worker; 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING = 4  # Hashes queued or running per process
+    PASSWORD_HASH_QUEUE_TIMEOUT = 5  # Seconds to wait for a slot before the login is refused
+    
+    # Login throttling (see utils/rate_limit.py): (attempts, window seconds); None disables
+    LOGIN_RATE_LIMIT_PER_IP = (30, 300)  # Every attempt from one address
+    LOGIN_RATE_LIMIT_PER_USERNAME = (5, 300)  # Failed attempts for one username
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'local'  # 'local' per process, 'shared' via CACHE_TYPE
+    RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER')  # e.g. X-Real-IP behind a trusted proxy
+    
+    # Logged-in user's non-sensitive columns cached across requests (services/user_loader.py); 0 disables.
+    # Access rights (is_admin, plan and subscription columns) are still read on every request. With
+    # 'local' and several workers, other workers may show an old profile for up to USER_CACHE_SECONDS.
+    USER_CACHE_SECONDS = int(os.environ.get('USER_CACHE_SECONDS', 60))
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND') or 'local'  # 'local' per process, 'shared' via CACHE_TYPE
+    
     # Flask-APScheduler configuration
     SCHEDULER_API_ENABLED = False
     
+    # Automatic sync scheduler
+    SCHEDULER_BATCH_SIZE = int(os.environ.get('SCHEDULER_BATCH_SIZE', 50))  # Rows claimed per query
+    SCHEDULER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS', 900))  # Retry delay if a run dies
+    SCHEDULER_SYNC_WORKERS = int(os.environ.get('SCHEDULER_SYNC_WORKERS', 4))  # Users synced in parallel
+    
+    # Buffered scheduler results (see services/history_writer.py)
+    HISTORY_WRITER_MAX_ROWS = 200  # Flush once this many records are pending
+    HISTORY_WRITER_FLUSH_SECONDS = 5  # ...or after this long
+    HISTORY_WRITER_MAX_PENDING = 10000  # History rows kept for retry while the database is unavailable
+    
+    # Database connection pool (see utils/db.py); each process type sizes its pool to its concurrency
+    DB_POOL_PROFILE = os.environ.get('DB_POOL_PROFILE') or 'web'
+    DB_POOL_PROFILES = {
+        # WSGI worker: one request at a time plus the scheduler jobs that may run alongside it
+        'web': {'pool_size': 2, 'max_overflow': 3, 'pool_timeout': 10},
+        # Scheduler or `flask process-stripe-events --loop` process: concurrent jobs, longer waits are fine
+        'sync': {'pool_size': 5, 'max_overflow': 5, 'pool_timeout': 30},
+    }
+    DB_CONNECTION_HOLD_WARN_SECONDS = 2.0  # Log transactions holding a connection longer than this
+    
+    # Metrics (see utils/metrics.py); METRICS_DIR enables the multi-process mode
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR')  # Shared directory for per-process snapshots
+    METRICS_FLUSH_SECONDS = 5  # Minimum interval between snapshot writes per process
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for /metrics; unset allows localhost only
+    
+    # SQL query counter (see utils/query_counter.py)
+    QUERY_COUNTER_ENABLED = os.environ.get('QUERY_COUNTER_ENABLED', 'True').lower() == 'true'
+    QUERY_N_PLUS_ONE_THRESHOLD = 5  # Identical statement shapes per request logged as a likely N+1
+    QUERY_BUDGET_DEFAULT = None  # Budget for endpoints missing from QUERY_BUDGETS; None means unlimited
+    QUERY_BUDGETS = {  # Maximum SQL statements per request, by endpoint
+        'history.index': 10,
+        'history.detail': 4,
+        'dashboard.index': 6,
+        'settings.index': 6,
+        'admin.index': 6,
+        'admin.users': 6,
+        'admin.system_status': 6,
+        'admin.profiles': 4,
+    }
+    QUERY_BUDGET_RAISE = False  # Raise QueryBudgetExceeded instead of logging (for tests)
+    
+    # Request profiler (see utils/profiling.py); off unless PROFILING_ENABLED is set
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.0))  # Share of requests profiled
+    PROFILING_HEADER = 'X-Profile'  # Profiles the request when sent by an admin
+    PROFILING_MODE = os.environ.get('PROFILING_MODE') or 'cprofile'  # 'cprofile' or 'sample' (flame graph)
+    PROFILING_SAMPLE_INTERVAL_MS = 5  # Stack sampling interval in 'sample' mode
+    PROFILING_DIR = os.environ.get('PROFILING_DIR')  # Shared directory so all workers' profiles are listed
+    PROFILING_KEEP_PER_ENDPOINT = 5  # Slowest profiles kept per endpoint
+    PROFILING_TOP_FUNCTIONS = 40
+    PROFILING_TOP_QUERIES = 15
+    PROFILING_EXCLUDE_PATHS = ('/static/', '/metrics', '/admin/admin/profiles')
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_NAME = 'session'  # Use standard Flask session cookie name
@@ -41,9 +129,25 @@ class Config:
     STRIPE_MONTHLY_PRICE_ID = os.environ.get('STRIPE_MONTHLY_PRICE_ID')
     STRIPE_YEARLY_PRICE_ID = os.environ.get('STRIPE_YEARLY_PRICE_ID')
     
+    # Stripe webhook events are stored by the webhook and applied by services/stripe_events.py
+    STRIPE_EVENT_POLL_SECONDS = int(os.environ.get('STRIPE_EVENT_POLL_SECONDS', 10))  # Scheduler interval
+    STRIPE_EVENT_BATCH_SIZE = 100  # Events claimed per query
+    STRIPE_EVENT_LEASE_SECONDS = 300  # Retry delay if a consumer dies mid-batch
+    STRIPE_EVENT_MAX_ATTEMPTS = 8  # Failed attempts before an event is marked failed
+    STRIPE_EVENT_RETRY_BASE_SECONDS = 30  # Backoff doubles after each failure...
+    STRIPE_EVENT_RETRY_MAX_SECONDS = 3600  # ...up to this
+    STRIPE_EVENT_RETENTION_DAYS = 30  # Applied events kept for duplicate detection; None keeps them forever
+    SUBSCRIPTION_RECONCILE_HOURS = int(os.environ.get('SUBSCRIPTION_RECONCILE_HOURS', 6))  # Full sweep of Stripe subscriptions
+    PREMIUM_GRACE_HOURS = 48  # Premium access kept past the paid period while a renewal is confirmed
+    
     # Domain configuration
     DOMAIN = os.environ.get('DOMAIN') or 'localhost:5000'
     
+    # Admin pages
+    ADMIN_USERS_PER_PAGE = 50
+    ADMIN_STATS_WINDOW_HOURS = 24  # Look-back window for sync throughput metrics
+    ADMIN_STATS_CACHE_SECONDS = 30
+    
     # Subscription pricing
     MONTHLY_PRICE = 9.99
     YEARLY_PRICE = 99.99
@@ -52,20 +156,27 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
-    SQLALCHEMY_ECHO = True
+    # SQL echo logs every statement synchronously; opt in when needed
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO', 'False').lower() == 'true'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'DEBUG'
+    LOG_STREAM_LEVEL = 'DEBUG'
+    LOG_REQUEST_DETAILS = True
     # Don't override session security settings here
     
 class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # A file or server database lets several worker processes share state (tools/load_test.py)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    LOGIN_RATE_LIMIT_PER_IP = None  # tools/load_test.py logs every virtual user in from one address
     # Don't override session security settings here
     
 class ProductionConfig(Config):
     """Production configuration."""
     DEBUG = False
     SQLALCHEMY_ECHO = False
+    LOG_REQUEST_DETAILS = False
     # Use more sophisticated caching if Redis is available
     CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'simple'
     # Additional cache config
@@ -75,12 +186,11 @@ class PythonAnywhereConfig(Config):
     """PythonAnywhere-specific production configuration."""
     DEBUG = False
     SQLALCHEMY_ECHO = False
+    LOG_REQUEST_DETAILS = False
+    # Pool size, overflow and timeout come from DB_POOL_PROFILES
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_recycle': 240,  # Less than PythonAnywhere's 300s timeout
         'pool_pre_ping': True,  # Test connections before using them
-        'pool_timeout': 30,    # Don't wait too long for connections
-        'pool_size': 10,       # Default pool size
-        'max_overflow': 5      # Allow some extra connections
     }
     # Use FileSystemCache for better performance than SimpleCache without Redis
     CACHE_TYPE = 'FileSystemCache'
@@ -95,6 +205,9 @@ class PythonAnywhereConfig(Config):
     
     # Use smaller VARCHAR lengths for MySQL compatibility with specific charsets
     MYSQL_INDEXES_MAX_LENGTH = 191  # For utf8mb4 compatibility
+    
+    # remote_addr is PythonAnywhere's front-end proxy; it passes the client address in X-Real-IP
+    RATE_LIMIT_IP_HEADER = os.environ.get('RATE_LIMIT_IP_HEADER') or 'X-Real-IP'
 
 # Configuration dictionary for easy access
 config = {
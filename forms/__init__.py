@@ -5,7 +5,7 @@ Contains all form classes for the application.
 
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SelectField, TextAreaField, SubmitField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
+from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError, Optional
 from models import User
 
 class LoginForm(FlaskForm):
@@ -97,8 +97,11 @@ class SyncSettingsForm(FlaskForm):
                                ('daily', 'Daily'),
                                ('weekly', 'Weekly')
                            ])
-    canvas_courses = SelectField('Canvas Course', validators=[DataRequired()])
-    todoist_project = SelectField('Todoist Project', validators=[DataRequired()])
+    # Course/project choices are populated per user from the Canvas and Todoist APIs.
+    # Both are optional so the sync toggle and frequency can be saved on their own.
+    canvas_courses = SelectField('Canvas Course', validators=[Optional()])
+    todoist_project = SelectField('Todoist Project', validators=[Optional()])
     due_date_buffer = SelectField('Due Date Buffer (Days)',
                                 choices=[('0', '0'), ('1', '1'), ('2', '2'), ('3', '3'), ('5', '5'), ('7', '7')])
+    skip_submitted = BooleanField('Skip submitted assignments', default=True)
     submit = SubmitField('Save Settings') 
\ No newline at end of file
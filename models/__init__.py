@@ -3,18 +3,26 @@ Models package.
 Contains all database models for the application.
 """
 
-from datetime import datetime
+from collections import namedtuple
+from datetime import datetime, timedelta
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from extensions import db, login_manager
+from sqlalchemy import case, func, text
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import aliased, joinedload, load_only
+from extensions import db
 from utils.encryption import encrypt_data, decrypt_data
+from utils.passwords import password_hasher
+
+# User.plan_tier values
+FREE_TIER = 'free'
+PREMIUM_TIER = 'premium'
 
 class User(UserMixin, db.Model):
     """User model."""
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))  # scrypt hashes are about 160 characters
     is_admin = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -27,10 +35,14 @@ class User(UserMixin, db.Model):
     
     # Subscription
     subscription_status = db.Column(db.String(20), default='inactive')
-    stripe_customer_id = db.Column(db.String(64))
-    stripe_subscription_id = db.Column(db.String(64))
+    stripe_customer_id = db.Column(db.String(64), index=True)
+    stripe_subscription_id = db.Column(db.String(64), index=True)
     subscription_start = db.Column(db.DateTime)
     subscription_end = db.Column(db.DateTime)
+    # Entitlement precomputed from the subscription (services/subscriptions.py) so premium
+    # checks need neither Stripe nor the subscription table; premium_until NULL means no expiry
+    plan_tier = db.Column(db.String(20), default=FREE_TIER, nullable=False)
+    premium_until = db.Column(db.DateTime, index=True)
     
     # Sync Settings
     last_sync = db.Column(db.DateTime)
@@ -52,65 +64,32 @@ class User(UserMixin, db.Model):
         """Return the user ID as a string."""
         return str(self.id)
     
+    @hybrid_property
+    def is_premium(self):
+        """True while the user's plan tier is paid and has not expired."""
+        return self.plan_tier != FREE_TIER and (self.premium_until is None or self.premium_until > datetime.utcnow())
+    
+    @is_premium.expression
+    def is_premium(cls):
+        return db.and_(cls.plan_tier != FREE_TIER,
+                       db.or_(cls.premium_until.is_(None), cls.premium_until > datetime.utcnow()))
+    
+    def set_entitlement(self, tier, until=None):
+        """Grant `tier` until `until` (None: no expiry), or revoke premium with FREE_TIER."""
+        self.plan_tier = tier
+        self.premium_until = None if tier == FREE_TIER else until
+    
     def set_password(self, password):
-        """Set user password."""
-        from flask import current_app
-        if hasattr(current_app, 'logger'):
-            current_app.logger.debug('Setting password for user %s', self.username)
-            current_app.logger.debug('Password length: %d', len(password))
-            
-            # Check for problematic characters
-            non_ascii = any(ord(c) > 127 for c in password)
-            whitespace = any(c.isspace() for c in password)
-            current_app.logger.debug('Password contains non-ASCII: %s, whitespace: %s', 
-                                 non_ascii, whitespace)
-        
-        # Use default algorithm (scrypt) for consistency with existing accounts
-        self.password_hash = generate_password_hash(password)
-        
-        if hasattr(current_app, 'logger'):
-            current_app.logger.debug('Generated hash length: %d, starts with: %s...', 
-                                 len(self.password_hash), self.password_hash[:10])
+        """Set user password (hashed with PASSWORD_HASH_METHOD)."""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check user password."""
-        from flask import current_app
-        if hasattr(current_app, 'logger'):
-            current_app.logger.debug('Checking password for user %s', self.username)
-            current_app.logger.debug('Password length: %d', len(password))
-            current_app.logger.debug('Stored hash length: %d, starts with: %s...', 
-                                 len(self.password_hash) if self.password_hash else 0, 
-                                 self.password_hash[:10] if self.password_hash else '')
-        
-        # DEBUGGING: Try both ways of checking the password
-        normal_result = check_password_hash(self.password_hash, password)
-        
-        # This is for debugging only - never store or compare plaintext passwords in production
-        from flask import current_app
-        if hasattr(current_app, 'config') and current_app.config.get('DEBUG', False):
-            try:
-                from utils.encryption import encrypt_data, decrypt_data
-                # Try a workaround for debugging only
-                from werkzeug.security import generate_password_hash
-                test_hash = generate_password_hash(password)
-                current_app.logger.debug('Test hash for input: %s', test_hash[:10])
-                
-                # Store password temporarily for debugging - DELETE THIS AFTER FIXING THE ISSUE
-                if not hasattr(self, '_temp_pwd'):
-                    self._temp_pwd = encrypt_data(password)
-                    current_app.logger.debug('Storing temporary debug password reference')
-                    db.session.commit()
-                else:
-                    stored_pwd = decrypt_data(self._temp_pwd)
-                    match = stored_pwd == password
-                    current_app.logger.debug('Direct compare (TEMPORARY DEBUG ONLY): %s', match)
-            except Exception as e:
-                current_app.logger.error('Error in debug password check: %s', str(e))
-        
-        if hasattr(current_app, 'logger'):
-            current_app.logger.debug('Password check result: %s', normal_result)
-        
-        return normal_result
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True when the stored hash predates the current PASSWORD_HASH_METHOD."""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def set_canvas_token(self, token):
         """Set encrypted Canvas API token."""
@@ -145,6 +124,7 @@ class User(UserMixin, db.Model):
         self.stripe_subscription_id = None
         self.subscription_start = None
         self.subscription_end = None
+        self.set_entitlement(FREE_TIER)
         
         # Clear sync data
         self.last_sync = None
@@ -155,21 +135,128 @@ class User(UserMixin, db.Model):
 
 class SyncSettings(db.Model):
     """Model for storing sync settings."""
+    # Time between automatic syncs for each frequency choice
+    FREQUENCY_INTERVALS = {
+        'hourly': timedelta(hours=1),
+        'daily': timedelta(days=1),
+        'weekly': timedelta(weeks=1),
+    }
+    
+    __table_args__ = (
+        # The scheduler's due-row scan: WHERE enabled AND next_run_at <= now ORDER BY next_run_at
+        db.Index('ix_sync_settings_enabled_next_run_at', 'enabled', 'next_run_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    sync_frequency = db.Column(db.String(20), default='daily')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    enabled = db.Column(db.Boolean, default=False, nullable=False)
+    # Mapped onto the existing sync_frequency column so older databases keep their data
+    frequency = db.Column('sync_frequency', db.String(20), default='daily')
     sync_time = db.Column(db.String(5), default='00:00')
     last_sync = db.Column(db.DateTime)
+    # Precomputed due time; also used as a lease while a scheduler run owns the row
+    next_run_at = db.Column(db.DateTime, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('sync_settings', uselist=False))
+    
+    def next_run_time(self, from_time=None):
+        """
+        Next due time from the frequency, without changing the row.
+        
+        Args:
+            from_time: Time the interval is counted from. Defaults to last_sync,
+                or now if the settings have never synced.
+        """
+        if not self.enabled:
+            return None
+        
+        base = from_time or self.last_sync or datetime.utcnow()
+        interval = self.FREQUENCY_INTERVALS.get(self.frequency, self.FREQUENCY_INTERVALS['daily'])
+        return base + interval
+    
+    def schedule_next_run(self, from_time=None):
+        """Recompute next_run_at from the frequency (see next_run_time)."""
+        self.next_run_at = self.next_run_time(from_time)
+        return self.next_run_at
+    
+    @classmethod
+    def _due_filter(cls, query, now):
+        """Restrict a query to enabled, due rows of premium users with an active course mapping."""
+        mapped_user_ids = db.session.query(CourseMapping.user_id)\
+            .filter(CourseMapping.is_active.is_(True)).distinct()
+        # Rows of other users stay due and are picked up as soon as the user becomes premium
+        premium_user_ids = db.session.query(User.id).filter(User.is_premium)
+        
+        return query\
+            .filter(cls.enabled.is_(True))\
+            .filter(db.or_(cls.next_run_at.is_(None), cls.next_run_at <= now))\
+            .filter(cls.user_id.in_(mapped_user_ids))\
+            .filter(cls.user_id.in_(premium_user_ids))
+    
+    @classmethod
+    def count_due(cls, now):
+        """Number of settings rows claim_due() would currently consider (scheduler backlog)."""
+        return cls._due_filter(db.session.query(db.func.count(cls.id)), now).scalar()
+    
+    @classmethod
+    def claim_due(cls, now, limit, lease):
+        """
+        Claim up to `limit` due settings rows together with their users.
+        
+        Rows are selected in due order with SELECT ... FOR UPDATE SKIP LOCKED
+        (a no-op on SQLite) and leased by pushing next_run_at forward by
+        `lease`, so concurrent scheduler processes never pick the same row and
+        a crashed run is retried once the lease expires. Only premium users
+        with at least one active course mapping are considered.
+        
+        Returns:
+            list of (SyncSettings, User) tuples.
+        """
+        query = db.session.query(cls, User).join(User, cls.user_id == User.id)
+        rows = cls._due_filter(query, now)\
+            .order_by(cls.next_run_at)\
+            .limit(limit)\
+            .with_for_update(skip_locked=True, of=cls)\
+            .all()
+        
+        for setting, _ in rows:
+            setting.next_run_at = now + lease
+        db.session.commit()
+        
+        return rows
+
+class CourseMapping(db.Model):
+    """Model mapping a Canvas course to the Todoist project it syncs into."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id', name='uq_course_mapping_user_course'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    course_id = db.Column(db.String(50), nullable=False)  # Canvas course ID
+    course_name = db.Column(db.String(256))  # Cached so syncs don't need to refetch courses
+    project_id = db.Column(db.String(50), nullable=False)  # Todoist project ID
+    project_name = db.Column(db.String(256))
+    
+    # Per-mapping options
+    due_date_buffer = db.Column(db.Integer, default=0)  # Days to move due dates earlier
+    skip_submitted = db.Column(db.Boolean, default=True)
+    is_active = db.Column(db.Boolean, default=True)
+    
+    last_synced_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    user = db.relationship('User', backref=db.backref('course_mappings', lazy='dynamic'))
 
 class SyncHistory(db.Model):
     """Model for storing sync history."""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     sync_type = db.Column(db.String(20), nullable=False)  # 'canvas_to_todoist' or 'todoist_to_canvas'
     status = db.Column(db.String(20), nullable=False)  # 'success' or 'failed'
     items_synced = db.Column(db.Integer, default=0)
@@ -177,7 +264,7 @@ class SyncHistory(db.Model):
     destination_id = db.Column(db.String(50), nullable=True)  # Todoist project ID
     details = db.Column(db.Text, nullable=True)  # JSON data with additional details
     error_message = db.Column(db.Text)
-    started_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
     completed_at = db.Column(db.DateTime)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -185,12 +272,20 @@ class SyncHistory(db.Model):
     user = db.relationship('User', backref=db.backref('sync_history', lazy='dynamic'))
 
 class Subscription(db.Model):
-    """Model for storing subscription information."""
+    """
+    Local copy of a Stripe subscription.
+    
+    Written from webhook events and the periodic reconciliation sweep (see
+    services/subscriptions.py) so pages never have to ask Stripe.
+    """
+    # Stripe statuses that grant premium access
+    PREMIUM_STATUSES = ('active', 'trialing')
+    
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     stripe_subscription_id = db.Column(db.String(100), unique=True)
     stripe_customer_id = db.Column(db.String(100))
-    status = db.Column(db.String(20), default='inactive')  # 'active', 'inactive', 'canceled', 'trial'
+    status = db.Column(db.String(20), default='inactive')  # Stripe status: 'active', 'trialing', 'past_due', 'canceled', ...
     plan_id = db.Column(db.String(100))
     plan_name = db.Column(db.String(50))
     price_id = db.Column(db.String(100))
@@ -200,13 +295,350 @@ class Subscription(db.Model):
     end_date = db.Column(db.DateTime)
     trial_end = db.Column(db.DateTime)
     cancel_at_period_end = db.Column(db.Boolean, default=False)
+    # Time of the Stripe state last copied in (event creation or sweep time); older updates are ignored
+    stripe_synced_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('subscriptions', lazy='dynamic'))
+    
+    @property
+    def grants_premium(self):
+        return self.status in self.PREMIUM_STATUSES
+    
+    @classmethod
+    def current_for(cls, user):
+        """The user's current subscription row: the one on the user, else the latest updated."""
+        if user.stripe_subscription_id:
+            subscription = cls.query.filter_by(stripe_subscription_id=user.stripe_subscription_id).first()
+            if subscription:
+                return subscription
+        return cls.query.filter_by(user_id=user.id).order_by(cls.updated_at.desc()).first()
 
-@login_manager.user_loader
-def load_user(id):
-    """Load user for Flask-Login."""
-    return User.query.get(int(id)) 
\ No newline at end of file
+class StripeEvent(db.Model):
+    """
+    Raw Stripe webhook event, stored by the webhook and applied later by
+    services.stripe_events.
+    
+    The unique stripe_event_id makes Stripe's retries of an event no-ops.
+    Events are applied in creation order per customer_key (the Stripe
+    customer id, or the event id for events without a customer).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSED = 'processed'
+    STATUS_SKIPPED = 'skipped'  # No handler for the event type
+    STATUS_FAILED = 'failed'  # Gave up after STRIPE_EVENT_MAX_ATTEMPTS
+    
+    __table_args__ = (
+        # The consumer's scan: pending events in creation order per customer
+        db.Index('ix_stripe_event_status_customer_created', 'status', 'customer_key', 'stripe_created'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stripe_event_id = db.Column(db.String(255), unique=True, nullable=False)
+    event_type = db.Column(db.String(100), nullable=False)
+    customer_key = db.Column(db.String(255), nullable=False)
+    stripe_created = db.Column(db.DateTime, nullable=False)  # Event creation time reported by Stripe
+    payload = db.Column(db.Text, nullable=False)  # Event JSON as received
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Retry time after a failure; also used as a lease while a consumer owns the event
+    next_attempt_at = db.Column(db.DateTime)
+    error_message = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    @classmethod
+    def from_payload(cls, event, payload):
+        """Build an unsaved row from a verified event dict and its raw body."""
+        data_object = (event.get('data') or {}).get('object') or {}
+        customer = data_object.get('customer')
+        if isinstance(customer, dict):
+            customer = customer.get('id')
+        if not customer and data_object.get('object') == 'customer':
+            customer = data_object.get('id')
+        
+        return cls(
+            stripe_event_id=event['id'],
+            event_type=event.get('type', ''),
+            customer_key=customer or f"event:{event['id']}",
+            stripe_created=datetime.utcfromtimestamp(event.get('created') or 0),
+            payload=payload.decode('utf-8') if isinstance(payload, bytes) else payload,
+        )
+    
+    @classmethod
+    def _due_filter(cls, query, now):
+        return query\
+            .filter(cls.status == cls.STATUS_PENDING)\
+            .filter(db.or_(cls.next_attempt_at.is_(None), cls.next_attempt_at <= now))
+    
+    @classmethod
+    def count_pending(cls):
+        """Events not yet applied (consumer backlog)."""
+        return db.session.query(func.count(cls.id)).filter(cls.status == cls.STATUS_PENDING).scalar()
+    
+    @classmethod
+    def claim_due(cls, now, limit, lease):
+        """
+        Claim up to `limit` due pending events, oldest first.
+        
+        Only the oldest pending event of each customer is claimed, and
+        customers with a pending event that is leased by another consumer
+        or waiting for a retry are skipped entirely, so a customer's events
+        are never applied out of order or by two consumers at once. The
+        oldest-event test is part of the locked select: while one consumer
+        holds a customer's oldest event, another skips that row and finds
+        no other event of the customer to claim. Rows are locked with
+        SELECT ... FOR UPDATE SKIP LOCKED (a no-op on SQLite) and leased by
+        pushing next_attempt_at forward by `lease`.
+        
+        Returns:
+            list of StripeEvent, ordered by (stripe_created, id).
+        """
+        blocked_customers = db.session.query(cls.customer_key)\
+            .filter(cls.status == cls.STATUS_PENDING, cls.next_attempt_at > now)
+        
+        # A pending event of the same customer created before this one
+        older = aliased(cls)
+        older_pending = db.session.query(older.id)\
+            .filter(older.customer_key == cls.customer_key,
+                    older.status == cls.STATUS_PENDING,
+                    db.or_(older.stripe_created < cls.stripe_created,
+                           db.and_(older.stripe_created == cls.stripe_created, older.id < cls.id)))\
+            .exists()
+        
+        rows = cls._due_filter(cls.query, now)\
+            .filter(cls.customer_key.notin_(blocked_customers))\
+            .filter(~older_pending)\
+            .order_by(cls.stripe_created, cls.id)\
+            .limit(limit)\
+            .with_for_update(skip_locked=True)\
+            .all()
+        
+        for event in rows:
+            event.next_attempt_at = now + lease
+        db.session.commit()
+        
+        return rows
+
+# Row returned by load_user_overviews(): a User with its eager-loaded sync
+# settings, plus that user's most recent SyncHistory row (or None)
+UserOverview = namedtuple('UserOverview', ['user', 'latest_sync'])
+
+# Columns the admin pages display; keeps password hashes and encrypted tokens out of listings
+USER_OVERVIEW_COLUMNS = (
+    User.id, User.username, User.email, User.is_admin, User.created_at, User.last_login,
+    User.subscription_status, User.subscription_end, User.last_sync,
+)
+
+def latest_sync_history(user_ids):
+    """
+    Get the most recent SyncHistory row for each of the given users.
+    
+    Runs a single query regardless of how many users are passed.
+    
+    Returns:
+        dict mapping user_id to SyncHistory.
+    """
+    if not user_ids:
+        return {}
+    
+    latest_ids = db.session.query(func.max(SyncHistory.id).label('id'))\
+        .filter(SyncHistory.user_id.in_(user_ids))\
+        .group_by(SyncHistory.user_id)\
+        .subquery()
+    
+    rows = SyncHistory.query\
+        .options(load_only(SyncHistory.id, SyncHistory.user_id, SyncHistory.sync_type,
+                           SyncHistory.status, SyncHistory.items_synced,
+                           SyncHistory.started_at, SyncHistory.completed_at))\
+        .join(latest_ids, SyncHistory.id == latest_ids.c.id)\
+        .all()
+    
+    return {row.user_id: row for row in rows}
+
+def load_user_overviews(query=None):
+    """
+    Load users together with their sync settings, latest sync and subscription status.
+    
+    Users and settings come from one joined query with narrow column projections,
+    latest syncs from one more, so the cost is two queries however many users
+    there are.
+    
+    Args:
+        query: Optional User query to filter/order/limit. Defaults to all users by ID.
+    
+    Returns:
+        list of UserOverview.
+    """
+    if query is None:
+        query = User.query.order_by(User.id)
+    
+    users = query.options(
+        load_only(*USER_OVERVIEW_COLUMNS),
+        joinedload(User.sync_settings).load_only(
+            SyncSettings.enabled, SyncSettings.frequency,
+            SyncSettings.last_sync, SyncSettings.next_run_at
+        ),
+    ).all()
+    
+    latest = latest_sync_history([user.id for user in users])
+    return [UserOverview(user, latest.get(user.id)) for user in users]
+
+def paginate_user_overviews(after_id=None, before_id=None, search=None, status=None, per_page=50):
+    """
+    Keyset-paginate user overviews ordered by user ID.
+    
+    Seeking on the primary key keeps every page a bounded index range scan no
+    matter how deep the admin pages, unlike OFFSET.
+    
+    Args:
+        after_id: Return users with IDs greater than this (next page).
+        before_id: Return users with IDs less than this (previous page).
+        search: Prefix match on username or email; `%` and `_` match
+            themselves. Case-insensitive under MySQL's default collation
+            and SQLite.
+        status: Exact subscription_status to filter on.
+        per_page: Page size.
+    
+    Returns:
+        tuple of (list of UserOverview, prev_cursor, next_cursor); cursors are
+        user IDs to pass as before_id/after_id, or None at either end.
+    """
+    query = User.query
+    if search:
+        # Bare columns, so the unique indexes on username and email serve the prefix match
+        escaped = search.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"{escaped}%"
+        query = query.filter(db.or_(User.username.like(pattern, escape='\\'),
+                                    User.email.like(pattern, escape='\\')))
+    if status:
+        query = query.filter(User.subscription_status == status)
+    
+    # Walk backwards for the previous page, then flip the rows back into ID order
+    backwards = before_id is not None and after_id is None
+    if backwards:
+        query = query.filter(User.id < before_id).order_by(User.id.desc())
+    else:
+        if after_id is not None:
+            query = query.filter(User.id > after_id)
+        query = query.order_by(User.id)
+    
+    # Fetch one extra row to know whether another page exists
+    rows = load_user_overviews(query.limit(per_page + 1))
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    if not rows:
+        return rows, None, None
+    
+    first_id, last_id = rows[0].user.id, rows[-1].user.id
+    if backwards:
+        prev_cursor = first_id if has_more else None
+        next_cursor = last_id
+    else:
+        prev_cursor = first_id if after_id is not None else None
+        next_cursor = last_id if has_more else None
+    return rows, prev_cursor, next_cursor
+
+def _duration_seconds(started, completed):
+    """SQL expression for the seconds between two DATETIME columns on the bound database."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.extract('epoch', completed - started)
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampdiff(text('MICROSECOND'), started, completed) / 1000000.0
+    # SQLite stores DATETIME as text; julianday() gives fractional days
+    return (func.julianday(completed) - func.julianday(started)) * 86400.0
+
+def system_stats(window_hours=24, active_days=30):
+    """
+    Compute admin system statistics.
+    
+    User counts and sync throughput come from a single conditional-aggregation
+    query; two more compute the p95 duration in the database (a count, then
+    the duration at that rank), so no per-sync rows are loaded.
+    
+    Args:
+        window_hours: Look-back window for sync throughput metrics.
+        active_days: Users who logged in within this many days count as active.
+    
+    Returns:
+        dict of statistics.
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(hours=window_hours)
+    active_since = now - timedelta(days=active_days)
+    
+    def count_where(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+    
+    sync_window = SyncHistory.started_at >= since
+    sync_count = db.session.query(func.count(SyncHistory.id))\
+        .filter(sync_window).scalar_subquery()
+    sync_errors = db.session.query(func.count(SyncHistory.id))\
+        .filter(sync_window, SyncHistory.status != 'success').scalar_subquery()
+    items_synced = db.session.query(func.coalesce(func.sum(SyncHistory.items_synced), 0))\
+        .filter(sync_window).scalar_subquery()
+    
+    row = db.session.query(
+        func.count(User.id),
+        count_where(User.last_login >= active_since),
+        count_where(User.is_admin.is_(True)),
+        count_where(User.subscription_status == 'active'),
+        sync_count,
+        sync_errors,
+        items_synced,
+    ).one()
+    total_users, active_users, admin_users, subscribed_users, syncs, errors, items = row
+    
+    # p95 picked in the database: count the finished syncs, then read the single row at that rank
+    finished = db.session.query(SyncHistory)\
+        .filter(sync_window, SyncHistory.completed_at.isnot(None))
+    finished_count = finished.with_entities(func.count(SyncHistory.id)).scalar()
+    p95_duration = None
+    if finished_count:
+        duration = _duration_seconds(SyncHistory.started_at, SyncHistory.completed_at)
+        p95_duration = finished.with_entities(duration)\
+            .order_by(duration)\
+            .offset(min(finished_count - 1, int(0.95 * finished_count)))\
+            .limit(1)\
+            .scalar()
+        p95_duration = float(p95_duration) if p95_duration is not None else None
+    
+    return {
+        'total_users': total_users,
+        'active_users': int(active_users),
+        'admin_users': int(admin_users),
+        'subscribed_users': int(subscribed_users),
+        'window_hours': window_hours,
+        'syncs': syncs,
+        'syncs_per_hour': round(syncs / window_hours, 2) if window_hours else 0,
+        'sync_errors': errors,
+        'error_rate': round(errors / syncs, 4) if syncs else 0.0,
+        'items_synced': int(items),
+        'p95_duration_seconds': round(p95_duration, 2) if p95_duration is not None else None,
+        'generated_at': now,
+    }
+
+def active_mappings_by_user(user_ids):
+    """
+    Get the active CourseMappings for several users in a single query.
+    
+    Returns:
+        dict mapping user_id to a list of CourseMapping.
+    """
+    mappings = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return mappings
+    
+    rows = CourseMapping.query\
+        .filter(CourseMapping.user_id.in_(user_ids), CourseMapping.is_active.is_(True))\
+        .order_by(CourseMapping.user_id, CourseMapping.id)\
+        .all()
+    for mapping in rows:
+        mappings[mapping.user_id].append(mapping)
+    return mappings
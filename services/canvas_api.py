@@ -3,10 +3,14 @@ import requests
 from dotenv import load_dotenv
 import logging
 
+from .instrumentation import NULL_TIMER
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class CanvasAPI:
-    def __init__(self, api_url=None, api_token=None):
+    def __init__(self, api_url=None, api_token=None, timer=None):
         env_url = os.getenv('CANVAS_API_URL')
         env_token = os.getenv('CANVAS_API_TOKEN')
         
@@ -27,11 +31,45 @@ class CanvasAPI:
                 self.api_url = self.api_url + 'api/v1'
             else:
                 self.api_url = self.api_url + '/api/v1'
-            logging.info(f"Canvas API URL modified to include /api/v1: {self.api_url}")
+            logger.debug('Canvas API URL modified to include /api/v1: %s', self.api_url)
         
         self.headers = {
             'Authorization': f'Bearer {self.api_token}'
         }
+        
+        # SyncTimer collecting per-request spans (no-op unless a sync passes one in)
+        self.timer = timer or NULL_TIMER
+    
+    def _get(self, span_name, endpoint, params=None):
+        """Issue a GET request to Canvas inside a timing span."""
+        with self.timer.span('canvas', span_name) as span:
+            response = requests.get(endpoint, headers=self.headers, params=params)
+            span['status'] = response.status_code
+            span['bytes'] = len(response.content)
+        return response
+    
+    def _get_all(self, span_name, endpoint, params=None, first_response=None):
+        """
+        GET every page of a Canvas list endpoint and return the combined items.
+        
+        Canvas caps per_page (usually at 100) and links further pages through
+        the Link header; each page is its own timing span.
+        """
+        response = first_response
+        if response is None:
+            response = self._get(span_name, endpoint, params)
+        response.raise_for_status()
+        items = response.json()
+        
+        next_link = response.links.get('next')
+        while next_link:
+            # The next URL already carries the query string
+            response = self._get(span_name, next_link['url'])
+            response.raise_for_status()
+            items.extend(response.json())
+            next_link = response.links.get('next')
+        
+        return items
     
     def get_courses(self, enrollment_state='active'):
         """Retrieve user's courses from Canvas"""
@@ -42,26 +80,20 @@ class CanvasAPI:
         }
         
         try:
-            logging.info(f"Getting courses from Canvas API: {endpoint}")
-            response = requests.get(endpoint, headers=self.headers, params=params)
+            response = self._get('GET /courses', endpoint, params)
             
             # If unauthorized, provide a helpful error
             if response.status_code == 401:
                 raise ValueError("Unauthorized: Your Canvas API token appears to be invalid or expired")
             
-            # If we get a different error, provide helpful information
-            response.raise_for_status()
-            
-            data = response.json()
-            if data and len(data) > 0:
-                logging.info(f"First course data sample: {data[0]}")
-            logging.info(f"Successfully fetched {len(data)} courses from Canvas")
+            data = self._get_all('GET /courses', endpoint, first_response=response)
+            logger.debug('Fetched %d courses from Canvas', len(data))
             return data
         except requests.exceptions.ConnectionError:
-            logging.error(f"Connection error when connecting to Canvas API at {endpoint}")
+            logger.error('Connection error when connecting to Canvas API at %s', endpoint)
             raise ValueError(f"Could not connect to Canvas API. Please verify the URL {self.api_url} is correct.")
         except requests.exceptions.RequestException as e:
-            logging.error(f"Request error when fetching courses: {str(e)}")
+            logger.error('Request error when fetching courses: %s', e)
             raise
     
     def get_assignments(self, course_id):
@@ -74,11 +106,9 @@ class CanvasAPI:
         }
         
         try:
-            response = requests.get(endpoint, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get_all('GET /courses/:id/assignments', endpoint, params)
         except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching assignments for course {course_id}: {str(e)}")
+            logger.error('Error fetching assignments for course %s: %s', course_id, e)
             raise
     
     def get_todo_items(self):
@@ -86,9 +116,7 @@ class CanvasAPI:
         endpoint = f"{self.api_url}/users/self/todo"
         
         try:
-            response = requests.get(endpoint, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+            return self._get_all('GET /users/self/todo', endpoint)
         except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching todo items: {str(e)}")
+            logger.error('Error fetching todo items: %s', e)
             raise
@@ -0,0 +1,179 @@
+"""
+Buffered sync history writer.
+Collects SyncHistory rows, SyncSettings schedule updates and
+CourseMapping.last_synced_at updates from scheduler worker threads, and
+writes them in one transaction: a multi-row INSERT plus bulk UPDATEs by
+primary key, instead of an INSERT and COMMIT per sync.
+
+A flush happens when HISTORY_WRITER_MAX_ROWS records are pending, every
+HISTORY_WRITER_FLUSH_SECONDS from a background thread, at the end of each
+scheduler run, and at interpreter exit (atexit). When the database is
+unavailable the records are put back for the next flush, up to
+HISTORY_WRITER_MAX_PENDING history rows; a batch rejected for its data is
+logged and dropped.
+
+Settings updates carry the next run time that releases the scheduler
+lease, so a process that dies before flushing leaves the lease in place
+and the affected users are simply synced again when it expires.
+"""
+
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import exc, insert, update
+from models import db, SyncHistory, SyncSettings, CourseMapping
+from utils.db import connection_label
+from utils.metrics import HISTORY_WRITER_FLUSHES
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """Thread-safe buffer of sync results, flushed in batches."""
+
+    def __init__(self):
+        self.app = None
+        self.max_rows = 200
+        self.flush_seconds = 5.0
+        self.max_pending = 10000
+        self._lock = threading.Lock()  # Guards the buffers
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._history = []
+        self._settings = {}  # SyncSettings id -> column values
+        self._mappings = {}  # CourseMapping id -> last_synced_at
+
+    def init_app(self, app):
+        if self.app is None:
+            atexit.register(self.close)
+        self.app = app
+        self.max_rows = app.config.get('HISTORY_WRITER_MAX_ROWS', 200)
+        self.flush_seconds = app.config.get('HISTORY_WRITER_FLUSH_SECONDS', 5.0)
+        self.max_pending = app.config.get('HISTORY_WRITER_MAX_PENDING', 10000)
+
+    # Recording (any thread)
+
+    def add_history(self, **values):
+        """Queue a SyncHistory row given as column values."""
+        values.setdefault('timestamp', datetime.utcnow())
+        with self._lock:
+            self._history.append(values)
+        self._added()
+
+    def update_settings(self, setting_id, **values):
+        """Queue column updates for a SyncSettings row; later updates of the same row win."""
+        with self._lock:
+            self._settings.setdefault(setting_id, {}).update(values)
+        self._added()
+
+    def update_mappings(self, mapping_ids, last_synced_at):
+        """Queue a last_synced_at update for CourseMapping rows."""
+        with self._lock:
+            for mapping_id in mapping_ids:
+                self._mappings[mapping_id] = last_synced_at
+        self._added()
+
+    def pending(self):
+        with self._lock:
+            return len(self._history) + len(self._settings) + len(self._mappings)
+
+    def _added(self):
+        self._ensure_thread()
+        if self.pending() >= self.max_rows:
+            self._wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # flush() logs and requeues; never let the flusher thread die
+                logger.error('History writer flush failed: %s', e)
+
+    # Writing
+
+    def flush(self):
+        """
+        Write everything pending in one transaction.
+
+        Returns:
+            int: number of records written (0 if nothing was pending or the flush failed).
+        """
+        with self._flush_lock:
+            with self._lock:
+                history, self._history = self._history, []
+                settings, self._settings = self._settings, {}
+                mappings, self._mappings = self._mappings, {}
+            written = len(history) + len(settings) + len(mappings)
+            if not written:
+                return 0
+
+            # A separate app context gets its own session, leaving any caller's session alone
+            with self.app.app_context(), connection_label('history_writer'):
+                try:
+                    if history:
+                        db.session.execute(insert(SyncHistory), history)
+                    if settings:
+                        db.session.execute(update(SyncSettings),
+                                           [{'id': setting_id, **values} for setting_id, values in settings.items()])
+                    if mappings:
+                        db.session.execute(update(CourseMapping),
+                                           [{'id': mapping_id, 'last_synced_at': synced_at}
+                                            for mapping_id, synced_at in mappings.items()])
+                    db.session.commit()
+                except (exc.OperationalError, exc.InterfaceError) as e:
+                    # Database unavailable: keep the records for the next flush
+                    db.session.rollback()
+                    HISTORY_WRITER_FLUSHES.inc(outcome='error')
+                    self._requeue(history, settings, mappings)
+                    self.app.logger.error('History writer could not write %d records, will retry: %s', written, e)
+                    return 0
+                except Exception as e:
+                    # Bad data would fail every retry and block later records; drop this batch
+                    db.session.rollback()
+                    HISTORY_WRITER_FLUSHES.inc(outcome='error')
+                    self.app.logger.error('History writer dropped %d records: %s', written, e)
+                    return 0
+                finally:
+                    db.session.remove()
+
+        HISTORY_WRITER_FLUSHES.inc(outcome='success')
+        logger.debug('History writer wrote %d history rows, %d settings, %d mappings',
+                     len(history), len(settings), len(mappings))
+        return written
+
+    def _requeue(self, history, settings, mappings):
+        """Put records from a failed flush back in front of newer ones, within max_pending."""
+        with self._lock:
+            room = max(self.max_pending - len(self._history), 0)
+            if len(history) > room:
+                logger.error('History writer dropping %d history rows over HISTORY_WRITER_MAX_PENDING',
+                             len(history) - room)
+                history = history[len(history) - room:]
+            self._history[:0] = history
+            for setting_id, values in settings.items():
+                self._settings[setting_id] = {**values, **self._settings.get(setting_id, {})}
+            for mapping_id, synced_at in mappings.items():
+                self._mappings.setdefault(mapping_id, synced_at)
+
+    def close(self):
+        """Stop the flusher thread and write what is left (registered with atexit)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_seconds + 5)
+        if self.app is not None and self.pending():
+            self.flush()
+
+history_writer = HistoryWriter()
@@ -0,0 +1,113 @@
+"""
+Timing instrumentation for the sync path.
+Records spans around Canvas, Todoist and database calls so a slow sync can be
+broken down by phase in SyncHistory.details.
+"""
+
+import time
+from contextlib import contextmanager
+
+# Cap on stored spans so a 5,000-assignment sync doesn't bloat SyncHistory.details
+MAX_SPANS = 200
+
+# Phases that are calls to an external API and feed the upstream latency histogram
+UPSTREAM_PHASES = ('canvas', 'todoist')
+
+def observe_upstream(span, seconds):
+    """Record an upstream API span in the process metrics registry."""
+    if span['phase'] not in UPSTREAM_PHASES:
+        return
+    # Imported here to avoid a circular import through the utils package
+    from utils.metrics import UPSTREAM_REQUEST_SECONDS
+    UPSTREAM_REQUEST_SECONDS.observe(
+        seconds,
+        service=span['phase'],
+        endpoint=span['name'],
+        status=span.get('status', 'ok')
+    )
+
+class SyncTimer:
+    """
+    Collects timing spans for a single sync run.
+
+    Each span belongs to a phase ('canvas', 'todoist', 'db', ...). Per-phase
+    totals (seconds, calls, requests, bytes) are always exact; individual spans
+    are kept up to MAX_SPANS for the waterfall view.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.spans = []
+        self.dropped_spans = 0
+        self.phases = {}
+
+    @contextmanager
+    def span(self, phase, name):
+        """
+        Time a block of work.
+
+        Yields a dict the caller may annotate with 'status', 'bytes' or
+        'requests' (defaults to 1 for the canvas and todoist phases).
+        """
+        start = time.perf_counter()
+        span = {'phase': phase, 'name': name}
+        try:
+            yield span
+        except Exception as e:
+            span.setdefault('status', 'error')
+            span.setdefault('error', type(e).__name__)
+            raise
+        finally:
+            end = time.perf_counter()
+            span['start_ms'] = round((start - self._origin) * 1000, 2)
+            span['duration_ms'] = round((end - start) * 1000, 2)
+            self._record(span, end - start)
+            observe_upstream(span, end - start)
+
+    def _record(self, span, seconds):
+        phase = self.phases.setdefault(span['phase'], {
+            'seconds': 0.0, 'calls': 0, 'requests': 0, 'bytes': 0
+        })
+        phase['seconds'] += seconds
+        phase['calls'] += 1
+        phase['requests'] += span.get('requests', 1 if span['phase'] in ('canvas', 'todoist') else 0)
+        phase['bytes'] += span.get('bytes', 0)
+
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def to_dict(self):
+        """Serialize for SyncHistory.details['timings']."""
+        phases = {
+            name: dict(values, seconds=round(values['seconds'], 4))
+            for name, values in self.phases.items()
+        }
+        return {
+            'total_ms': round((time.perf_counter() - self._origin) * 1000, 2),
+            'phases': phases,
+            'spans': self.spans,
+            'dropped_spans': self.dropped_spans,
+        }
+
+class NullTimer:
+    """
+    Timer stand-in used when a client isn't being instrumented.
+
+    Nothing is kept per sync, but upstream calls still feed the latency metrics.
+    """
+
+    @contextmanager
+    def span(self, phase, name):
+        start = time.perf_counter()
+        span = {'phase': phase, 'name': name}
+        try:
+            yield span
+        except Exception:
+            span.setdefault('status', 'error')
+            raise
+        finally:
+            observe_upstream(span, time.perf_counter() - start)
+
+NULL_TIMER = NullTimer()
@@ -0,0 +1,13 @@
+"""
+Stripe SDK access.
+The SDK takes most of a second to import, so it is loaded on first use
+instead of when a worker boots.
+"""
+
+from flask import current_app
+
+def get_stripe():
+    """Return the stripe module with the API key from STRIPE_SECRET_KEY."""
+    import stripe
+    stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
+    return stripe
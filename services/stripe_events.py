@@ -0,0 +1,208 @@
+"""
+Stripe webhook event consumer.
+The webhook (blueprints/payments.py) only verifies and stores events as
+StripeEvent rows; this module applies them outside the request.
+
+Events are applied oldest first, in order per customer: when an event
+fails, the customer's later events wait until it succeeds or is given up
+on after STRIPE_EVENT_MAX_ATTEMPTS. Stripe's retries of an event are
+dropped by the webhook, because stripe_event_id is unique, so each event
+is applied at most once.
+
+Runs from the scheduler every STRIPE_EVENT_POLL_SECONDS, or with
+`flask process-stripe-events` where the scheduler does not run (uWSGI).
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, User, StripeEvent, PREMIUM_TIER
+from services.subscriptions import sync_subscription
+from utils.metrics import STRIPE_EVENTS, STRIPE_EVENT_BACKLOG
+
+logger = logging.getLogger(__name__)
+
+MAX_ERROR_LENGTH = 2000
+
+def handle_checkout_completed(session, stripe_event):
+    """Link the user who completed a checkout session to their Stripe customer and subscription."""
+    user_id = session.get('client_reference_id')
+    if not user_id:
+        return
+
+    user = db.session.get(User, int(user_id))
+    if not user:
+        current_app.logger.warning('Checkout session %s references unknown user %s', session.get('id'), user_id)
+        return
+
+    # Store Stripe identifiers for future reference
+    if session.get('customer'):
+        user.stripe_customer_id = session['customer']
+    if session.get('subscription'):
+        user.stripe_subscription_id = session['subscription']
+
+    # Stripe sends customer.subscription.created before this event; it was stored but could not be
+    # matched to a user then, so apply the latest stored state of the subscription now
+    latest = None
+    if session.get('subscription'):
+        latest = StripeEvent.query\
+            .filter(StripeEvent.customer_key == stripe_event.customer_key)\
+            .filter(StripeEvent.event_type.in_(SUBSCRIPTION_EVENTS))\
+            .filter(StripeEvent.status == StripeEvent.STATUS_PROCESSED)\
+            .order_by(StripeEvent.stripe_created.desc(), StripeEvent.id.desc())\
+            .first()
+    if latest is not None:
+        stripe_subscription = json.loads(latest.payload)['data']['object']
+        if stripe_subscription.get('id') == session['subscription']:
+            sync_subscription(stripe_subscription, latest.stripe_created, user=user)
+            current_app.logger.info('User %s subscription linked (%s)', user_id, user.subscription_status)
+            return
+
+    # Details follow with the next subscription event or reconciliation sweep
+    user.subscription_status = 'active'
+    user.set_entitlement(PREMIUM_TIER, datetime.utcnow() + timedelta(hours=current_app.config['PREMIUM_GRACE_HOURS']))
+    current_app.logger.info('User %s subscription activated', user_id)
+
+def handle_subscription_changed(stripe_subscription, stripe_event):
+    """Copy a created, updated or deleted subscription into the Subscription table."""
+    sync_subscription(stripe_subscription, stripe_event.stripe_created)
+
+SUBSCRIPTION_EVENTS = (
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+)
+
+# Event type -> handler called with the event's data.object and the StripeEvent row; other types are skipped
+EVENT_HANDLERS = {
+    'checkout.session.completed': handle_checkout_completed,
+    **{event_type: handle_subscription_changed for event_type in SUBSCRIPTION_EVENTS},
+}
+
+def retry_delay(attempts, base_seconds, max_seconds):
+    """Exponential backoff after the `attempts`-th failure."""
+    return timedelta(seconds=min(base_seconds * 2 ** (attempts - 1), max_seconds))
+
+def apply_event(stripe_event):
+    """
+    Apply one claimed event and mark it done in the same transaction.
+
+    Returns:
+        str: the new status (processed or skipped).
+    """
+    handler = EVENT_HANDLERS.get(stripe_event.event_type)
+    if handler is None:
+        status = StripeEvent.STATUS_SKIPPED
+    else:
+        event = json.loads(stripe_event.payload)
+        handler((event.get('data') or {}).get('object') or {}, stripe_event)
+        status = StripeEvent.STATUS_PROCESSED
+
+    stripe_event.status = status
+    stripe_event.attempts += 1
+    stripe_event.next_attempt_at = None
+    stripe_event.error_message = None
+    stripe_event.processed_at = datetime.utcnow()
+    db.session.commit()
+    return status
+
+def _record_failure(stripe_event, error, config):
+    """Schedule a retry of a failed event, or give up on it."""
+    db.session.rollback()
+
+    stripe_event.attempts += 1
+    stripe_event.error_message = str(error)[:MAX_ERROR_LENGTH]
+    if stripe_event.attempts >= config['STRIPE_EVENT_MAX_ATTEMPTS']:
+        stripe_event.status = StripeEvent.STATUS_FAILED
+        stripe_event.next_attempt_at = None
+        outcome = 'failed'
+        current_app.logger.error('Giving up on Stripe event %s (%s) after %d attempts: %s',
+                                 stripe_event.stripe_event_id, stripe_event.event_type,
+                                 stripe_event.attempts, error)
+    else:
+        stripe_event.next_attempt_at = datetime.utcnow() + retry_delay(
+            stripe_event.attempts,
+            config['STRIPE_EVENT_RETRY_BASE_SECONDS'],
+            config['STRIPE_EVENT_RETRY_MAX_SECONDS'],
+        )
+        outcome = 'retried'
+        current_app.logger.warning('Stripe event %s (%s) failed, attempt %d: %s',
+                                   stripe_event.stripe_event_id, stripe_event.event_type,
+                                   stripe_event.attempts, error)
+    db.session.commit()
+    return outcome
+
+def process_pending_events(max_batches=None):
+    """
+    Apply due pending events until none are left (or after `max_batches` claims).
+
+    Returns:
+        dict: number of events per outcome (processed, skipped, retried, failed, deferred).
+    """
+    config = current_app.config
+    batch_size = config['STRIPE_EVENT_BATCH_SIZE']
+    lease = timedelta(seconds=config['STRIPE_EVENT_LEASE_SECONDS'])
+    counts = {'processed': 0, 'skipped': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+
+    # Claimed rows are committed (leased) before they are applied; keep them loaded
+    db.session().expire_on_commit = False
+
+    STRIPE_EVENT_BACKLOG.set(StripeEvent.count_pending())
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        claimed = StripeEvent.claim_due(datetime.utcnow(), batch_size, lease)
+        if not claimed:
+            break
+        batches += 1
+
+        blocked = set()  # Customers with an event that failed in this batch
+        for stripe_event in claimed:
+            if stripe_event.customer_key in blocked:
+                # Release the lease; the failed event's retry time now holds the customer back
+                stripe_event.next_attempt_at = None
+                db.session.commit()
+                counts['deferred'] += 1
+                continue
+
+            try:
+                outcome = apply_event(stripe_event)
+            except Exception as e:
+                outcome = _record_failure(stripe_event, e, config)
+                if outcome == 'retried':
+                    blocked.add(stripe_event.customer_key)
+            counts[outcome] += 1
+            STRIPE_EVENTS.inc(outcome=outcome)
+
+    STRIPE_EVENT_BACKLOG.set(StripeEvent.count_pending())
+
+    if any(counts.values()):
+        current_app.logger.info('Stripe events: %s', ', '.join(f"{key} {value}" for key, value in counts.items() if value))
+    return counts
+
+def purge_old_events(now=None):
+    """
+    Delete applied events older than STRIPE_EVENT_RETENTION_DAYS.
+
+    Stripe stops retrying an event after three days, so a retention of a few
+    weeks keeps duplicate detection intact. Failed events are kept for
+    inspection.
+
+    Returns:
+        int: number of rows deleted.
+    """
+    days = current_app.config.get('STRIPE_EVENT_RETENTION_DAYS')
+    if not days:
+        return 0
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    deleted = StripeEvent.query\
+        .filter(StripeEvent.status.in_([StripeEvent.STATUS_PROCESSED, StripeEvent.STATUS_SKIPPED]))\
+        .filter(StripeEvent.received_at < cutoff)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+    if deleted:
+        current_app.logger.info('Purged %d Stripe events older than %d days', deleted, days)
+    return deleted
@@ -0,0 +1,209 @@
+"""
+Local subscription state.
+Copies Stripe subscription objects into the Subscription table, and
+mirrors the current one onto the user (including the plan_tier and
+premium_until entitlement behind User.is_premium), so that pages and
+premium checks never call Stripe.
+
+Rows are written from webhook events (services/stripe_events.py) and
+corrected by reconcile_subscriptions(), a periodic sweep that lists every
+subscription from Stripe in pages. Each write carries the time of the
+Stripe state it copies; an update older than what a row already holds is
+ignored, so a delayed event cannot undo a newer sweep.
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, User, Subscription, FREE_TIER, PREMIUM_TIER
+from services.stripe_api import get_stripe
+from utils.metrics import UPSTREAM_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LIST_PAGE_SIZE = 100  # Stripe's maximum
+
+BILLING_CYCLES = {'month': 'monthly', 'year': 'yearly'}
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+def _first_item(stripe_subscription):
+    items = (stripe_subscription.get('items') or {}).get('data') or []
+    return items[0] if items else {}
+
+def _find_user(stripe_subscription):
+    """The user a Stripe subscription belongs to, by customer or subscription id."""
+    customer = stripe_subscription.get('customer')
+    if customer:
+        user = User.query.filter_by(stripe_customer_id=customer).first()
+        if user:
+            return user
+    return User.query.filter_by(stripe_subscription_id=stripe_subscription['id']).first()
+
+def mirror_to_user(user, subscription):
+    """Copy a subscription's state onto the user columns read by the rest of the app."""
+    # An old subscription changing (e.g. being deleted) must not downgrade a user who has moved to another one
+    if user.stripe_subscription_id not in (None, subscription.stripe_subscription_id) \
+            and not subscription.grants_premium:
+        return
+    user.stripe_subscription_id = subscription.stripe_subscription_id
+    if subscription.stripe_customer_id:
+        user.stripe_customer_id = subscription.stripe_customer_id
+    user.subscription_status = 'active' if subscription.grants_premium else 'inactive'
+    user.subscription_start = subscription.start_date
+    user.subscription_end = subscription.end_date
+    if subscription.grants_premium:
+        user.set_entitlement(PREMIUM_TIER, premium_until(subscription))
+    else:
+        user.set_entitlement(FREE_TIER)
+
+def premium_until(subscription, now=None):
+    """
+    Entitlement expiry for a premium subscription.
+
+    The end of the paid (or trial) period plus PREMIUM_GRACE_HOURS, so a
+    renewal event that arrives late does not interrupt access. Without a
+    known period end, the grace period counts from now.
+    """
+    grace = timedelta(hours=current_app.config.get('PREMIUM_GRACE_HOURS', 48))
+    period_end = subscription.trial_end if subscription.status == 'trialing' and subscription.trial_end \
+        else subscription.end_date
+    return (period_end or now or datetime.utcnow()) + grace
+
+def sync_subscription(stripe_subscription, as_of, user=None, subscription=None):
+    """
+    Upsert the Subscription row for a Stripe subscription object (a dict).
+
+    Args:
+        as_of: Time of the Stripe state in the object; older than the row's
+            stripe_synced_at means the update is stale and skipped.
+        user, subscription: Already loaded rows, to avoid the lookups.
+
+    Returns:
+        The Subscription row, or None when the user is unknown (yet) or the
+        update is stale. The caller commits.
+    """
+    subscription_id = stripe_subscription['id']
+    if subscription is None:
+        subscription = Subscription.query.filter_by(stripe_subscription_id=subscription_id).first()
+    if subscription is not None and subscription.stripe_synced_at and as_of < subscription.stripe_synced_at:
+        logger.debug('Skipping stale update of subscription %s', subscription_id)
+        return None
+
+    if user is None:
+        user = subscription.user if subscription is not None else _find_user(stripe_subscription)
+    if user is None:
+        logger.info('No user for Stripe subscription %s (customer %s) yet',
+                    subscription_id, stripe_subscription.get('customer'))
+        return None
+
+    if subscription is None:
+        subscription = Subscription(stripe_subscription_id=subscription_id, user_id=user.id)
+        db.session.add(subscription)
+
+    item = _first_item(stripe_subscription)
+    price = item.get('price') or {}
+    recurring = price.get('recurring') or {}
+    # Newer Stripe API versions report the billing period on the item instead of the subscription
+    period_end = stripe_subscription.get('current_period_end') or item.get('current_period_end')
+
+    subscription.stripe_customer_id = stripe_subscription.get('customer')
+    subscription.status = stripe_subscription.get('status') or 'inactive'
+    subscription.plan_id = price.get('product')
+    subscription.plan_name = price.get('nickname')
+    subscription.price_id = price.get('id')
+    subscription.price_amount = price.get('unit_amount')
+    subscription.billing_cycle = BILLING_CYCLES.get(recurring.get('interval'), recurring.get('interval'))
+    subscription.start_date = _timestamp(stripe_subscription.get('start_date'))
+    subscription.end_date = _timestamp(period_end)
+    subscription.trial_end = _timestamp(stripe_subscription.get('trial_end'))
+    subscription.cancel_at_period_end = bool(stripe_subscription.get('cancel_at_period_end'))
+    subscription.stripe_synced_at = as_of
+
+    mirror_to_user(user, subscription)
+    return subscription
+
+def _list_page(stripe, starting_after):
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        params = {'status': 'all', 'limit': LIST_PAGE_SIZE}
+        if starting_after:
+            params['starting_after'] = starting_after
+        return stripe.Subscription.list(**params)
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                         service='stripe', endpoint='subscriptions.list', status=status)
+
+def reconcile_subscriptions():
+    """
+    Correct local subscription state from Stripe.
+
+    Lists all subscriptions a page at a time, loading the page's existing
+    rows and users with one query each. Local premium rows that Stripe no
+    longer returns are marked canceled.
+
+    Returns:
+        dict: number of subscriptions per outcome (updated, unmatched, stale, missing).
+    """
+    stripe = get_stripe()
+    if not stripe.api_key:
+        current_app.logger.warning('Skipping subscription reconciliation: STRIPE_SECRET_KEY is not set')
+        return {}
+
+    started_at = datetime.utcnow()
+    counts = {'updated': 0, 'unmatched': 0, 'stale': 0, 'missing': 0}
+    seen = set()
+    starting_after = None
+
+    while True:
+        fetched_at = datetime.utcnow()
+        page = _list_page(stripe, starting_after)
+        data = page['data']
+        if not data:
+            break
+
+        ids = [item['id'] for item in data]
+        customers = {item['customer'] for item in data if item.get('customer')}
+        existing = {row.stripe_subscription_id: row for row in
+                    Subscription.query.filter(Subscription.stripe_subscription_id.in_(ids))}
+        users_by_customer = {user.stripe_customer_id: user for user in
+                             User.query.filter(User.stripe_customer_id.in_(customers))} if customers else {}
+
+        for item in data:
+            seen.add(item['id'])
+            row = existing.get(item['id'])
+            user = row.user if row is not None else users_by_customer.get(item.get('customer'))
+            if user is None:
+                counts['unmatched'] += 1
+                continue
+            if sync_subscription(item, fetched_at, user=user, subscription=row) is None:
+                counts['stale'] += 1
+            else:
+                counts['updated'] += 1
+        db.session.commit()
+
+        if not page.get('has_more'):
+            break
+        starting_after = ids[-1]
+
+    # Premium rows Stripe no longer knows about; rows written during the sweep are left alone
+    for row in Subscription.query.filter(Subscription.status.in_(Subscription.PREMIUM_STATUSES)):
+        if row.stripe_subscription_id in seen or (row.stripe_synced_at and row.stripe_synced_at >= started_at):
+            continue
+        current_app.logger.warning('Subscription %s of user %s not found in Stripe; marking canceled',
+                                   row.stripe_subscription_id, row.user_id)
+        row.status = 'canceled'
+        row.stripe_synced_at = started_at
+        mirror_to_user(row.user, row)
+        counts['missing'] += 1
+    db.session.commit()
+
+    current_app.logger.info('Subscription reconciliation: %s',
+                            ', '.join(f"{key} {value}" for key, value in counts.items()))
+    return counts
@@ -1,19 +1,28 @@
-print("Importing sync_service")
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta
 from .canvas_api import CanvasAPI
 from .todoist_api import TodoistClient
+from utils.metrics import SYNC_TASKS
+
+logger = logging.getLogger(__name__)
 
 class SyncService:
     def __init__(self, canvas_api=None, todoist_client=None):
         self.canvas_api = canvas_api or CanvasAPI()
         self.todoist_client = todoist_client or TodoistClient()
     
-    def format_assignment_as_task(self, assignment, course_name=None):
-        """Format a Canvas assignment as a Todoist task"""
+    def format_assignment_as_task(self, assignment, course_name=None, due_date_buffer=0):
+        """Format a Canvas assignment as a Todoist task
+        
+        due_date_buffer moves the Todoist due date that many days ahead of the
+        Canvas due date.
+        """
         # Format the due date if available
         due_date = None
         if assignment.get('due_at'):
             due_datetime = datetime.fromisoformat(assignment['due_at'].replace('Z', '+00:00'))
+            if due_date_buffer:
+                due_datetime -= timedelta(days=int(due_date_buffer))
             due_date = due_datetime.strftime('%Y-%m-%d')
         
         # Create task content with course name if available
@@ -42,15 +51,20 @@ class SyncService:
             'labels': ['canvas']
         }
     
-    def sync_course_assignments(self, course_id, project_id=None):
-        """Sync assignments from a Canvas course to Todoist"""
+    def sync_course_assignments(self, course_id, project_id=None, course_name=None,
+                                due_date_buffer=0, skip_submitted=True):
+        """Sync assignments from a Canvas course to Todoist
+        
+        Pass course_name when it is already known (e.g. from a CourseMapping)
+        to avoid refetching the user's course list from Canvas.
+        """
         # Get course details to include course name in tasks
-        courses = self.canvas_api.get_courses()
-        course_name = None
-        for course in courses:
-            if str(course['id']) == str(course_id):
-                course_name = course['name']
-                break
+        if course_name is None:
+            courses = self.canvas_api.get_courses()
+            for course in courses:
+                if str(course['id']) == str(course_id):
+                    course_name = course['name']
+                    break
         
         # Get assignments for the course
         assignments = self.canvas_api.get_assignments(course_id)
@@ -59,11 +73,12 @@ class SyncService:
         created_tasks = []
         for assignment in assignments:
             # Skip assignments that have been submitted
-            if assignment.get('submission') and assignment['submission'].get('submitted_at'):
+            if skip_submitted and assignment.get('submission') and assignment['submission'].get('submitted_at'):
+                SYNC_TASKS.inc(result='skipped')
                 continue
             
             # Format assignment as task
-            task_data = self.format_assignment_as_task(assignment, course_name)
+            task_data = self.format_assignment_as_task(assignment, course_name, due_date_buffer)
             
             # Add project_id if specified
             if project_id:
@@ -73,6 +88,9 @@ class SyncService:
             task = self.todoist_client.create_task(**task_data)
             if task:
                 created_tasks.append(task)
+                SYNC_TASKS.inc(result='created')
+            else:
+                SYNC_TASKS.inc(result='failed')
         
         return created_tasks
     
@@ -107,12 +125,15 @@ class SyncService:
             task = self.todoist_client.create_task(**task_data)
             if task:
                 created_tasks.append(task)
+                SYNC_TASKS.inc(result='created')
+            else:
+                SYNC_TASKS.inc(result='failed')
         
         return created_tasks
         
     def sync_assignments_to_todoist(self, assignments, project_id):
         """Sync Canvas assignments directly to Todoist without fetching them first"""
-        print(f"Syncing {len(assignments)} assignments to Todoist project {project_id}")
+        logger.debug('Syncing %d assignments to Todoist project %s', len(assignments), project_id)
         
         # Get all courses to map course IDs to names
         courses = self.canvas_api.get_courses()
@@ -123,7 +144,7 @@ class SyncService:
         for assignment in assignments:
             # Skip assignments that have been submitted
             if assignment.get('submission') and assignment['submission'].get('submitted_at'):
-                print(f"Skipping submitted assignment: {assignment['name']}")
+                SYNC_TASKS.inc(result='skipped')
                 continue
                 
             # Get course name if available
@@ -136,15 +157,14 @@ class SyncService:
             # Add project_id
             task_data['project_id'] = project_id
             
-            print(f"Creating task: {task_data['content']}")
-            
             # Create task in Todoist
             task = self.todoist_client.create_task(**task_data)
             if task:
-                print(f"Task created: {task}")
                 created_tasks.append(task)
+                SYNC_TASKS.inc(result='created')
             else:
-                print(f"Failed to create task for assignment: {assignment['name']}")
+                SYNC_TASKS.inc(result='failed')
+                logger.warning('Failed to create task for assignment %s', assignment.get('id'))
         
-        print(f"Created {len(created_tasks)} tasks in Todoist")
+        logger.debug('Created %d tasks in Todoist', len(created_tasks))
         return created_tasks
\ No newline at end of file
@@ -1,11 +1,43 @@
 import os
-from todoist_api_python.api import TodoistAPI
+import logging
+import requests
+from contextlib import contextmanager
+from todoist_api_python.endpoints import BASE_URL as TODOIST_BASE_URL
 from dotenv import load_dotenv
 
+from .instrumentation import NULL_TIMER
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+class _InstrumentedSession(requests.Session):
+    """
+    Session handed to the Todoist SDK.
+    
+    Records each response's status and size on the timing span that is
+    open (see TodoistClient._span), like CanvasAPI._get does, and
+    optionally sends requests meant for api.todoist.com to another host.
+    """
+    
+    def __init__(self, base_url=None):
+        super().__init__()
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.active_span = None
+    
+    def request(self, method, url, *args, **kwargs):
+        if self.base_url and url.startswith(TODOIST_BASE_URL):
+            url = self.base_url + url[len(TODOIST_BASE_URL):]
+        response = super().request(method, url, *args, **kwargs)
+        span = self.active_span
+        if span is not None:
+            span['requests'] = span.get('requests', 0) + 1
+            span['status'] = response.status_code
+            span['bytes'] = span.get('bytes', 0) + len(response.content)
+        return response
+
 class TodoistClient:
-    def __init__(self, api_token=None):
+    def __init__(self, api_token=None, timer=None, base_url=None):
         env_token = os.getenv('TODOIST_API_TOKEN')
         
         # Remove debug logging that exposes partial credentials
@@ -15,7 +47,24 @@ class TodoistClient:
         if not self.api_token:
             raise ValueError("Todoist API token must be provided or set in environment variables")
         
-        self.api = TodoistAPI(self.api_token)
+        # Point the SDK at a local stand-in (benchmarks, load tests) instead of api.todoist.com
+        self.session = _InstrumentedSession(base_url or os.getenv('TODOIST_API_BASE_URL'))
+        # Imported here: the SDK's models are the bulk of its import time, paid on first use only
+        from todoist_api_python.api import TodoistAPI
+        self.api = TodoistAPI(self.api_token, session=self.session)
+        
+        # SyncTimer collecting per-request spans (no-op unless a sync passes one in)
+        self.timer = timer or NULL_TIMER
+    
+    @contextmanager
+    def _span(self, name):
+        """Timing span for one SDK call; the session fills in status, bytes and request count."""
+        with self.timer.span('todoist', name) as span:
+            self.session.active_span = span
+            try:
+                yield span
+            finally:
+                self.session.active_span = None
     
     def create_task(self, content, due_date=None, project_id=None, priority=None, labels=None, description=None):
         """Create a new task in Todoist"""
@@ -32,36 +81,40 @@ class TodoistClient:
             task_args = {k: v for k, v in task_args.items() if v is not None}
             
             # Create the task
-            task = self.api.add_task(**task_args)
+            with self._span('POST /tasks'):
+                task = self.api.add_task(**task_args)
             
             # Add description as a comment if provided
             if description and task:
-                self.api.add_comment(
-                    task_id=task.id,
-                    content=description
-                )
+                with self._span('POST /comments'):
+                    self.api.add_comment(
+                        task_id=task.id,
+                        content=description
+                    )
                 
             return task
         except Exception as error:
-            print(f"Error creating Todoist task: {error}")
+            logger.error('Error creating Todoist task: %s', error)
             return None
     
     def get_projects(self):
         """Get all projects from Todoist"""
         try:
-            return self.api.get_projects()
+            with self._span('GET /projects'):
+                return self.api.get_projects()
         except Exception as error:
-            print(f"Error getting Todoist projects: {error}")
+            logger.error('Error getting Todoist projects: %s', error)
             return []
 
     def get_tasks(self, project_id=None):
         """Get tasks from Todoist, optionally filtered by project"""
         try:
             # If project_id is provided, filter tasks by project
-            if project_id:
-                return self.api.get_tasks(project_id=project_id)
-            # Otherwise, get all tasks
-            return self.api.get_tasks()
+            with self._span('GET /tasks'):
+                if project_id:
+                    return self.api.get_tasks(project_id=project_id)
+                # Otherwise, get all tasks
+                return self.api.get_tasks()
         except Exception as error:
-            print(f"Error getting Todoist tasks: {error}")
+            logger.error('Error getting Todoist tasks: %s', error)
             return []
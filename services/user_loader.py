@@ -0,0 +1,181 @@
+"""
+Flask-Login user loader.
+The only user loader of the app. It loads the logged-in user at most once
+per request (memoized on flask.g) and, for USER_CACHE_SECONDS, from a cache
+of the user's non-sensitive columns instead of the database. A cache hit is
+attached to the request's session with merge(load=False).
+
+The authorization and entitlement columns (PER_REQUEST_COLUMNS) are not
+cached either: a cache hit reads them with one query by primary key, so an
+admin flag or premium change made by any process applies to the next
+request, and a user deleted elsewhere is logged out. The password hash and
+encrypted API tokens are never cached; they load with one query the first
+time a request reads them.
+
+USER_CACHE_BACKEND 'local' keeps the cache in the worker process, where an
+invalidation only reaches the process that made the commit: other workers
+may show an old username, email or preferences for up to
+USER_CACHE_SECONDS. 'shared' uses the Flask-Caching backend, so every
+worker sees an invalidation.
+Entries are dropped when a commit changes or deletes the user or one of
+their subscriptions. Code that changes users with bulk or raw SQL must
+call invalidate_user().
+"""
+
+import threading
+import time
+from flask import current_app, g
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from extensions import db, cache, login_manager
+from models import User, Subscription
+from utils.metrics import record_cache_lookup
+
+# Columns that are never cached
+SENSITIVE_COLUMNS = ('password_hash', 'canvas_token_encrypted', 'todoist_token_encrypted')
+
+# Columns read from the database on every request, so no process acts on stale access rights
+PER_REQUEST_COLUMNS = ('is_admin', 'subscription_status', 'subscription_end', 'plan_tier', 'premium_until')
+
+CACHE_KEY = 'user_loader:{}'
+
+class LocalUserCache:
+    """Per-process TTL cache of user column values, keyed by user id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # user id -> (expires at, column values)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[1]
+
+    def set(self, user_id, values, seconds):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + seconds, values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SharedUserCache:
+    """User column values in the Flask-Caching backend, shared by all workers."""
+
+    def get(self, user_id):
+        return cache.get(CACHE_KEY.format(user_id))
+
+    def set(self, user_id, values, seconds):
+        cache.set(CACHE_KEY.format(user_id), values, timeout=seconds)
+
+    def invalidate(self, user_id):
+        cache.delete(CACHE_KEY.format(user_id))
+
+    def clear(self):
+        pass  # Entries expire after USER_CACHE_SECONDS
+
+BACKENDS = {'local': LocalUserCache, 'shared': SharedUserCache}
+
+user_cache = LocalUserCache()
+
+def _cached_columns():
+    excluded = SENSITIVE_COLUMNS + PER_REQUEST_COLUMNS
+    return [attr.key for attr in inspect(User).column_attrs if attr.key not in excluded]
+
+def _projection(user):
+    return {key: getattr(user, key) for key in _cached_columns()}
+
+def _per_request_values(user_id):
+    """The user's PER_REQUEST_COLUMNS, or None if the user no longer exists."""
+    row = db.session.query(*[getattr(User, key) for key in PER_REQUEST_COLUMNS])\
+        .filter(User.id == user_id)\
+        .first()
+    return row._asdict() if row is not None else None
+
+def _from_cache(values):
+    """A persistent User in the current session built from cached values, without a query."""
+    user = User(**values)
+    # Columns missing from values (the sensitive ones) are left expired and load on access
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+def invalidate_user(user_id):
+    """Drop a user's cached columns (done automatically for ORM commits)."""
+    user_cache.invalidate(user_id)
+
+def load_user(user_id):
+    """Return the User for a session's user id, or None."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    loaded = g.setdefault('_loaded_users', {})
+    if user_id in loaded:
+        return loaded[user_id]
+
+    seconds = current_app.config.get('USER_CACHE_SECONDS', 0)
+    values = user_cache.get(user_id) if seconds else None
+    if seconds:
+        record_cache_lookup('user_loader', values is not None)
+    user = None
+    if values is not None:
+        current = _per_request_values(user_id)
+        if current is not None:
+            user = _from_cache({**values, **current})
+        else:
+            user_cache.invalidate(user_id)  # Deleted by another process
+    if user is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            current_app.logger.warning('No user found with ID: %s', user_id)
+        elif seconds:
+            user_cache.set(user_id, _projection(user), seconds)
+
+    loaded[user_id] = user
+    return user
+
+def init_app(app):
+    """Register load_user as the Flask-Login user loader and pick the cache backend."""
+    global user_cache
+    backend = app.config.get('USER_CACHE_BACKEND') or 'local'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown USER_CACHE_BACKEND {backend!r}; expected one of {sorted(BACKENDS)}")
+    if not isinstance(user_cache, BACKENDS[backend]):
+        user_cache = BACKENDS[backend]()
+    login_manager.user_loader(load_user)
+
+# Drop cached columns of users whose row or subscription was changed by a commit
+
+def _changed_user_id(obj):
+    if isinstance(obj, User):
+        return obj.id
+    if isinstance(obj, Subscription):
+        return obj.user_id
+    return None
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('_changed_user_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        user_id = _changed_user_id(obj)
+        if user_id is not None:
+            changed.add(user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('_changed_user_ids', ()):
+        invalidate_user(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('_changed_user_ids', None)
@@ -0,0 +1,51 @@
+"""Login rate limiting keyed by the client address (utils/rate_limit.py)."""
+
+from flask import Flask
+from utils.rate_limit import RateLimiter, client_ip
+
+def make_app(**config):
+    app = Flask(__name__)
+    app.config.update(LOGIN_RATE_LIMIT_PER_IP=(2, 300), RATE_LIMIT_BACKEND='local', **config)
+    return app
+
+def attempt(app, limiter, headers):
+    """Count one attempt from the request's client address; return its Retry-After (0 if allowed)."""
+    with app.test_request_context('/auth/login', method='POST', headers=headers,
+                                  environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        ip = client_ip()
+        retry_after = limiter.retry_after(ip)
+        if not retry_after:
+            limiter.hit(ip)
+        return retry_after
+
+def test_client_ip_reads_configured_header():
+    app = make_app(RATE_LIMIT_IP_HEADER='X-Real-IP')
+    with app.test_request_context(headers={'X-Real-IP': '203.0.113.7'}, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert client_ip() == '203.0.113.7'
+
+def test_client_ip_falls_back_to_remote_addr():
+    app = make_app(RATE_LIMIT_IP_HEADER='X-Real-IP')
+    with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert client_ip() == '10.0.0.1'
+
+def test_real_ips_are_limited_independently():
+    app = make_app(RATE_LIMIT_IP_HEADER='X-Real-IP')
+    limiter = RateLimiter('test_real_ip', 'LOGIN_RATE_LIMIT_PER_IP')
+    first = {'X-Real-IP': '203.0.113.7'}
+    second = {'X-Real-IP': '198.51.100.9'}
+
+    assert attempt(app, limiter, first) == 0
+    assert attempt(app, limiter, first) == 0
+    assert attempt(app, limiter, first) > 0  # Over the limit of 2
+
+    # Same proxy address, different client: its own bucket
+    assert attempt(app, limiter, second) == 0
+    assert attempt(app, limiter, second) == 0
+
+def test_without_header_proxied_clients_share_a_limit():
+    app = make_app(RATE_LIMIT_IP_HEADER=None)
+    limiter = RateLimiter('test_remote_addr', 'LOGIN_RATE_LIMIT_PER_IP')
+
+    assert attempt(app, limiter, {'X-Real-IP': '203.0.113.7'}) == 0
+    assert attempt(app, limiter, {'X-Real-IP': '198.51.100.9'}) == 0
+    assert attempt(app, limiter, {'X-Real-IP': '192.0.2.44'}) > 0
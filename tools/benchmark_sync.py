@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the sync hot path.
+
+Runs SyncService against tools/stub_server.py (recorded Canvas/Todoist
+fixtures served over local HTTP) and measures throughput, upstream requests
+per sync and peak Python memory for two scenario families:
+
+    assignments  one user syncing one course of N assignments
+    users        N users (scheduler style, fresh clients per user) each
+                 syncing --assignments-per-user assignments
+
+Results are written as JSON. Pass --baseline with an earlier results file to
+exit non-zero when a scenario regresses beyond --max-regression.
+
+Usage:
+    python tools/benchmark_sync.py --output bench.json
+    python tools/benchmark_sync.py --quick --baseline bench.json
+    python tools/benchmark_sync.py --assignments 100,1000 --users 10 --latency-ms 20 --error-rate 0.01
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Make the application packages importable when run as tools/benchmark_sync.py
+project_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_folder not in sys.path:
+    sys.path.insert(0, project_folder)
+
+from tools.stub_server import serve_forever
+from services.canvas_api import CanvasAPI
+from services.todoist_api import TodoistClient
+from services.sync_service import SyncService
+from services.instrumentation import SyncTimer
+
+FULL_ASSIGNMENT_COUNTS = (1, 10, 100, 1000, 5000)
+FULL_USER_COUNTS = (1, 10, 100, 1000)
+QUICK_ASSIGNMENT_COUNTS = (1, 10, 100)
+QUICK_USER_COUNTS = (1, 10)
+
+# Fields compared against a baseline: name -> True if higher is better
+REGRESSION_FIELDS = {
+    'assignments_per_second': True,
+    'requests_per_sync': False,
+    'peak_memory_kb': False,
+}
+
+class StubProcess:
+    """Run a stub server in a child process so it doesn't share the benchmark's GIL."""
+
+    def __init__(self, **options):
+        self.options = options
+        self.process = None
+        self.base_url = None
+
+    def __enter__(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve_forever, args=('127.0.0.1', 0, self.options, ready), daemon=True
+        )
+        self.process.start()
+        port = ready.get(timeout=10)
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+def run_syncs(base_url, users, course_id, project_id):
+    """Sync one course for `users` users; return per-sync timings and counters."""
+    durations = []
+    stats = {'syncs': 0, 'sync_errors': 0, 'tasks_created': 0, 'requests': 0, 'canvas_requests': 0,
+             'todoist_requests': 0, 'bytes': 0}
+
+    for user_index in range(users):
+        timer = SyncTimer()
+        started = time.perf_counter()
+        try:
+            # New clients per user, as the scheduler does
+            canvas = CanvasAPI(api_url=f"{base_url}/api/v1", api_token=f"bench-{user_index}", timer=timer)
+            todoist = TodoistClient(api_token=f"bench-{user_index}", timer=timer, base_url=base_url)
+            created = SyncService(canvas, todoist).sync_course_assignments(
+                course_id, project_id=project_id, course_name='Benchmark Course'
+            )
+            stats['tasks_created'] += len(created)
+        except Exception:
+            stats['sync_errors'] += 1
+        durations.append(time.perf_counter() - started)
+        stats['syncs'] += 1
+
+        for name, phase in timer.phases.items():
+            stats['requests'] += phase['requests']
+            stats['bytes'] += phase['bytes']
+            if name in ('canvas', 'todoist'):
+                stats[f"{name}_requests"] += phase['requests']
+
+    return durations, stats
+
+def run_scenario(family, users, assignments, args):
+    """Run one scenario (timed pass, then an optional tracemalloc pass)."""
+    stub_options = {
+        'courses': 1,
+        'assignments': assignments,
+        'page_size': args.page_size,
+        'latency_ms': args.latency_ms,
+        'error_rate': args.error_rate,
+        'submitted_ratio': args.submitted_ratio,
+        'seed': args.seed,
+    }
+    course_id = 48213  # id of tools/fixtures/canvas/course.json
+    project_id = '2331842927'
+
+    with StubProcess(**stub_options) as stub:
+        started = time.perf_counter()
+        durations, stats = run_syncs(stub.base_url, users, course_id, project_id)
+        wall = time.perf_counter() - started
+
+        peak_memory_kb = None
+        if not args.no_memory:
+            tracemalloc.start()
+            run_syncs(stub.base_url, users, course_id, project_id)
+            peak_memory_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            tracemalloc.stop()
+
+    total_assignments = users * assignments
+    return {
+        'scenario': f"{family}:users={users},assignments={assignments}",
+        'family': family,
+        'users': users,
+        'assignments_per_user': assignments,
+        'wall_seconds': round(wall, 4),
+        'assignments_per_second': round(total_assignments / wall, 2) if wall else None,
+        'syncs_per_second': round(stats['syncs'] / wall, 2) if wall else None,
+        'sync_p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'sync_p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'sync_max_ms': round(max(durations) * 1000, 2),
+        'sync_mean_ms': round(statistics.mean(durations) * 1000, 2),
+        'requests_per_sync': round(stats['requests'] / stats['syncs'], 2),
+        'canvas_requests_per_sync': round(stats['canvas_requests'] / stats['syncs'], 2),
+        'todoist_requests_per_sync': round(stats['todoist_requests'] / stats['syncs'], 2),
+        'bytes_per_sync': round(stats['bytes'] / stats['syncs']),
+        'tasks_created': stats['tasks_created'],
+        'sync_errors': stats['sync_errors'],
+        'peak_memory_kb': peak_memory_kb,
+    }
+
+def compare(results, baseline, max_regression):
+    """Return human-readable regressions of `results` against a baseline results document."""
+    previous = {row['scenario']: row for row in baseline.get('results', [])}
+    regressions = []
+    for row in results:
+        old = previous.get(row['scenario'])
+        if not old:
+            continue
+        for field, higher_is_better in REGRESSION_FIELDS.items():
+            new_value, old_value = row.get(field), old.get(field)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change < -max_regression) if higher_is_better else (change > max_regression):
+                regressions.append(f"{row['scenario']} {field}: {old_value} -> {new_value} ({change:+.0%})")
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_folder,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_counts(value):
+    return tuple(int(part) for part in value.split(',') if part.strip())
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SyncService against recorded fixtures.')
+    parser.add_argument('--assignments', type=parse_counts,
+                        help='Assignment counts for the single-user scenarios (default 1,10,100,1000,5000)')
+    parser.add_argument('--users', type=parse_counts,
+                        help='User counts for the multi-user scenarios (default 1,10,100,1000)')
+    parser.add_argument('--assignments-per-user', type=int, default=10)
+    parser.add_argument('--quick', action='store_true', help='Small scenario set for CI')
+    parser.add_argument('--page-size', type=int, default=100, help='Canvas page size served by the stub')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency added to every stub response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub responses that are 500s')
+    parser.add_argument('--submitted-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative regression per field before failing (default 0.2)')
+    parser.add_argument('--verbose', action='store_true', help='Show application log output')
+    args = parser.parse_args()
+
+    # Injected errors would otherwise flood stderr with client error logs
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+
+    assignment_counts = args.assignments or (QUICK_ASSIGNMENT_COUNTS if args.quick else FULL_ASSIGNMENT_COUNTS)
+    user_counts = args.users or (QUICK_USER_COUNTS if args.quick else FULL_USER_COUNTS)
+
+    scenarios = [('assignments', 1, count) for count in assignment_counts]
+    scenarios += [('users', count, args.assignments_per_user) for count in user_counts]
+
+    results = []
+    for family, users, assignments in scenarios:
+        row = run_scenario(family, users, assignments, args)
+        results.append(row)
+        print(f"{row['scenario']:<45} {row['assignments_per_second']:>10} assignments/s "
+              f"{row['requests_per_sync']:>8} req/sync  p95 {row['sync_p95_ms']} ms", file=sys.stderr)
+
+    document = {
+        'meta': {
+            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': {key: value for key, value in vars(args).items()
+                        if key not in ('output', 'baseline', 'verbose')},
+        },
+        'results': results,
+    }
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
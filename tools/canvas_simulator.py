@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Simulated Canvas LMS server for load and pagination testing.
+
+Serves GET /api/v1/courses, /api/v1/courses/:id/assignments and
+/api/v1/users/self/todo for a synthetic institution of any size. Every user,
+course, assignment and submission is derived from the seed, so two runs with
+the same options serve byte-identical responses.
+
+Behaves like Canvas where CanvasAPI and the scheduler care:
+    - Link-header pagination (per_page defaults to 10 and is capped at --max-per-page)
+    - a per-token leaky bucket reported in X-Rate-Limit-Remaining / X-Request-Cost,
+      answering --throttle-status (429 by default) when the bucket runs dry
+    - random 429 injection with Retry-After (--inject-429)
+    - ETag / If-None-Match revalidation (304 Not Modified)
+    - 401 for tokens that don't belong to a simulated user
+
+Tokens have the form "sim-<n>" for users 0..--users-1. The "tokens" command
+prints each user's token and course ids so the app database can be seeded to
+match (see tools/load_test.py).
+
+Usage:
+    python tools/canvas_simulator.py serve --port 8766 --users 5000 --courses 2000
+    python tools/canvas_simulator.py tokens --users 1000 > canvas_users.json
+
+Point CanvasAPI at http://<host>:<port>/api/v1. GET /__sim/stats returns
+request, throttle and cache counters; POST /__sim/reset clears them and the
+rate-limit buckets.
+"""
+
+import argparse
+import copy
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Make the tools package importable when run as tools/canvas_simulator.py
+project_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_folder not in sys.path:
+    sys.path.insert(0, project_folder)
+
+from tools.stub_server import load_fixture
+
+TOKEN_PREFIX = 'sim-'
+
+DEFAULT_OPTIONS = {
+    'users': 1000,
+    'courses': 500,
+    'courses_per_user': 5,
+    'assignments_per_course': 40,
+    'submitted_ratio': 0.3,
+    'todo_limit': 50,          # Canvas only lists the nearest pending items in the to-do list
+    'max_per_page': 100,       # Canvas caps per_page at 100
+    'bucket_size': 700.0,      # Canvas' default high-water mark
+    'leak_rate': 10.0,         # Units restored per second
+    'request_cost': 1.0,       # Cost of a request before items
+    'item_cost': 0.05,         # Additional cost per item returned
+    'throttle_status': 429,    # Real Canvas answers 403 "Rate Limit Exceeded"
+    'inject_429': 0.0,         # Share of requests answered with a 429 regardless of the bucket
+    'retry_after': 1,          # Seconds sent in Retry-After
+    'latency_ms': 0.0,
+    'jitter_ms': 0.0,
+    'seed': 1,
+}
+
+class CanvasWorld:
+    """Deterministic users, courses, assignments and submissions derived from a seed."""
+
+    def __init__(self, options):
+        self.options = options
+        self.seed = options['seed']
+        self.course_template = load_fixture('canvas/course.json')
+        self.assignment_template = load_fixture('canvas/assignment.json')
+        self.todo_template = load_fixture('canvas/todo_item.json')
+        self.term_start = datetime.strptime(self.course_template['start_at'], '%Y-%m-%dT%H:%M:%SZ')
+
+    def user_for_token(self, token):
+        """Return the user index for a "sim-<n>" token, or None."""
+        if not token or not token.startswith(TOKEN_PREFIX):
+            return None
+        try:
+            user = int(token[len(TOKEN_PREFIX):])
+        except ValueError:
+            return None
+        return user if 0 <= user < self.options['users'] else None
+
+    @staticmethod
+    def token_for_user(user):
+        return f"{TOKEN_PREFIX}{user}"
+
+    def course_id(self, index):
+        return self.course_template['id'] + index
+
+    @functools.lru_cache(maxsize=65536)
+    def course_ids_for_user(self, user):
+        rng = random.Random(f"{self.seed}-user-{user}")
+        count = min(self.options['courses_per_user'], self.options['courses'])
+        return tuple(sorted(self.course_id(index) for index in rng.sample(range(self.options['courses']), count)))
+
+    def course(self, course_id, user):
+        index = course_id - self.course_template['id']
+        course = copy.deepcopy(self.course_template)
+        course['id'] = course_id
+        course['name'] = f"SIM {index:05d} - Simulated Course {index + 1}"
+        course['course_code'] = f"SIM{index:05d}"
+        course['uuid'] = hashlib.sha1(f"{self.seed}-course-{course_id}".encode()).hexdigest()[:40]
+        course['enrollments'][0]['user_id'] = user
+        return course
+
+    @functools.lru_cache(maxsize=1024)
+    def assignments(self, course_id):
+        """Course assignments without per-user submission state (shared, don't mutate)."""
+        template = self.assignment_template
+        rng = random.Random(f"{self.seed}-course-{course_id}")
+        assignments = []
+        for index in range(self.options['assignments_per_course']):
+            assignment = copy.deepcopy(template)
+            assignment_id = template['id'] + course_id * 1000 + index
+            due_at = self.term_start + timedelta(days=rng.randint(1, 120), hours=rng.randint(0, 23))
+            assignment.update({
+                'id': assignment_id,
+                'course_id': course_id,
+                'name': f"{rng.choice(('Problem Set', 'Lab Report', 'Quiz', 'Reading Response', 'Essay'))} {index + 1}",
+                'position': index + 1,
+                'points_possible': float(rng.choice((5, 10, 20, 30, 50, 100))),
+                'due_at': due_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'html_url': re.sub(r'/courses/\d+/assignments/\d+',
+                                   f'/courses/{course_id}/assignments/{assignment_id}',
+                                   template['html_url']),
+            })
+            assignment['submission']['assignment_id'] = assignment_id
+            assignments.append(assignment)
+        return tuple(assignments)
+
+    def is_submitted(self, assignment_id, user):
+        rng = random.Random(f"{self.seed}-submission-{user}-{assignment_id}")
+        return rng.random() < self.options['submitted_ratio']
+
+    def with_submission(self, assignment, user):
+        """Copy of an assignment with the user's (deterministic) submission state."""
+        assignment = copy.deepcopy(assignment)
+        submission = assignment['submission']
+        submission['user_id'] = user
+        if self.is_submitted(assignment['id'], user):
+            submission['submitted_at'] = assignment['due_at']
+            submission['workflow_state'] = 'submitted'
+            submission['submission_type'] = 'online_upload'
+            submission['attempt'] = 1
+        return assignment
+
+    def todo_item(self, assignment, user):
+        item = copy.deepcopy(self.todo_template)
+        item['course_id'] = assignment['course_id']
+        item['context_name'] = self.course(assignment['course_id'], user)['name']
+        item['title'] = assignment['name']
+        item['html_url'] = f"{assignment['html_url']}#submit"
+        item['assignment'] = assignment
+        return item
+
+class RateLimiter:
+    """Canvas-style leaky bucket per access token."""
+
+    def __init__(self, size, leak_rate):
+        self.size = size
+        self.leak_rate = leak_rate
+        self._buckets = {}  # token -> (used, last_update)
+        self._lock = threading.Lock()
+
+    def charge(self, token, cost):
+        """Charge `cost` to a token; return (allowed, remaining)."""
+        now = time.monotonic()
+        with self._lock:
+            used, last = self._buckets.get(token, (0.0, now))
+            used = max(0.0, used - (now - last) * self.leak_rate)
+            if used + cost > self.size:
+                self._buckets[token] = (used, now)
+                return False, round(self.size - used, 3)
+            used += cost
+            self._buckets[token] = (used, now)
+            return True, round(self.size - used, 3)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+def make_handler(world, options):
+    """Build a request handler class bound to one simulated institution."""
+    limiter = RateLimiter(options['bucket_size'], options['leak_rate'])
+    rng = random.Random(options['seed'])
+    rng_lock = threading.Lock()
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def count(*keys):
+        with stats_lock:
+            for key in keys:
+                stats[key] += 1
+
+    class CanvasHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # See tools/stub_server.py
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload=None, headers=None):
+            body = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            if payload is not None:
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _random(self):
+            with rng_lock:
+                return rng.random()
+
+        def _link_header(self, url, query, page, per_page, total):
+            last_page = max(1, -(-total // per_page))
+
+            def link(number, rel):
+                params = {key: values[0] for key, values in query.items()}
+                params.update(page=number, per_page=per_page)
+                return f'<http://{self.headers["Host"]}{url.path}?{urlencode(params)}>; rel="{rel}"'
+
+            links = [link(page, 'current')]
+            if page < last_page:
+                links.append(link(page + 1, 'next'))
+            if page > 1:
+                links.append(link(page - 1, 'prev'))
+            links += [link(1, 'first'), link(last_page, 'last')]
+            return ','.join(links)
+
+        def _items(self, path, user):
+            """Return (full item count, function building a page) for a list endpoint, or None."""
+            if path == '/api/v1/courses':
+                course_ids = world.course_ids_for_user(user)
+                return len(course_ids), lambda start, stop: [world.course(cid, user) for cid in course_ids[start:stop]]
+
+            match = re.fullmatch(r'/api/v1/courses/(\d+)/assignments', path)
+            if match:
+                course_id = int(match.group(1))
+                if course_id not in world.course_ids_for_user(user):
+                    return None
+                assignments = world.assignments(course_id)
+                return len(assignments), lambda start, stop: [
+                    world.with_submission(assignment, user) for assignment in assignments[start:stop]
+                ]
+
+            if path == '/api/v1/users/self/todo':
+                pending = sorted(
+                    (assignment
+                     for course_id in world.course_ids_for_user(user)
+                     for assignment in world.assignments(course_id)
+                     if not world.is_submitted(assignment['id'], user)),
+                    key=lambda assignment: assignment['due_at']
+                )[:options['todo_limit']]
+                return len(pending), lambda start, stop: [
+                    world.todo_item(world.with_submission(assignment, user), user) for assignment in pending[start:stop]
+                ]
+            return None
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/')
+
+            if path == '/__sim/stats':
+                with stats_lock:
+                    return self._send(200, dict(stats))
+
+            count('requests')
+            latency = options['latency_ms'] + (self._random() * options['jitter_ms'] if options['jitter_ms'] else 0)
+            if latency:
+                time.sleep(latency / 1000.0)
+
+            token = self.headers.get('Authorization', '').replace('Bearer ', '', 1).strip()
+            user = world.user_for_token(token)
+            if user is None:
+                count('unauthorized')
+                return self._send(401, {'errors': [{'message': 'Invalid access token.'}]},
+                                  {'WWW-Authenticate': 'Bearer realm="canvas-lms"'})
+
+            if options['inject_429'] and self._random() < options['inject_429']:
+                count('injected_429')
+                return self._send(429, {'errors': [{'message': 'Too Many Requests'}]},
+                                  {'Retry-After': str(options['retry_after'])})
+
+            listing = self._items(path, user)
+            if listing is None:
+                count('not_found')
+                return self._send(404, {'errors': [{'message': 'The specified resource does not exist.'}]})
+            total, build_page = listing
+
+            query = parse_qs(url.query)
+            per_page = max(1, min(int(query.get('per_page', ['10'])[0]), options['max_per_page']))
+            page = max(1, int(query.get('page', ['1'])[0]))
+            start = (page - 1) * per_page
+            items = build_page(start, start + per_page)
+
+            cost = options['request_cost'] + options['item_cost'] * len(items)
+            allowed, remaining = limiter.charge(token, cost)
+            rate_headers = {'X-Rate-Limit-Remaining': f"{remaining:.3f}", 'X-Request-Cost': f"{cost:.3f}"}
+            if not allowed:
+                count('throttled')
+                body = {'errors': [{'message': '403 Forbidden (Rate Limit Exceeded)'}]}
+                return self._send(options['throttle_status'], body,
+                                  dict(rate_headers, **{'Retry-After': str(options['retry_after'])}))
+
+            body = json.dumps(items).encode()
+            etag = f'W/"{hashlib.md5(body).hexdigest()}"'
+            headers = dict(rate_headers, ETag=etag, Link=self._link_header(url, query, page, per_page, total))
+
+            if self.headers.get('If-None-Match') == etag:
+                count('not_modified')
+                return self._send(304, headers=headers)
+
+            count('ok', 'ok:' + re.sub(r'/\d+', '/:id', path))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if urlsplit(self.path).path.rstrip('/') == '/__sim/reset':
+                with stats_lock:
+                    stats.clear()
+                limiter.reset()
+                return self._send(200, {'reset': True})
+            self._send(404, {'errors': [{'message': 'The specified resource does not exist.'}]})
+
+    return CanvasHandler
+
+def create_server(host='127.0.0.1', port=0, **options):
+    """Create (but don't start) a simulator; port 0 picks a free port."""
+    merged = dict(DEFAULT_OPTIONS, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(CanvasWorld(merged), merged))
+    server.daemon_threads = True
+    return server
+
+def serve_forever(host, port, options, ready=None):
+    """Run a simulator until the process is terminated (multiprocessing target)."""
+    server = create_server(host, port, **options)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+def add_world_arguments(parser):
+    parser.add_argument('--users', type=int, default=DEFAULT_OPTIONS['users'])
+    parser.add_argument('--courses', type=int, default=DEFAULT_OPTIONS['courses'])
+    parser.add_argument('--courses-per-user', type=int, default=DEFAULT_OPTIONS['courses_per_user'])
+    parser.add_argument('--assignments-per-course', type=int, default=DEFAULT_OPTIONS['assignments_per_course'])
+    parser.add_argument('--submitted-ratio', type=float, default=DEFAULT_OPTIONS['submitted_ratio'])
+    parser.add_argument('--todo-limit', type=int, default=DEFAULT_OPTIONS['todo_limit'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_OPTIONS['seed'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated Canvas LMS API.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Run the simulator')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8766)
+    add_world_arguments(serve)
+    serve.add_argument('--max-per-page', type=int, default=DEFAULT_OPTIONS['max_per_page'])
+    serve.add_argument('--bucket-size', type=float, default=DEFAULT_OPTIONS['bucket_size'])
+    serve.add_argument('--leak-rate', type=float, default=DEFAULT_OPTIONS['leak_rate'])
+    serve.add_argument('--request-cost', type=float, default=DEFAULT_OPTIONS['request_cost'])
+    serve.add_argument('--item-cost', type=float, default=DEFAULT_OPTIONS['item_cost'])
+    serve.add_argument('--throttle-status', type=int, default=DEFAULT_OPTIONS['throttle_status'])
+    serve.add_argument('--inject-429', type=float, default=DEFAULT_OPTIONS['inject_429'])
+    serve.add_argument('--retry-after', type=int, default=DEFAULT_OPTIONS['retry_after'])
+    serve.add_argument('--latency-ms', type=float, default=DEFAULT_OPTIONS['latency_ms'])
+    serve.add_argument('--jitter-ms', type=float, default=DEFAULT_OPTIONS['jitter_ms'])
+
+    tokens = commands.add_parser('tokens', help='Print each simulated user\'s token and course ids as JSON')
+    add_world_arguments(tokens)
+
+    args = parser.parse_args()
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS if hasattr(args, key)}
+
+    if args.command == 'tokens':
+        world = CanvasWorld(dict(DEFAULT_OPTIONS, **options))
+        json.dump([
+            {'user': user, 'token': world.token_for_user(user), 'course_ids': list(world.course_ids_for_user(user))}
+            for user in range(args.users)
+        ], sys.stdout, indent=1)
+        sys.stdout.write('\n')
+        return
+
+    server = create_server(args.host, args.port, **options)
+    print(f"Canvas simulator listening on http://{args.host}:{server.server_address[1]}/api/v1 "
+          f"({args.users} users, {args.courses} courses)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
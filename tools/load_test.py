@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Load-test runner for the Flask app.
+
+Starts the Canvas and Todoist simulators (tools/canvas_simulator.py,
+tools/todoist_simulator.py), seeds a database with users whose credentials
+point at them, serves create_app('testing') under gunicorn with --workers
+processes, then drives realistic user flows with --concurrency virtual users:
+
+    login once, then repeatedly: dashboard, history, settings and
+    /direct_sync, picked by --mix weights
+
+Reports throughput and latency percentiles per endpoint as JSON (stdout or
+--output) plus a summary table on stderr. Run it with different --workers
+values to size production worker counts.
+
+Usage:
+    python tools/load_test.py --workers 4 --concurrency 32 --duration 60
+    python tools/load_test.py --workers 2 --users 200 --canvas-latency-ms 150 --todoist-latency-ms 80 \\
+        --mix dashboard=4,history=3,settings=2,direct_sync=1 --output load.json
+    python tools/load_test.py --target http://127.0.0.1:5000 ...   # reuse a running server
+                                                                   # seeded by an earlier run (--keep)
+
+The scheduler is not started in the workers (FLASK_RUN_FROM_CLI=1), so only
+request traffic is measured.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+project_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_folder not in sys.path:
+    sys.path.insert(0, project_folder)
+
+from tools import canvas_simulator, todoist_simulator
+
+PASSWORD = 'load-test-password'
+DEFAULT_MIX = 'dashboard=4,history=3,settings=2,direct_sync=1'
+
+def parse_mix(value):
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in FLOW_STEPS:
+            raise argparse.ArgumentTypeError(f"Unknown step {name!r}; choose from {', '.join(FLOW_STEPS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_simulator(module, options):
+    """Start a simulator in a child process; return (process, base_url)."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=module.serve_forever, args=('127.0.0.1', 0, options, ready), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{ready.get(timeout=10)}"
+
+def server_environment(database_url, todoist_url):
+    env = dict(os.environ)
+    env.update({
+        'TEST_DATABASE_URL': database_url,
+        'DATABASE_URL': database_url,
+        'TODOIST_API_BASE_URL': todoist_url,
+        'SESSION_COOKIE_SECURE': 'False',   # Plain HTTP between the runner and gunicorn
+        'FLASK_RUN_FROM_CLI': '1',          # Keep the scheduler out of the workers
+        'SECRET_KEY': env.get('SECRET_KEY') or 'load-test-secret-key',
+    })
+    return env
+
+def seed_database(env, users, canvas_url, workdir):
+    """Create the schema and `users` accounts with simulator credentials."""
+    os.environ.update(env)
+    os.chdir(workdir)  # Relative paths such as the log directory land in the run directory
+    from app import create_app
+    from models import db, User
+    from werkzeug.security import generate_password_hash
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        existing = {username for (username,) in db.session.query(User.username)}
+        # One hash for everyone; hashing each password would dominate seeding time
+        password_hash = generate_password_hash(PASSWORD)
+        for index in range(users):
+            username = f"load{index}"
+            if username in existing:
+                continue
+            user = User(username=username, email=f"{username}@example.test")
+            user.password_hash = password_hash
+            user.canvas_api_url = f"{canvas_url}/api/v1"
+            user.set_canvas_token(canvas_simulator.CanvasWorld.token_for_user(index))
+            user.set_todoist_token(f"todoist-{index}")
+            db.session.add(user)
+        db.session.commit()
+
+def start_gunicorn(env, workers, threads, port, workdir):
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--pythonpath', project_folder,
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--bind', f"127.0.0.1:{port}",
+        '--timeout', '120',
+        "app:create_app('testing')",
+    ]
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+def wait_until_ready(base_url, process=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            if requests.get(f"{base_url}/auth/login", timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{base_url} did not become ready in {timeout}s")
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error collection."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, status, ok):
+        with self.lock:
+            self.samples[name].append(seconds)
+            self.statuses[name][str(status)] += 1
+            if not ok:
+                self.errors[name] += 1
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+class VirtualUser:
+    """One logged-in browser session working through the flow."""
+
+    def __init__(self, index, base_url, todoist_url, recorder, course_ids):
+        self.index = index
+        self.base_url = base_url
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.course_ids = course_ids
+        # The Inbox project of this user's simulated Todoist account, for /direct_sync
+        response = requests.get(f"{todoist_url}/rest/v2/projects",
+                                headers={'Authorization': f"Bearer todoist-{index}"}, timeout=10)
+        self.project_id = response.json()[0]['id'] if response.ok else None
+
+    def request(self, name, method, path, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", allow_redirects=False,
+                                            timeout=120, **kwargs)
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        self.recorder.record(name, time.perf_counter() - started, status, status in expect)
+        return status
+
+    def login(self):
+        # A successful login redirects; a failed one re-renders or redirects back to the form
+        status = self.request('POST /auth/login', 'POST', '/auth/login', expect=(302,),
+                              data={'username': f"load{self.index}", 'password': PASSWORD})
+        return status == 302
+
+    def dashboard(self):
+        self.request('GET /dashboard/', 'GET', '/dashboard/')
+
+    def history(self):
+        self.request('GET /history/', 'GET', '/history/')
+
+    def settings(self):
+        self.request('GET /settings/settings', 'GET', '/settings/settings')
+
+    def direct_sync(self):
+        self.request('POST /direct_sync', 'POST', '/direct_sync',
+                     json={'course_id': random.choice(self.course_ids), 'project_id': self.project_id})
+
+FLOW_STEPS = {
+    'dashboard': VirtualUser.dashboard,
+    'history': VirtualUser.history,
+    'settings': VirtualUser.settings,
+    'direct_sync': VirtualUser.direct_sync,
+}
+
+def run_load(base_url, todoist_url, world, args, recorder):
+    deadline = time.monotonic() + args.duration
+    steps, weights = zip(*args.mix.items())
+
+    def run_user(slot):
+        # Virtual users cycle through the seeded accounts
+        index = slot % args.users
+        user = VirtualUser(index, base_url, todoist_url, recorder, list(world.course_ids_for_user(index)))
+        if not user.login():
+            return
+        rng = random.Random(f"{args.seed}-{slot}")
+        while time.monotonic() < deadline:
+            FLOW_STEPS[rng.choices(steps, weights)[0]](user)
+            if args.think_ms:
+                time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000.0)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run_user, range(args.concurrency)))
+    return time.perf_counter() - started
+
+def summarize(recorder, wall_seconds):
+    endpoints = {}
+    total = errors = 0
+    for name, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        total += len(ordered)
+        errors += recorder.errors[name]
+        endpoints[name] = {
+            'requests': len(ordered),
+            'errors': recorder.errors[name],
+            'statuses': dict(recorder.statuses[name]),
+            'throughput_rps': round(len(ordered) / wall_seconds, 2),
+            'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+            'p90_ms': round(percentile(ordered, 90) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 1),
+            'max_ms': round(ordered[-1] * 1000, 1),
+        }
+    return {
+        'wall_seconds': round(wall_seconds, 2),
+        'requests': total,
+        'errors': errors,
+        'throughput_rps': round(total / wall_seconds, 2) if wall_seconds else None,
+        'endpoints': endpoints,
+    }
+
+def print_table(summary):
+    print(f"{'endpoint':<24}{'reqs':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}", file=sys.stderr)
+    for name, row in summary['endpoints'].items():
+        print(f"{name:<24}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}", file=sys.stderr)
+    print(f"{'total':<24}{summary['requests']:>8}{summary['errors']:>6}{summary['throughput_rps']:>9}",
+          file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive the Flask app with simulated users.')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load after login')
+    parser.add_argument('--users', type=int, default=100, help='Seeded accounts the virtual users rotate through')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted flow steps (default {DEFAULT_MIX})")
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Mean pause between steps')
+    parser.add_argument('--canvas-latency-ms', type=float, default=50.0)
+    parser.add_argument('--todoist-latency-ms', type=float, default=50.0)
+    parser.add_argument('--canvas-inject-429', type=float, default=0.0)
+    parser.add_argument('--todoist-quota', type=int, default=0, help='Requests per token per 15 min; 0 disables')
+    parser.add_argument('--database-url', help='Database for the workers (default: a temporary SQLite file)')
+    parser.add_argument('--target', help='Base URL of an already running, already seeded app; skips gunicorn')
+    parser.add_argument('--port', type=int, default=0, help='gunicorn port (default: any free port)')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary directory (database, gunicorn log)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+    canvas_options = {'users': max(args.users, 1), 'latency_ms': args.canvas_latency_ms,
+                      'inject_429': args.canvas_inject_429, 'seed': args.seed}
+    todoist_options = {'latency_ms': args.todoist_latency_ms, 'quota': args.todoist_quota, 'seed': args.seed}
+
+    canvas_process, canvas_url = start_simulator(canvas_simulator, canvas_options)
+    todoist_process, todoist_url = start_simulator(todoist_simulator, todoist_options)
+    world = canvas_simulator.CanvasWorld(dict(canvas_simulator.DEFAULT_OPTIONS, **canvas_options))
+    gunicorn = None
+
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            env = server_environment(database_url, todoist_url)
+            print(f"Seeding {args.users} users into {database_url}", file=sys.stderr)
+            seed_database(env, args.users, canvas_url, workdir)
+            port = args.port or free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            gunicorn = start_gunicorn(env, args.workers, args.threads, port, workdir)
+            wait_until_ready(base_url, gunicorn)
+
+        print(f"Running {args.concurrency} virtual users for {args.duration:.0f}s against {base_url} "
+              f"({args.workers} workers x {args.threads} threads)", file=sys.stderr)
+        recorder = Recorder()
+        wall = run_load(base_url, todoist_url, world, args, recorder)
+        summary = summarize(recorder, wall)
+        print_table(summary)
+
+        canvas_stats = requests.get(f"{canvas_url}/__sim/stats", timeout=5).json()
+        todoist_stats = requests.get(f"{todoist_url}/__sim/stats", timeout=5).json()
+    finally:
+        if gunicorn is not None:
+            os.killpg(gunicorn.pid, signal.SIGTERM)
+            gunicorn.wait(timeout=30)
+        canvas_process.terminate()
+        todoist_process.terminate()
+        if args.keep:
+            print(f"Kept {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        'meta': {
+            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'target': args.target,
+            'options': {key: value for key, value in vars(args).items() if key not in ('output',)},
+        },
+        'summary': summary,
+        'upstream': {'canvas': canvas_stats, 'todoist': todoist_stats},
+    }
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
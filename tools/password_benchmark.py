@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark.
+
+Measures how many logins per second one core can verify for each hash
+method, and the throughput of a pool of hashing processes like the one
+utils/passwords.py runs (PASSWORD_HASH_WORKERS). Use it to pick
+PASSWORD_HASH_METHOD and the pool size for a host: a login burst costs
+about (logins / rate per core) CPU-seconds.
+
+Budget mode fails (non-zero exit) when the first method verifies fewer
+than --min-rate logins per second per core.
+
+Usage:
+    python tools/password_benchmark.py
+    python tools/password_benchmark.py --method scrypt:32768:8:1 --method scrypt:16384:8:1 --workers 2
+    python tools/password_benchmark.py --method pbkdf2:sha256:600000 --min-rate 10 --output passwords.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD = 'correct horse battery staple'
+
+def verify_many(pwhash, count):
+    """Verify `count` times in this process; return the per-verification seconds."""
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        check_password_hash(pwhash, PASSWORD)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def bench_single(pwhash, iterations):
+    timings = verify_many(pwhash, iterations)
+    return {
+        'verify_ms_median': round(statistics.median(timings) * 1000, 2),
+        'verify_ms_max': round(max(timings) * 1000, 2),
+        'logins_per_second_per_core': round(1 / statistics.median(timings), 2),
+    }
+
+def bench_pool(pwhash, workers, iterations):
+    """Throughput of `workers` spawned processes verifying `iterations` logins each."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        list(pool.map(verify_many, [pwhash] * workers, [1] * workers))  # Start the processes
+        started = time.perf_counter()
+        list(pool.map(verify_many, [pwhash] * workers, [iterations] * workers))
+        elapsed = time.perf_counter() - started
+    return {
+        'workers': workers,
+        'logins_per_second': round(workers * iterations / elapsed, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure password verifications per second per core.')
+    parser.add_argument('--method', action='append',
+                        help='werkzeug hash method to measure (repeatable; default: PASSWORD_HASH_METHOD or scrypt)')
+    parser.add_argument('--iterations', type=int, default=20, help='Verifications per measurement')
+    parser.add_argument('--workers', type=int, default=0, help='Also measure a pool of this many processes')
+    parser.add_argument('--min-rate', type=float, help='Fail if the first method verifies fewer logins/s per core')
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    args = parser.parse_args()
+
+    methods = args.method or [os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1']
+
+    results = []
+    for method in methods:
+        pwhash = generate_password_hash(PASSWORD, method)
+        verify_many(pwhash, 1)  # Warm-up
+        result = {'method': method, 'hash_length': len(pwhash), **bench_single(pwhash, args.iterations)}
+        if args.workers:
+            result['pool'] = bench_pool(pwhash, args.workers, args.iterations)
+        results.append(result)
+
+        line = (f"{method}: {result['verify_ms_median']} ms per login, "
+                f"{result['logins_per_second_per_core']} logins/s per core")
+        if args.workers:
+            line += f", {result['pool']['logins_per_second']} logins/s with {args.workers} workers"
+        print(line, file=sys.stderr)
+
+    document = {
+        'meta': {
+            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'options': {key: value for key, value in vars(args).items() if key != 'output'},
+        },
+        'results': results,
+    }
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    rate = results[0]['logins_per_second_per_core']
+    if args.min_rate is not None and rate < args.min_rate:
+        print(f"BUDGET {methods[0]} verifies {rate} logins/s per core, below {args.min_rate}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
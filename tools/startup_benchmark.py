@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Worker cold-start benchmark.
+
+Boots the app the way a fresh WSGI worker does, importing app.py and calling
+create_app(), in new interpreters run with -X importtime. It reports the
+median boot time and the modules that take the longest to import.
+
+Budget mode fails (non-zero exit) in two cases:
+- the median boot exceeds --budget-ms;
+- any --forbid module is imported during boot, meaning an SDK that should
+  load on first use was imported eagerly again.
+
+Usage:
+    python tools/startup_benchmark.py
+    python tools/startup_benchmark.py --budget-ms 800 --runs 7 --output startup.json
+    python tools/startup_benchmark.py --config pythonanywhere --database-url mysql+pymysql://...
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+project_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use by the code paths that need them (see services/stripe_api.py,
+# services/todoist_api.py and utils/encryption.py)
+DEFAULT_FORBIDDEN = ('stripe', 'todoist_api_python.api', 'cryptography.fernet')
+
+# Runs in the child interpreter; prints one JSON line with its timings
+BOOT_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {project_folder!r})
+from app import create_app
+imported = time.perf_counter()
+create_app({config!r})
+finished = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (finished - imported) * 1000,
+    'boot_ms': (finished - started) * 1000,
+    'modules': sorted(sys.modules),
+}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$')
+
+def parse_importtime(stderr):
+    """Return {module: (self us, cumulative us, depth)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+def boot_once(args, workdir):
+    """Boot the app in a fresh interpreter; return (timings, importtime modules)."""
+    env = dict(os.environ)
+    env.update({
+        'FLASK_RUN_FROM_CLI': '1',  # The scheduler thread is not part of the request path
+        'DATABASE_URL': args.database_url or f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+    })
+    snippet = BOOT_SNIPPET.format(project_folder=project_folder, config=args.config)
+    # Relative paths such as the log directory land in the temporary directory
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', snippet], cwd=workdir, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f"App failed to boot (exit {result.returncode})")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app cold-start time with -X importtime.')
+    parser.add_argument('--runs', type=int, default=5, help='Measured boots (after one warm-up)')
+    parser.add_argument('--config', default='production', help='Configuration passed to create_app')
+    parser.add_argument('--database-url', help='Database URL for the boot (default: a temporary SQLite file)')
+    parser.add_argument('--budget-ms', type=float, help='Fail if the median boot takes longer than this')
+    parser.add_argument('--forbid', default=','.join(DEFAULT_FORBIDDEN),
+                        help='Comma-separated modules that must not be imported at boot ("" to disable)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest top-level imports to report')
+    parser.add_argument('--output', help='Write results JSON here instead of stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='startup_benchmark_') as workdir:
+        boot_once(args, workdir)  # Warm-up: compiles bytecode and fills the OS file cache
+        runs = [boot_once(args, workdir) for _ in range(args.runs)]
+
+    boot_ms = [timings['boot_ms'] for timings, _ in runs]
+    median_index = boot_ms.index(sorted(boot_ms)[len(boot_ms) // 2])
+    median_timings, median_modules = runs[median_index]
+
+    # Cumulative import time of the modules imported directly by the boot code
+    top_level = sorted(
+        ((name, cumulative) for name, (_, cumulative, depth) in median_modules.items() if depth <= 1),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+
+    forbidden = [name for name in args.forbid.split(',') if name.strip()]
+    loaded = set(median_timings['modules'])
+    forbidden_loaded = [name for name in forbidden if name.strip() in loaded]
+
+    result = {
+        'boot_ms_median': round(statistics.median(boot_ms), 1),
+        'boot_ms_min': round(min(boot_ms), 1),
+        'boot_ms_max': round(max(boot_ms), 1),
+        'import_ms_median': round(statistics.median(t['import_ms'] for t, _ in runs), 1),
+        'create_app_ms_median': round(statistics.median(t['create_app_ms'] for t, _ in runs), 1),
+        'modules_loaded': len(loaded),
+        'slowest_imports_ms': [[name, round(us / 1000, 1)] for name, us in top_level],
+        'forbidden_loaded': forbidden_loaded,
+        'budget_ms': args.budget_ms,
+    }
+    document = {
+        'meta': {
+            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': {key: value for key, value in vars(args).items() if key not in ('output', 'database_url')},
+        },
+        'results': result,
+    }
+
+    print(f"boot median {result['boot_ms_median']} ms (min {result['boot_ms_min']}, max {result['boot_ms_max']}): "
+          f"import {result['import_ms_median']} ms, create_app {result['create_app_ms_median']} ms, "
+          f"{result['modules_loaded']} modules", file=sys.stderr)
+    for name, ms in result['slowest_imports_ms']:
+        print(f"  {ms:>8} ms  {name}", file=sys.stderr)
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    failures = [f"{name} imported at boot" for name in forbidden_loaded]
+    if args.budget_ms is not None and result['boot_ms_median'] > args.budget_ms:
+        failures.append(f"median boot {result['boot_ms_median']} ms exceeds budget {args.budget_ms} ms")
+    for failure in failures:
+        print(f"BUDGET {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Fixture replay server for offline benchmarks.
+
+Serves the Canvas (/api/v1) and Todoist (/rest/v2) endpoints used by
+CanvasAPI and TodoistClient from the recorded responses in tools/fixtures,
+cloning each record with fresh ids so any number of courses and assignments
+can be served. Latency, page size and error rate are configurable, and all
+generated data depends only on the options and seed.
+
+Point the clients at it with:
+    CanvasAPI(api_url=f"{base_url}/api/v1", ...)
+    TodoistClient(..., base_url=base_url)   # or TODOIST_API_BASE_URL
+
+Usage:
+    python tools/stub_server.py --port 8765 --assignments 500 --latency-ms 20
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+DEFAULT_OPTIONS = {
+    'courses': 1,             # Courses returned by GET /courses
+    'assignments': 20,        # Assignments per course
+    'submitted_ratio': 0.2,   # Share of assignments already submitted (skipped by the sync)
+    'page_size': 100,         # Maximum items per Canvas page (per_page is capped to this)
+    'latency_ms': 0.0,        # Added to every response
+    'error_rate': 0.0,        # Share of requests answered with a 500
+    'seed': 1,
+}
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+class FixtureData:
+    """Deterministic Canvas and Todoist payloads built from the recorded fixtures."""
+
+    def __init__(self, options):
+        self.options = options
+        self.course_template = load_fixture('canvas/course.json')
+        self.assignment_template = load_fixture('canvas/assignment.json')
+        self.todo_template = load_fixture('canvas/todo_item.json')
+        self.project_template = load_fixture('todoist/project.json')
+        self.task_template = load_fixture('todoist/task.json')
+        self._assignments = {}
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count(int(self.task_template['id']))
+
+    def course_id(self, index):
+        return self.course_template['id'] + index
+
+    def courses(self):
+        courses = []
+        for index in range(self.options['courses']):
+            course = copy.deepcopy(self.course_template)
+            course['id'] = self.course_id(index)
+            course['name'] = f"{self.course_template['name']} ({index + 1})"
+            course['course_code'] = f"{self.course_template['course_code']}-{index + 1}"
+            courses.append(course)
+        return courses
+
+    def assignments(self, course_id):
+        """All assignments for a course; generated once and reused across pages."""
+        with self._lock:
+            if course_id not in self._assignments:
+                self._assignments[course_id] = self._build_assignments(course_id)
+            return self._assignments[course_id]
+
+    def _build_assignments(self, course_id):
+        template = self.assignment_template
+        rng = random.Random(f"{self.options['seed']}-{course_id}")
+        base_due = datetime.strptime(template['due_at'], '%Y-%m-%dT%H:%M:%SZ')
+        assignments = []
+        for index in range(self.options['assignments']):
+            assignment = copy.deepcopy(template)
+            assignment_id = template['id'] + course_id * 100000 + index
+            assignment['id'] = assignment_id
+            assignment['course_id'] = course_id
+            assignment['name'] = f"{template['name']} #{index + 1}"
+            assignment['position'] = index + 1
+            assignment['points_possible'] = float(rng.choice((5, 10, 20, 30, 50, 100)))
+            assignment['due_at'] = (base_due + timedelta(hours=12 * index)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            assignment['html_url'] = re.sub(r'/courses/\d+/assignments/\d+',
+                                            f'/courses/{course_id}/assignments/{assignment_id}',
+                                            template['html_url'])
+            submission = assignment['submission']
+            submission['assignment_id'] = assignment_id
+            if rng.random() < self.options['submitted_ratio']:
+                submission['submitted_at'] = assignment['due_at']
+                submission['workflow_state'] = 'submitted'
+            assignments.append(assignment)
+        return assignments
+
+    def todo_items(self):
+        items = []
+        for course_index in range(self.options['courses']):
+            course_id = self.course_id(course_index)
+            for assignment in self.assignments(course_id):
+                if assignment['submission'].get('submitted_at'):
+                    continue
+                item = copy.deepcopy(self.todo_template)
+                item['course_id'] = course_id
+                item['title'] = assignment['name']
+                item['html_url'] = f"{assignment['html_url']}#submit"
+                item['assignment'] = assignment
+                items.append(item)
+        return items
+
+    def projects(self):
+        return [copy.deepcopy(self.project_template)]
+
+    def new_comment(self, data):
+        return {
+            'id': str(next(self._task_ids)),
+            'task_id': data.get('task_id'),
+            'project_id': None,
+            'content': data.get('content', ''),
+            'posted_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'attachment': None,
+        }
+
+    def new_task(self, data):
+        task = copy.deepcopy(self.task_template)
+        task_id = str(next(self._task_ids))
+        task.update({
+            'id': task_id,
+            'url': f"https://todoist.com/showTask?id={task_id}",
+            'content': data.get('content', ''),
+            'project_id': data.get('project_id') or task['project_id'],
+            'priority': data.get('priority', 1),
+            'labels': data.get('labels', []),
+            'description': data.get('description', ''),
+            'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        })
+        due_date = data.get('due_date')
+        task['due'] = {'date': due_date, 'string': due_date, 'lang': 'en', 'is_recurring': False} if due_date else None
+        return task
+
+def make_handler(data, options):
+    """Build a request handler class bound to one FixtureData instance."""
+    rng = random.Random(options['seed'])
+    rng_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately; without TCP_NODELAY keep-alive
+        # responses stall ~40ms on delayed ACKs and swamp the measurement
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass  # Benchmarks would otherwise be dominated by stderr writes
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _before_response(self):
+            """Apply latency and error injection; return True if the request was answered."""
+            if options['latency_ms']:
+                time.sleep(options['latency_ms'] / 1000.0)
+            if options['error_rate']:
+                with rng_lock:
+                    failed = rng.random() < options['error_rate']
+                if failed:
+                    self._send_json(500, {'errors': [{'message': 'Injected stub failure'}]})
+                    return True
+            return False
+
+        def _send_page(self, url, items):
+            """Send one Canvas page of items with a Link header like Canvas does."""
+            query = parse_qs(url.query)
+            per_page = min(int(query.get('per_page', ['10'])[0]), options['page_size'])
+            page = int(query.get('page', ['1'])[0])
+            last_page = max(1, -(-len(items) // per_page))
+
+            def page_url(number):
+                params = {key: values[0] for key, values in query.items()}
+                params.update(page=number, per_page=per_page)
+                return f"<http://{self.headers['Host']}{url.path}?{urlencode(params)}>"
+
+            links = [f'{page_url(page)}; rel="current"']
+            if page < last_page:
+                links.append(f'{page_url(page + 1)}; rel="next"')
+            if page > 1:
+                links.append(f'{page_url(page - 1)}; rel="prev"')
+            links.append(f'{page_url(1)}; rel="first"')
+            links.append(f'{page_url(last_page)}; rel="last"')
+
+            start = (page - 1) * per_page
+            self._send_json(200, items[start:start + per_page], {'Link': ','.join(links)})
+
+        def do_GET(self):
+            if self._before_response():
+                return
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/')
+
+            if path == '/api/v1/courses':
+                return self._send_page(url, data.courses())
+            match = re.fullmatch(r'/api/v1/courses/(\d+)/assignments', path)
+            if match:
+                return self._send_page(url, data.assignments(int(match.group(1))))
+            if path == '/api/v1/users/self/todo':
+                return self._send_page(url, data.todo_items())
+            if path == '/rest/v2/projects':
+                return self._send_json(200, data.projects())
+            if path == '/rest/v2/tasks':
+                return self._send_json(200, [])
+            self._send_json(404, {'errors': [{'message': 'The specified resource does not exist.'}]})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            if self._before_response():
+                return
+            path = urlsplit(self.path).path.rstrip('/')
+
+            if path == '/rest/v2/tasks':
+                return self._send_json(200, data.new_task(body))
+            if path == '/rest/v2/comments':
+                return self._send_json(200, data.new_comment(body))
+            self._send_json(404, {'error': 'Not found'})
+
+    return StubHandler
+
+def create_server(host='127.0.0.1', port=0, **options):
+    """Create (but don't start) a stub server; port 0 picks a free port."""
+    merged = dict(DEFAULT_OPTIONS, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(FixtureData(merged), merged))
+    server.daemon_threads = True
+    return server
+
+def serve_forever(host, port, options, ready=None):
+    """Run a stub server until the process is terminated (multiprocessing target)."""
+    server = create_server(host, port, **options)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded Canvas/Todoist fixtures over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--courses', type=int, default=DEFAULT_OPTIONS['courses'])
+    parser.add_argument('--assignments', type=int, default=DEFAULT_OPTIONS['assignments'])
+    parser.add_argument('--submitted-ratio', type=float, default=DEFAULT_OPTIONS['submitted_ratio'])
+    parser.add_argument('--page-size', type=int, default=DEFAULT_OPTIONS['page_size'])
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_OPTIONS['latency_ms'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_OPTIONS['error_rate'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_OPTIONS['seed'])
+    args = parser.parse_args()
+
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+    server = create_server(args.host, args.port, **options)
+    print(f"Stub server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
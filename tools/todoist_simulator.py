@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Simulated Todoist REST v2 / Sync v9 server for load testing.
+
+Keeps an in-memory account per API token (created on first use with an
+Inbox project) and implements the endpoints TodoistClient and the
+todoist_api_python SDK use:
+
+    GET/POST /rest/v2/tasks, GET/POST/DELETE /rest/v2/tasks/:id,
+    POST /rest/v2/tasks/:id/close, GET/POST /rest/v2/projects,
+    GET /rest/v2/projects/:id, POST /rest/v2/comments
+    POST /sync/v9/sync   (commands: item_add, item_update, item_close,
+                          item_delete, project_add; incremental reads
+                          with sync_token and resource_types)
+
+Load-relevant behaviour:
+    - per-token request quota over a fixed window (--quota/--quota-window),
+      answered with 429 and Retry-After once exhausted
+    - configurable latency and jitter, plus per-command cost for Sync batches
+    - duplicate detection: a repeated X-Request-Id (REST) or command uuid
+      (Sync) returns the original result without applying it again, and
+      tasks re-created with the same content in the same project are counted
+    - Sync batches limited to --max-commands (100, like Todoist)
+
+Usage:
+    python tools/todoist_simulator.py --port 8767 --latency-ms 40 --quota 450
+
+Point TodoistClient at it with base_url (or TODOIST_API_BASE_URL).
+GET /__sim/stats returns counters; POST /__sim/reset clears all state.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_OPTIONS = {
+    'quota': 450,             # Requests per token per window; 0 disables
+    'quota_window': 900.0,    # Seconds (Todoist: 450 requests / 15 minutes)
+    'max_commands': 100,      # Commands accepted per Sync request
+    'latency_ms': 0.0,
+    'jitter_ms': 0.0,
+    'command_latency_ms': 0.0,  # Added per command in a Sync batch
+    'retry_after': 30,
+    'seed': 1,
+}
+
+def _timestamp():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+class Account:
+    """In-memory state for one API token."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.projects = {}
+        self.tasks = {}
+        self.comments = {}
+        self.changes = {}        # (resource type, id) -> change sequence
+        self.sequence = 0
+        self.request_results = {}  # X-Request-Id -> (status, payload)
+        self.command_results = {}  # Sync command uuid -> status
+        self.content_keys = set()  # (project_id, content) of every created task
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.lock = threading.Lock()
+        inbox = self.add_project({'name': 'Inbox'})
+        inbox['is_inbox_project'] = True
+
+    def _touch(self, kind, object_id):
+        self.sequence += 1
+        self.changes[(kind, object_id)] = self.sequence
+
+    def add_project(self, data):
+        project_id = str(next(self.ids))
+        project = {
+            'id': project_id,
+            'parent_id': data.get('parent_id'),
+            'order': len(self.projects) + 1,
+            'color': data.get('color', 'charcoal'),
+            'name': data.get('name', ''),
+            'comment_count': 0,
+            'is_shared': False,
+            'is_favorite': bool(data.get('is_favorite', False)),
+            'is_inbox_project': False,
+            'is_team_inbox': False,
+            'url': f"https://todoist.com/showProject?id={project_id}",
+            'view_style': data.get('view_style', 'list'),
+        }
+        self.projects[project_id] = project
+        self._touch('projects', project_id)
+        return project
+
+    def add_task(self, data):
+        """Create a task; return (task, is_duplicate_content)."""
+        project_id = str(data.get('project_id') or next(iter(self.projects)))
+        if project_id not in self.projects:
+            raise KeyError(project_id)
+        task_id = str(next(self.ids))
+        due_date = data.get('due_date') or (data.get('due') or {}).get('date')
+        task = {
+            'id': task_id,
+            'assigner_id': None,
+            'assignee_id': data.get('assignee_id'),
+            'project_id': project_id,
+            'section_id': data.get('section_id'),
+            'parent_id': data.get('parent_id'),
+            'order': len(self.tasks) + 1,
+            'content': data.get('content', ''),
+            'description': data.get('description', ''),
+            'is_completed': False,
+            'labels': data.get('labels') or [],
+            'priority': data.get('priority', 1),
+            'comment_count': 0,
+            'creator_id': '1',
+            'created_at': _timestamp(),
+            'due': {'date': due_date, 'string': due_date, 'lang': 'en', 'is_recurring': False} if due_date else None,
+            'url': f"https://todoist.com/showTask?id={task_id}",
+            'duration': None,
+        }
+        self.tasks[task_id] = task
+        self._touch('items', task_id)
+        key = (project_id, task['content'])
+        duplicate = key in self.content_keys
+        self.content_keys.add(key)
+        return task, duplicate
+
+    def update_task(self, task_id, data):
+        task = self.tasks[task_id]
+        for field in ('content', 'description', 'labels', 'priority'):
+            if field in data:
+                task[field] = data[field]
+        if 'due_date' in data:
+            due_date = data['due_date']
+            task['due'] = {'date': due_date, 'string': due_date, 'lang': 'en', 'is_recurring': False} if due_date else None
+        self._touch('items', task_id)
+        return task
+
+    def close_task(self, task_id):
+        self.tasks[task_id]['is_completed'] = True
+        self._touch('items', task_id)
+
+    def delete_task(self, task_id):
+        del self.tasks[task_id]
+        self._touch('items', task_id)
+
+    def add_comment(self, data):
+        task = self.tasks[str(data.get('task_id'))]
+        comment_id = str(next(self.ids))
+        comment = {
+            'id': comment_id,
+            'task_id': task['id'],
+            'project_id': None,
+            'content': data.get('content', ''),
+            'posted_at': _timestamp(),
+            'attachment': data.get('attachment'),
+        }
+        self.comments[comment_id] = comment
+        task['comment_count'] += 1
+        self._touch('items', task['id'])
+        return comment
+
+    def changed_since(self, kind, sequence):
+        """Resources of a kind changed after `sequence` (deleted ones flagged is_deleted)."""
+        source = self.tasks if kind == 'items' else self.projects
+        changed = []
+        for (change_kind, object_id), changed_at in self.changes.items():
+            if change_kind != kind or changed_at <= sequence:
+                continue
+            if object_id in source:
+                changed.append(source[object_id])
+            else:
+                changed.append({'id': object_id, 'is_deleted': True})
+        return changed
+
+class TodoistState:
+    """All simulated accounts plus server-wide counters."""
+
+    def __init__(self, options):
+        self.options = options
+        self.accounts = {}
+        self.ids = itertools.count(6000000000)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def account(self, token):
+        with self.lock:
+            if token not in self.accounts:
+                self.accounts[token] = Account(self.ids)
+            return self.accounts[token]
+
+    def count(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['accounts'] = len(self.accounts)
+            stats['tasks'] = sum(len(account.tasks) for account in self.accounts.values())
+            return stats
+
+    def reset(self):
+        with self.lock:
+            self.accounts.clear()
+            self.stats.clear()
+
+def make_handler(state, options):
+    """Build a request handler class bound to one TodoistState."""
+    rng = random.Random(options['seed'])
+    rng_lock = threading.Lock()
+
+    class TodoistHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True  # See tools/stub_server.py
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload=None, headers=None):
+            body = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            if payload is not None:
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if not raw:
+                return {}
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                return json.loads(raw)
+            # Sync API clients usually send form fields holding JSON strings
+            fields = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+            for key in ('commands', 'resource_types'):
+                if key in fields:
+                    fields[key] = json.loads(fields[key])
+            return fields
+
+        def _delay(self, extra_ms=0.0):
+            latency = options['latency_ms'] + extra_ms
+            if options['jitter_ms']:
+                with rng_lock:
+                    latency += rng.random() * options['jitter_ms']
+            if latency:
+                time.sleep(latency / 1000.0)
+
+        def _authorize(self):
+            """Return the caller's Account, or None after answering 401/429."""
+            token = self.headers.get('Authorization', '').replace('Bearer ', '', 1).strip()
+            if not token:
+                state.count('unauthorized')
+                self._send(401, {'error': 'Unauthorized'})
+                return None
+            account = state.account(token)
+            if options['quota']:
+                with account.lock:
+                    now = time.monotonic()
+                    if now - account.window_start >= options['quota_window']:
+                        account.window_start, account.window_requests = now, 0
+                    account.window_requests += 1
+                    over_quota = account.window_requests > options['quota']
+                    retry_after = int(account.window_start + options['quota_window'] - now) + 1
+                if over_quota:
+                    state.count('throttled')
+                    self._send(429, {'error': 'Too many requests', 'error_code': 429},
+                               {'Retry-After': str(min(retry_after, options['retry_after']))})
+                    return None
+            return account
+
+        def _handle(self, method):
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/')
+
+            if path == '/__sim/stats' and method == 'GET':
+                return self._send(200, state.snapshot())
+            if path == '/__sim/reset' and method == 'POST':
+                state.reset()
+                return self._send(200, {'reset': True})
+
+            body = self._read_body() if method == 'POST' else {}
+            route = re.sub(r'/\d+', '/:id', path)
+            state.count('requests', f"{method} {route}")
+            self._delay()
+
+            account = self._authorize()
+            if account is None:
+                return
+
+            if path == '/sync/v9/sync' and method == 'POST':
+                return self._sync(account, body)
+
+            request_id = self.headers.get('X-Request-Id')
+            with account.lock:
+                if request_id and method == 'POST' and request_id in account.request_results:
+                    state.count('duplicate_requests')
+                    return self._send(*account.request_results[request_id])
+                try:
+                    status, payload = self._rest(account, method, path, url, body)
+                except KeyError:
+                    status, payload = 404, {'error': 'Not found'}
+                if request_id and method == 'POST' and status == 200:
+                    account.request_results[request_id] = (status, payload)
+            if status == 204:
+                return self._send(204)
+            self._send(status, payload)
+
+        def _rest(self, account, method, path, url, body):
+            """Apply a REST v2 call (account lock held); return (status, payload)."""
+            match = re.fullmatch(r'/rest/v2/(tasks|projects)(?:/(\d+))?(/close|/reopen)?', path)
+            if match:
+                kind, object_id, action = match.groups()
+                if kind == 'projects':
+                    if method == 'GET' and not object_id:
+                        return 200, list(account.projects.values())
+                    if method == 'GET':
+                        return 200, account.projects[object_id]
+                    if method == 'POST' and not object_id:
+                        return 200, account.add_project(body)
+                elif method == 'GET' and not object_id:
+                    query = parse_qs(url.query)
+                    project_id = query.get('project_id', [None])[0]
+                    return 200, [task for task in account.tasks.values()
+                                 if not task['is_completed'] and (not project_id or task['project_id'] == project_id)]
+                elif method == 'GET':
+                    return 200, account.tasks[object_id]
+                elif method == 'POST' and not object_id:
+                    task, duplicate = account.add_task(body)
+                    if duplicate:
+                        state.count('duplicate_tasks')
+                    state.count('tasks_created')
+                    return 200, task
+                elif method == 'POST' and action == '/close':
+                    account.close_task(object_id)
+                    return 204, None
+                elif method == 'POST' and not action:
+                    return 200, account.update_task(object_id, body)
+                elif method == 'DELETE':
+                    account.delete_task(object_id)
+                    return 204, None
+            if path == '/rest/v2/comments' and method == 'POST':
+                return 200, account.add_comment(body)
+            return 404, {'error': 'Not found'}
+
+        def _sync(self, account, body):
+            """Sync API: apply commands and return changed resources since sync_token."""
+            commands = body.get('commands') or []
+            if len(commands) > options['max_commands']:
+                state.count('rejected_batches')
+                return self._send(400, {'error': f"Too many commands (max {options['max_commands']})",
+                                        'error_code': 36})
+            self._delay(options['command_latency_ms'] * len(commands))
+
+            sync_status, temp_id_mapping = {}, {}
+            with account.lock:
+                for command in commands:
+                    command_uuid = command.get('uuid') or str(uuid.uuid4())
+                    if command_uuid in account.command_results:
+                        state.count('duplicate_commands')
+                        sync_status[command_uuid] = account.command_results[command_uuid]
+                        continue
+                    state.count('commands', f"command:{command.get('type')}")
+                    status = self._apply_command(account, command, temp_id_mapping)
+                    account.command_results[command_uuid] = status
+                    sync_status[command_uuid] = status
+
+                token = body.get('sync_token', '*')
+                since = 0 if token in (None, '*') else int(token)
+                resource_types = body.get('resource_types') or []
+                response = {
+                    'sync_token': str(account.sequence),
+                    'full_sync': since == 0,
+                    'sync_status': sync_status,
+                    'temp_id_mapping': temp_id_mapping,
+                }
+                for kind in ('items', 'projects'):
+                    if kind in resource_types or 'all' in resource_types:
+                        response[kind] = account.changed_since(kind, since)
+            state.count('full_syncs' if since == 0 and resource_types else 'partial_syncs')
+            self._send(200, response)
+
+        def _apply_command(self, account, command, temp_id_mapping):
+            args = dict(command.get('args') or {})
+            for key in ('id', 'project_id', 'item_id'):
+                if args.get(key) in temp_id_mapping:
+                    args[key] = temp_id_mapping[args[key]]
+            try:
+                kind = command.get('type')
+                if kind == 'item_add':
+                    task, duplicate = account.add_task(args)
+                    if duplicate:
+                        state.count('duplicate_tasks')
+                    state.count('tasks_created')
+                    created_id = task['id']
+                elif kind == 'project_add':
+                    created_id = account.add_project(args)['id']
+                elif kind == 'item_update':
+                    account.update_task(str(args['id']), args)
+                    created_id = None
+                elif kind in ('item_close', 'item_complete'):
+                    account.close_task(str(args['id']))
+                    created_id = None
+                elif kind == 'item_delete':
+                    account.delete_task(str(args['id']))
+                    created_id = None
+                else:
+                    return {'error_code': 22, 'error': f"Invalid command type: {kind}"}
+            except KeyError:
+                return {'error_code': 22, 'error': 'Item not found'}
+            if created_id and command.get('temp_id'):
+                temp_id_mapping[command['temp_id']] = created_id
+            return 'ok'
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def do_DELETE(self):
+            self._handle('DELETE')
+
+    return TodoistHandler
+
+def create_server(host='127.0.0.1', port=0, **options):
+    """Create (but don't start) a simulator; port 0 picks a free port."""
+    merged = dict(DEFAULT_OPTIONS, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(TodoistState(merged), merged))
+    server.daemon_threads = True
+    return server
+
+def serve_forever(host, port, options, ready=None):
+    """Run a simulator until the process is terminated (multiprocessing target)."""
+    server = create_server(host, port, **options)
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated Todoist REST/Sync API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--quota', type=int, default=DEFAULT_OPTIONS['quota'],
+                        help='Requests per token per window; 0 disables the quota')
+    parser.add_argument('--quota-window', type=float, default=DEFAULT_OPTIONS['quota_window'])
+    parser.add_argument('--max-commands', type=int, default=DEFAULT_OPTIONS['max_commands'])
+    parser.add_argument('--latency-ms', type=float, default=DEFAULT_OPTIONS['latency_ms'])
+    parser.add_argument('--jitter-ms', type=float, default=DEFAULT_OPTIONS['jitter_ms'])
+    parser.add_argument('--command-latency-ms', type=float, default=DEFAULT_OPTIONS['command_latency_ms'])
+    parser.add_argument('--retry-after', type=int, default=DEFAULT_OPTIONS['retry_after'])
+    parser.add_argument('--seed', type=int, default=DEFAULT_OPTIONS['seed'])
+    args = parser.parse_args()
+
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+    server = create_server(args.host, args.port, **options)
+    print(f"Todoist simulator listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
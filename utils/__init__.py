@@ -8,11 +8,6 @@ import logging
 from .encryption import encrypt_data, decrypt_data
 from .api import get_api_clients, validate_canvas_url
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 def format_datetime(dt):
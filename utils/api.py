@@ -3,14 +3,11 @@ API client utilities for the application.
 """
 
 import logging
+from extensions import cache
 from services.canvas_api import CanvasAPI
 from services.todoist_api import TodoistClient
+from utils.metrics import record_cache_lookup
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 def get_api_clients(user):
@@ -40,6 +37,45 @@ def get_api_clients(user):
         logger.error(f"Error initializing API clients: {str(e)}")
         return None, None
 
+def get_sync_choices(user, timeout=300):
+    """
+    Get (course_choices, project_choices) select options for a user's sync form.
+    
+    Each list starts with a blank option and contains (id, name) tuples. Results
+    are cached per user so rendering the settings page doesn't hit Canvas and
+    Todoist on every view.
+    """
+    cache_key = f"sync_choices_{user.id}"
+    cached = cache.get(cache_key)
+    record_cache_lookup('sync_choices', cached is not None)
+    if cached is not None:
+        return cached
+    
+    course_choices = [('', '-- Select a Canvas course --')]
+    project_choices = [('', '-- Select a Todoist project --')]
+    
+    canvas_client, todoist_client = get_api_clients(user)
+    try:
+        if canvas_client:
+            for course in canvas_client.get_courses():
+                name = course.get('name') or course.get('course_code') or f"Course #{course.get('id')}"
+                course_choices.append((str(course.get('id')), name))
+        if todoist_client:
+            for project in todoist_client.get_projects():
+                project_choices.append((str(project.id), project.name))
+    except Exception as e:
+        logger.error(f"Error loading sync choices: {str(e)}")
+        # Don't cache partial results
+        return course_choices, project_choices
+    
+    # The clients log and return [] on some API errors; an empty list from a configured
+    # client is not cached, so one failed call doesn't leave the form empty until the timeout
+    if (canvas_client and len(course_choices) == 1) or (todoist_client and len(project_choices) == 1):
+        return course_choices, project_choices
+    
+    cache.set(cache_key, (course_choices, project_choices), timeout=timeout)
+    return course_choices, project_choices
+
 def validate_canvas_url(url):
     """Validate Canvas API URL format."""
     if not url:
@@ -0,0 +1,271 @@
+"""
+Database connection pool profiles and telemetry.
+
+Each process type sizes its pool to its own concurrency. DB_POOL_PROFILE
+picks an entry from DB_POOL_PROFILES ('web' for WSGI workers, 'sync' for
+processes that run the scheduler or the `flask process-stripe-events`
+loop). configure_pool() merges that entry into SQLALCHEMY_ENGINE_OPTIONS
+before the engine is created.
+
+The pool is an InstrumentedQueuePool, which records for this process:
+checkouts and how long they waited (including pre-ping and reconnects),
+checkouts that needed overflow connections, checkout timeouts, and
+connections opened, recycled, invalidated and closed. Session listeners
+also record how long each session transaction holds its connection,
+labelled by endpoint or connection_label(). pool_monitor.snapshot() feeds
+the admin system page; the same numbers go to /metrics for all workers.
+
+Code that waits on the network keeps its database work in brief
+unit_of_work() blocks, so no connection is held during the wait:
+
+    with unit_of_work():
+        user = User.query.get(user_id)
+    data = slow_upstream_call(user.api_token)
+    with unit_of_work() as session:
+        session.add(SyncHistory(...))
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from flask import has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from extensions import db
+from utils.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_EVENTS, DB_CONNECTION_HOLD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Engine options a profile may set
+PROFILE_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')
+
+def _is_memory_sqlite(uri):
+    # In-memory SQLite uses a single-connection pool that must not be replaced
+    return uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') in ('sqlite:', 'sqlite:/'))
+
+def configure_pool(app):
+    """Apply the DB_POOL_PROFILE entry to SQLALCHEMY_ENGINE_OPTIONS (call before db.init_app)."""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if _is_memory_sqlite(uri):
+        return None
+
+    name = app.config.get('DB_POOL_PROFILE') or 'web'
+    profiles = app.config.get('DB_POOL_PROFILES', {})
+    if name not in profiles:
+        raise ValueError(f"Unknown DB_POOL_PROFILE {name!r}; expected one of {sorted(profiles)}")
+
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.update({key: value for key, value in profiles[name].items() if key in PROFILE_OPTIONS})
+    # Per-process overrides, e.g. for a one-off always-on task
+    for key, env_name in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW')):
+        if os.environ.get(env_name):
+            options[key] = int(os.environ[env_name])
+    options['poolclass'] = InstrumentedQueuePool
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    pool_monitor.profile = name
+    pool_monitor.recycle_seconds = options.get('pool_recycle', -1)
+    pool_monitor.hold_warn_seconds = app.config.get('DB_CONNECTION_HOLD_WARN_SECONDS')
+    app.logger.info('Database pool profile %s: pool_size=%s max_overflow=%s pool_timeout=%s',
+                    name, options.get('pool_size'), options.get('max_overflow'), options.get('pool_timeout'))
+    return name
+
+class PoolMonitor:
+    """Per-process pool counters; updated by InstrumentedQueuePool and its event listeners."""
+
+    COUNTERS = ('checkouts', 'overflow_checkouts', 'timeouts', 'connects', 'recycled', 'invalidated', 'closed')
+    # Counter -> event label on the db_pool_events metric
+    EVENTS = {'timeouts': 'timeout', 'connects': 'connect', 'recycled': 'recycle',
+              'invalidated': 'invalidate', 'closed': 'close'}
+
+    def __init__(self):
+        self.profile = None
+        self.recycle_seconds = -1
+        self.hold_warn_seconds = None
+        self.started_at = time.time()
+        self.pools = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.COUNTERS, 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._peak_checked_out = 0
+        self._holds = 0
+        self._hold_total = 0.0
+        self._hold_max = (0.0, None)  # (seconds, label)
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+        DB_POOL_EVENTS.inc(profile=self.profile or 'default', event=self.EVENTS[name])
+
+    def record_checkout(self, pool, seconds, overflow):
+        checked_out = pool.checkedout()
+        with self._lock:
+            self._counts['checkouts'] += 1
+            if overflow:
+                self._counts['overflow_checkouts'] += 1
+            self._wait_total += seconds
+            if seconds > self._wait_max:
+                self._wait_max = seconds
+            if checked_out > self._peak_checked_out:
+                self._peak_checked_out = checked_out
+        profile = self.profile or 'default'
+        DB_POOL_CHECKOUT_SECONDS.observe(seconds, profile=profile)
+        DB_POOL_EVENTS.inc(profile=profile, event='checkout')
+        if overflow:
+            DB_POOL_EVENTS.inc(profile=profile, event='overflow_checkout')
+
+    def record_hold(self, label, seconds):
+        with self._lock:
+            self._holds += 1
+            self._hold_total += seconds
+            if seconds > self._hold_max[0]:
+                self._hold_max = (seconds, label)
+        DB_CONNECTION_HOLD_SECONDS.observe(seconds, context=label)
+        if self.hold_warn_seconds and seconds > self.hold_warn_seconds:
+            logger.warning('Database connection held for %.2fs by %s', seconds, label)
+
+    def snapshot(self):
+        """This process's pool state and counters since it started."""
+        with self._lock:
+            counts = dict(self._counts)
+            wait_total = self._wait_total
+            wait_max = self._wait_max
+            peak = self._peak_checked_out
+            holds = self._holds
+            hold_total = self._hold_total
+            hold_max, hold_max_label = self._hold_max
+        pools = [{
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout(),
+        } for pool in list(self.pools)]
+        checkouts = counts['checkouts']
+        return {
+            'profile': self.profile,
+            'pid': os.getpid(),
+            'uptime_seconds': int(time.time() - self.started_at),
+            'pools': pools,
+            'peak_checked_out': peak,
+            'avg_wait_ms': round(wait_total / checkouts * 1000, 2) if checkouts else None,
+            'max_wait_ms': round(wait_max * 1000, 2),
+            'holds': holds,
+            'avg_hold_ms': round(hold_total / holds * 1000, 2) if holds else None,
+            'max_hold_ms': round(hold_max * 1000, 2),
+            'max_hold_label': hold_max_label,
+            **counts,
+        }
+
+pool_monitor = PoolMonitor()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times checkouts and counts overflow use and timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_monitor.pools.add(self)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_monitor.count('timeouts')
+            logger.warning('Database pool exhausted: %d checked out, timeout %.1fs', self.checkedout(), self.timeout())
+            raise
+        pool_monitor.record_checkout(self, time.perf_counter() - started, self.checkedout() > self.size())
+        return connection
+
+# Registered on the class so every engine's pool (and pools recreated by dispose()) is covered
+
+@event.listens_for(InstrumentedQueuePool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    pool_monitor.count('connects')
+
+@event.listens_for(InstrumentedQueuePool, 'close')
+def _on_close(dbapi_connection, connection_record):
+    # Closed because it outlived pool_recycle, as opposed to overflow being returned or invalidation
+    recycle = pool_monitor.recycle_seconds
+    if recycle is not None and recycle > -1 and time.time() - connection_record.starttime > recycle:
+        pool_monitor.count('recycled')
+    else:
+        pool_monitor.count('closed')
+
+@event.listens_for(InstrumentedQueuePool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_monitor.count('invalidated')
+
+@event.listens_for(InstrumentedQueuePool, 'soft_invalidate')
+def _on_soft_invalidate(dbapi_connection, connection_record, exception):
+    pool_monitor.count('invalidated')
+
+# Connection hold time: from a session transaction's first connection to its commit/rollback
+
+_hold_local = threading.local()
+
+@contextmanager
+def connection_label(label):
+    """Attribute connections taken inside the block to `label` (default: the request endpoint)."""
+    previous = getattr(_hold_local, 'label', None)
+    _hold_local.label = label
+    try:
+        yield
+    finally:
+        _hold_local.label = previous
+
+def _current_label():
+    label = getattr(_hold_local, 'label', None)
+    if label:
+        return label
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+@event.listens_for(Session, 'after_begin')
+def _on_session_begin(session, transaction, connection):
+    session.info.setdefault('_connection_held', (time.perf_counter(), _current_label()))
+
+@event.listens_for(Session, 'after_transaction_end')
+def _on_session_transaction_end(session, transaction):
+    if transaction.parent is not None:
+        return
+    held = session.info.pop('_connection_held', None)
+    if held is not None:
+        started, label = held
+        pool_monitor.record_hold(label, time.perf_counter() - started)
+
+@contextmanager
+def unit_of_work(timer=None, name='unit of work'):
+    """
+    Run a short block of database work and release the connection after it.
+
+    Commits on success and rolls back on error, so the session holds no
+    transaction (and no pooled connection) afterwards. Objects loaded in
+    the block are not expired by the commit, so they stay readable without
+    another query while the caller waits on the network.
+
+    Args:
+        timer: Optional SyncTimer; the block is recorded as a 'db' span.
+    """
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        if timer is not None:
+            with timer.span('db', name):
+                yield session
+                session.commit()
+        else:
+            yield session
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.expire_on_commit = expire_on_commit
@@ -5,14 +5,9 @@ Encryption utilities for the application.
 import base64
 import hashlib
 import logging
-from cryptography.fernet import Fernet
+import threading
 from config import Config
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 def get_fernet_key(secret_key):
@@ -29,23 +24,33 @@ def get_fernet_key(secret_key):
     encoded_key = base64.urlsafe_b64encode(key_bytes)
     return encoded_key
 
-# Initialize encryption
-try:
-    fernet = Fernet(get_fernet_key(Config.SECRET_KEY))
-    logger.info("Encryption initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize encryption: {e}")
-    # Use a dummy Fernet key for development only
-    # In production, this should raise an exception to prevent running with insecure keys
-    fernet = Fernet(Fernet.generate_key())
-    logger.warning("Using fallback encryption key - NOT SUITABLE FOR PRODUCTION")
+_fernet = None
+_fernet_lock = threading.Lock()
+
+def get_fernet():
+    """Return the shared Fernet instance, importing cryptography on first use."""
+    global _fernet
+    if _fernet is None:
+        with _fernet_lock:
+            if _fernet is None:
+                from cryptography.fernet import Fernet
+                try:
+                    _fernet = Fernet(get_fernet_key(Config.SECRET_KEY))
+                    logger.info("Encryption initialized successfully")
+                except Exception as e:
+                    logger.error(f"Failed to initialize encryption: {e}")
+                    # Use a dummy Fernet key for development only
+                    # In production, this should raise an exception to prevent running with insecure keys
+                    _fernet = Fernet(Fernet.generate_key())
+                    logger.warning("Using fallback encryption key - NOT SUITABLE FOR PRODUCTION")
+    return _fernet
 
 def encrypt_data(data):
     """Encrypt sensitive data."""
     if not data:
         return None
     try:
-        return fernet.encrypt(data.encode()).decode()
+        return get_fernet().encrypt(data.encode()).decode()
     except Exception as e:
         logger.error(f"Error encrypting data: {str(e)}")
         return None
@@ -55,7 +60,7 @@ def decrypt_data(encrypted_data):
     if not encrypted_data:
         return None
     try:
-        return fernet.decrypt(encrypted_data.encode()).decode()
+        return get_fernet().decrypt(encrypted_data.encode()).decode()
     except Exception as e:
         logger.error(f"Error decrypting data: {str(e)}")
         return None 
\ No newline at end of file
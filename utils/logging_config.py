@@ -0,0 +1,129 @@
+"""
+Logging configuration for the application.
+Routes all log records through a queue so request threads never block on log I/O.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s [in %(pathname)s:%(lineno)d]'
+
+# One listener per process, shared by every app created in it
+_listener = None
+_listener_lock = threading.Lock()
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limit noisy low-level records.
+
+    Records at or below `level` are allowed through at most `max_per_window`
+    times per `window_seconds` for each logging call site. The first record
+    let through after a window closes notes how many were dropped.
+    Records above `level` always pass.
+    """
+
+    def __init__(self, max_per_window=10, window_seconds=60, level=logging.DEBUG):
+        super().__init__()
+        self.max_per_window = max_per_window
+        self.window_seconds = window_seconds
+        self.level = level
+        self._windows = {}  # (pathname, lineno) -> [window_start, allowed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        """Return True if the record should be emitted."""
+        if record.levelno > self.level or self.max_per_window <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+
+            if window[1] < self.max_per_window:
+                window[1] += 1
+                return True
+
+            window[2] += 1
+            return False
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers formatting to the listener thread.
+
+    The stock QueueHandler formats every record in the calling thread so it
+    can be pickled; our queue is in-process, so the record is passed as-is and
+    message interpolation happens off the request path.
+    """
+
+    def prepare(self, record):
+        return record
+
+def configure_logging(app):
+    """
+    Configure process-wide logging from the app config.
+
+    Installs a LazyQueueHandler (with a SamplingFilter) on the root logger and a
+    QueueListener that writes to a rotating log file and stderr, then applies
+    LOG_LEVEL and the per-module LOG_LEVELS. Safe to call more than once;
+    handlers are only installed the first time.
+    """
+    global _listener
+    config = app.config
+
+    root = logging.getLogger()
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    for name, level in config.get('LOG_LEVELS', {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+
+        log_file = config.get('LOG_FILE')
+        if log_file:
+            log_dir = os.path.dirname(log_file)
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=config.get('LOG_MAX_BYTES', 1048576),
+                backupCount=config.get('LOG_BACKUP_COUNT', 10)
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+
+        stream_level = config.get('LOG_STREAM_LEVEL')
+        if stream_level:
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(formatter)
+            stream_handler.setLevel(stream_level)
+            handlers.append(stream_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = LazyQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(
+            max_per_window=config.get('LOG_SAMPLE_MAX_PER_WINDOW', 10),
+            window_seconds=config.get('LOG_SAMPLE_WINDOW_SECONDS', 60)
+        ))
+        root.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Flush whatever is still queued when the worker exits
+        atexit.register(_listener.stop)
@@ -0,0 +1,499 @@
+"""
+In-process metrics registry.
+Counters, gauges and histograms rendered in the Prometheus text format by the
+/metrics endpoint (see blueprints/metrics.py).
+
+Each worker process keeps its own values in memory. When METRICS_DIR is set,
+every process also writes a JSON snapshot of its values to that directory
+(throttled to METRICS_FLUSH_SECONDS, plus once at exit), and a scrape merges
+all snapshots so the numbers cover every gunicorn/uWSGI worker and the
+scheduler, not just the process that happened to serve the request.
+
+Snapshots of processes that have exited (a restarted or recycled worker)
+are folded into metrics_archive.json by the next scrape and deleted: their
+counters and histograms keep counting in the totals, their gauges are
+dropped. A process whose PID was reused archives the old file before it
+writes its own. Liveness is checked by PID, so METRICS_DIR must not be
+shared between hosts or containers.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process, nothing to serialize
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SNAPSHOT_PREFIX = 'metrics_'
+ARCHIVE_NAME = 'metrics_archive.json'  # Counters and histograms of exited processes
+ARCHIVE_LOCK_NAME = 'metrics_archive.lock'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+def _snapshot_pid(path):
+    """The PID in a metrics_<pid>.json file name, or None (e.g. the archive)."""
+    try:
+        return int(os.path.basename(path)[len(SNAPSHOT_PREFIX):-len('.json')])
+    except ValueError:
+        return None
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        return True  # os.kill() would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # e.g. EPERM: exists but belongs to another user
+    return True
+
+class _Metric:
+    """Base class for a metric family with optional labels."""
+
+    type_name = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tuple of label values -> value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """Return {label tuple: value} copied under the registry lock."""
+        with self.registry.lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        self.registry.check_fork()
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.changed()
+
+    @staticmethod
+    def merge(values):
+        return sum(values)
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Gauge(_Metric):
+    """Point-in-time value; across processes the most recent write wins."""
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        self.registry.check_fork()
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = [value, time.time()]
+        self.registry.changed()
+
+    def _copy(self, value):
+        return list(value)
+
+    @staticmethod
+    def merge(values):
+        return max(values, key=lambda pair: pair[1])
+
+    def render(self, values):
+        for key, (value, _) in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    """Bucketed distribution of observations (e.g. latencies in seconds)."""
+
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, **labels):
+        if not self.registry.enabled:
+            return
+        self.registry.check_fork()
+        key = self._key(labels)
+        with self.registry.lock:
+            value = self._values.get(key)
+            if value is None:
+                # Per-bucket (non-cumulative) counts plus +Inf, then sum
+                value = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            for index, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            value['counts'][index] += 1
+            value['sum'] += amount
+        self.registry.changed()
+
+    def _copy(self, value):
+        return {'counts': list(value['counts']), 'sum': value['sum']}
+
+    @staticmethod
+    def merge(values):
+        values = list(values)
+        counts = [sum(column) for column in zip(*(value['counts'] for value in values))]
+        return {'counts': counts, 'sum': sum(value['sum'] for value in values)}
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(value['sum'])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class MetricsRegistry:
+    """
+    Holds every metric family for the process.
+
+    Metrics are declared at import time (see the module-level definitions
+    below); init_app() only reads configuration, so recording works the same
+    inside and outside an app context.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._metrics = {}
+        self.enabled = True
+        self.directory = None
+        self.flush_seconds = 5
+        self._last_flush = 0.0
+        self._dirty = False
+        self._atexit_registered = False
+        self._pid = os.getpid()
+        self._owned_snapshot_pid = None  # PID whose snapshot file this process has taken over
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_seconds = app.config.get('METRICS_FLUSH_SECONDS', 5)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            if not self._atexit_registered:
+                atexit.register(self.flush)
+                self._atexit_registered = True
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def check_fork(self):
+        """
+        Drop values inherited from a parent process.
+
+        A worker forked from a preloaded app starts with a copy of the
+        parent's values, which the parent's own snapshot already reports.
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        with self.lock:
+            if pid != self._pid:
+                for metric in self._metrics.values():
+                    metric._values.clear()
+                self._pid = pid
+                self._dirty = False
+
+    def changed(self):
+        """Note an update; write this process's snapshot if the flush interval has passed."""
+        self._dirty = True
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{os.getpid()}.json")
+
+    @staticmethod
+    def _read_snapshot(path):
+        """A snapshot's {metric name: [[labels, value], ...]}, or None if it is missing or being replaced."""
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.debug('Skipping metrics snapshot %s: %s', path, e)
+            return None
+
+    @staticmethod
+    def _write_snapshot(path, data):
+        """Atomically replace a snapshot file; False if it could not be written."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning('Could not write metrics snapshot %s: %s', path, e)
+            return False
+
+    @contextmanager
+    def _archive_lock(self):
+        # Serializes archiving across processes, so a dead snapshot is counted once
+        with open(os.path.join(self.directory, ARCHIVE_LOCK_NAME), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield  # Closing the file releases the lock
+
+    def _archive(self, paths):
+        """Fold the counters and histograms of exited processes' snapshots into the archive, then delete them."""
+        archive_path = os.path.join(self.directory, ARCHIVE_NAME)
+        with self._archive_lock():
+            archive = self._read_snapshot(archive_path) or {}
+            archived = []
+            for path in paths:
+                data = self._read_snapshot(path)
+                if data is None:
+                    continue  # Already archived by another process
+                for name, entries in data.items():
+                    metric = self._metrics.get(name)
+                    if metric is None or isinstance(metric, Gauge):
+                        continue
+                    merged = {tuple(key): value for key, value in archive.get(name, [])}
+                    for key, value in entries:
+                        key = tuple(key)
+                        merged[key] = metric.merge([merged[key], value]) if key in merged else value
+                    archive[name] = [[list(key), value] for key, value in merged.items()]
+                archived.append(path)
+            if not archived or not self._write_snapshot(archive_path, archive):
+                return
+            for path in archived:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        logger.debug('Archived %d metrics snapshots of exited processes', len(archived))
+
+    def flush(self):
+        """Atomically write this process's values to METRICS_DIR."""
+        if not self.directory or not self._dirty:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            self._dirty = False
+            data = {
+                name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for name, metric in self._metrics.items()
+            }
+            path = self._snapshot_path()
+            if self._owned_snapshot_pid != os.getpid():
+                # A file under our PID was left by an exited process that had the same PID
+                if os.path.exists(path):
+                    self._archive([path])
+                self._owned_snapshot_pid = os.getpid()
+            self._write_snapshot(path, data)
+
+    def collect(self):
+        """Return {metric name: {label tuple: value}} merged across processes."""
+        if not self.directory:
+            return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+        self._dirty = True
+        self.flush()
+
+        live, dead = [], []
+        for path in glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}*.json")):
+            pid = _snapshot_pid(path)
+            if pid is None:
+                continue
+            if pid == os.getpid() or _pid_alive(pid):
+                live.append(path)
+            else:
+                dead.append(path)
+        if dead:
+            self._archive(dead)
+
+        per_metric = {name: {} for name in self._metrics}
+        for path in live + [os.path.join(self.directory, ARCHIVE_NAME)]:
+            # A snapshot being replaced mid-read is skipped for this scrape
+            data = self._read_snapshot(path)
+            if data is None:
+                continue
+            for name, entries in data.items():
+                if name not in per_metric:
+                    continue
+                for key, value in entries:
+                    per_metric[name].setdefault(tuple(key), []).append(value)
+
+        return {
+            name: {key: self._metrics[name].merge(values) for key, values in grouped.items()}
+            for name, grouped in per_metric.items()
+        }
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+# Upstream API calls (recorded by services.instrumentation for every span)
+UPSTREAM_REQUEST_SECONDS = metrics.histogram(
+    'upstream_request_duration_seconds',
+    'Latency of Canvas and Todoist API calls.',
+    ('service', 'endpoint', 'status')
+)
+
+# Sync runs
+SYNC_DURATION_SECONDS = metrics.histogram(
+    'sync_duration_seconds',
+    'Wall time of a sync run.',
+    ('trigger', 'outcome'),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+)
+SYNC_TASKS = metrics.counter(
+    'sync_tasks',
+    'Assignments processed by SyncService, by result.',
+    ('result',)
+)
+
+# Cache effectiveness
+CACHE_REQUESTS = metrics.counter(
+    'cache_requests',
+    'Application cache lookups, by cache and result.',
+    ('cache', 'result')
+)
+
+# Scheduler
+SCHEDULER_QUEUE_DEPTH = metrics.gauge(
+    'scheduler_queue_depth',
+    'Sync settings rows due at the start of the last scheduler run.'
+)
+SCHEDULER_RUNS = metrics.counter(
+    'scheduler_runs',
+    'Scheduler passes, by outcome.',
+    ('outcome',)
+)
+
+# SQL statements per request (recorded by utils.query_counter)
+REQUEST_SQL_QUERIES = metrics.histogram(
+    'http_request_sql_queries',
+    'SQL statements run per request, by endpoint.',
+    ('endpoint',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200)
+)
+
+# Stripe webhook events (recorded by the webhook and services.stripe_events)
+STRIPE_EVENTS = metrics.counter(
+    'stripe_events',
+    'Stripe webhook events, by outcome (received, duplicate, processed, skipped, retried, failed).',
+    ('outcome',)
+)
+STRIPE_EVENT_BACKLOG = metrics.gauge(
+    'stripe_event_backlog',
+    'Stripe events waiting to be applied at the end of the last consumer run.'
+)
+
+# Database connection pool (recorded by utils.db)
+DB_POOL_CHECKOUT_SECONDS = metrics.histogram(
+    'db_pool_checkout_duration_seconds',
+    'Time to check a connection out of the pool, including waiting, pre-ping and reconnects.',
+    ('profile',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+)
+DB_CONNECTION_HOLD_SECONDS = metrics.histogram(
+    'db_connection_hold_duration_seconds',
+    'Time a session transaction held its pooled connection, by endpoint or job.',
+    ('context',),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+DB_POOL_EVENTS = metrics.counter(
+    'db_pool_events',
+    'Connection pool events, by pool profile and event.',
+    ('profile', 'event')
+)
+
+HISTORY_WRITER_FLUSHES = metrics.counter(
+    'history_writer_flushes',
+    'Batched writes of scheduler sync results, by outcome (success, error).',
+    ('outcome',)
+)
+
+PASSWORD_HASH_SECONDS = metrics.histogram(
+    'password_hash_duration_seconds',
+    'Time to hash or verify a password, including waiting for a hashing worker.',
+    ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+RATE_LIMITED = metrics.counter(
+    'rate_limited',
+    'Requests rejected by a rate limiter, by limiter (login_ip, login_username).',
+    ('limiter',)
+)
+
+def record_cache_lookup(cache_name, hit):
+    """Count a cache hit or miss for cache_name."""
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
@@ -0,0 +1,129 @@
+"""
+Password hashing.
+Hashes use PASSWORD_HASH_METHOD (a werkzeug method string such as
+'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'). Stored hashes made with
+other parameters still verify; needs_rehash() tells the login view to
+replace them while it has the plaintext.
+
+Hashing and verification run in a process pool of PASSWORD_HASH_WORKERS,
+so a burst of logins uses at most that many cores and the web threads
+only wait. At most PASSWORD_HASH_MAX_PENDING hashes may be queued or
+running per process; a caller that cannot get a slot within
+PASSWORD_HASH_QUEUE_TIMEOUT seconds gets PasswordHasherBusy instead of
+piling on. PASSWORD_HASH_WORKERS = 0 hashes in the calling thread.
+
+The pool is started on first use in each process, with the 'spawn' start
+method: forking a worker that already runs scheduler and logging threads
+can deadlock the child. Spawned children re-import the main module, so a
+script that hashes passwords must keep its code under
+`if __name__ == '__main__':` (gunicorn, uWSGI and `flask` already do).
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils.metrics import PASSWORD_HASH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'  # werkzeug's default
+
+class PasswordHasherBusy(Exception):
+    """Raised when every hashing slot stays taken for PASSWORD_HASH_QUEUE_TIMEOUT."""
+
+def hash_method(pwhash):
+    """The method part of a stored hash, e.g. 'scrypt:32768:8:1'."""
+    return pwhash.split('$', 1)[0] if pwhash else None
+
+class PasswordHasher:
+    """Bounded process pool for password hashing."""
+
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.workers = 0
+        self.queue_timeout = 5.0
+        self._slots = threading.BoundedSemaphore(1)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._normalized_method = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_METHOD
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5.0)
+        self._slots = threading.BoundedSemaphore(max(app.config.get('PASSWORD_HASH_MAX_PENDING', 8), 1))
+        self._normalized_method = None
+
+    # Public API
+
+    def hash(self, password):
+        """Hash a password with PASSWORD_HASH_METHOD."""
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash."""
+        if not pwhash:
+            return False
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+        return bool(pwhash) and hash_method(pwhash) != self.normalized_method()
+
+    def normalized_method(self):
+        """PASSWORD_HASH_METHOD with werkzeug's defaults filled in ('scrypt' -> 'scrypt:32768:8:1')."""
+        if self._normalized_method is None:
+            if self.method.count(':') >= 2:
+                self._normalized_method = self.method
+            else:
+                # Let werkzeug fill in the parameters (once per process)
+                self._normalized_method = hash_method(generate_password_hash('', self.method))
+        return self._normalized_method
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # Execution
+
+    def _get_pool(self):
+        # Imported on first use: multiprocessing is not needed to boot a worker
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # A pool inherited through fork belongs to the parent process
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, operation, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            logger.warning('Password hashing busy: no slot within %.1fs', self.queue_timeout)
+            raise PasswordHasherBusy()
+        started = time.perf_counter()
+        try:
+            if not self.workers:
+                return func(*args)
+            from concurrent.futures.process import BrokenProcessPool
+            try:
+                return self._get_pool().submit(func, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a new pool next time
+                logger.error('Password hashing pool broke; hashing in-process and restarting it')
+                with self._lock:
+                    self._pool = None
+                return func(*args)
+        finally:
+            self._slots.release()
+            PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.shutdown)
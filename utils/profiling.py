@@ -0,0 +1,337 @@
+"""
+Opt-in request profiler.
+Profiles individual requests and keeps the slowest ones for the admin
+profiles page (blueprints/admin.py).
+
+A request is profiled when PROFILING_ENABLED is set and either an admin sends
+the PROFILING_HEADER header, or the request is picked at random at
+PROFILING_SAMPLE_RATE. Each profile records:
+
+    cprofile mode  the functions with the most cumulative time (cProfile)
+    sample mode    wall-clock stack samples, kept as collapsed stacks for a
+                   flame graph (also downloadable for flamegraph.pl/speedscope)
+
+plus the number and duration of SQL statements run by the request
+(collected by utils/query_counter.py).
+
+Only the PROFILING_KEEP_PER_ENDPOINT slowest profiles of each endpoint are
+kept. They are held in memory, or written to PROFILING_DIR so that every
+worker process's profiles show up on the page.
+"""
+
+import cProfile
+import glob
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, request
+from flask_login import current_user
+from utils.query_counter import query_counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PREFIX = 'profile_'
+MAX_STACK_DEPTH = 64
+FLAME_MIN_SHARE = 0.005  # Flame graph nodes below this share of samples are dropped
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _safe_name(endpoint):
+    return re.sub(r'[^A-Za-z0-9.]+', '-', endpoint or 'unknown')
+
+class StackSampler:
+    """Sample the stack of one thread at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format used by flamegraph.pl ("a;b;c count")."""
+        return [[stack, count] for stack, count in self.stacks.most_common()]
+
+class ActiveProfile:
+    """State of one request while it is being profiled."""
+
+    def __init__(self, trigger, mode, sample_interval):
+        self.trigger = trigger
+        self.mode = mode
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.queries = query_counter.start_collecting()
+        self.profiler = None
+        self.sampler = None
+        if mode == 'sample':
+            self.sampler = StackSampler(threading.get_ident(), sample_interval)
+            self.sampler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        """Stop collecting; return the elapsed seconds. Safe to call twice."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        query_counter.stop_collecting(self.queries)
+        return time.perf_counter() - self.started
+
+    def function_stats(self, limit):
+        """The `limit` functions with the most cumulative time."""
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, name), (primitive_calls, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': name,
+                'location': f"{os.path.basename(filename)}:{line}" if line else filename,
+                'calls': calls,
+                'primitive_calls': primitive_calls,
+                'own_ms': round(tottime * 1000, 3),
+                'cumulative_ms': round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:limit]
+
+def build_flame_tree(collapsed):
+    """Turn collapsed stacks into a nested {name, value, children} tree for rendering."""
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in collapsed:
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            child = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            child['value'] += count
+            node = child
+
+    minimum = root['value'] * FLAME_MIN_SHARE
+
+    def finish(node):
+        children = [finish(child) for child in node['children'].values() if child['value'] >= minimum]
+        children.sort(key=lambda child: child['value'], reverse=True)
+        return {'name': node['name'], 'value': node['value'], 'children': children}
+
+    return finish(root)
+
+class RequestProfiler:
+    """Flask extension that profiles selected requests and keeps the slowest per endpoint."""
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.keep_per_endpoint = 5
+        self._profiles = {}  # endpoint -> list of profile dicts, slowest first (memory mode)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        if not self.enabled:
+            return
+        self.directory = app.config.get('PROFILING_DIR')
+        self.keep_per_endpoint = app.config.get('PROFILING_KEEP_PER_ENDPOINT', 5)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        query_counter.install()
+
+        # create_app calls this before adding its own request hooks, so they are profiled too
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    # Request hooks
+
+    def _trigger(self, config):
+        """Return why the current request should be profiled, or None."""
+        path = request.path
+        if any(path.startswith(prefix) for prefix in config.get('PROFILING_EXCLUDE_PATHS', ())):
+            return None
+        header = config.get('PROFILING_HEADER', 'X-Profile')
+        if request.headers.get(header):
+            if current_user.is_authenticated and current_user.is_admin:
+                return 'header'
+            logger.warning('Ignoring %s header from non-admin request to %s', header, path)
+        rate = config.get('PROFILING_SAMPLE_RATE', 0.0)
+        if rate and random.random() < rate:
+            return 'sample'
+        return None
+
+    def _start(self):
+        config = current_app.config
+        trigger = self._trigger(config)
+        if trigger:
+            g._active_profile = ActiveProfile(
+                trigger,
+                config.get('PROFILING_MODE', 'cprofile'),
+                config.get('PROFILING_SAMPLE_INTERVAL_MS', 5) / 1000.0,
+            )
+
+    def _finish(self, response):
+        active = g.pop('_active_profile', None)
+        if active is None:
+            return response
+        seconds = active.stop()
+        try:
+            profile = self._build(active, seconds, response.status_code, current_app.config)
+            self.store(profile)
+            response.headers['X-Profile-Id'] = profile['id']
+        except Exception as e:
+            current_app.logger.error('Error storing request profile for %s: %s', request.path, e)
+        return response
+
+    def _teardown(self, exc):
+        # after_request is skipped when a request fails outside the error handlers
+        active = g.pop('_active_profile', None)
+        if active is not None:
+            active.stop()
+
+    # Storage
+
+    def _build(self, active, seconds, status, config):
+        collapsed = active.sampler.collapsed() if active.sampler else []
+        return {
+            'id': uuid.uuid4().hex[:12],
+            'endpoint': request.endpoint or 'unknown',
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'trigger': active.trigger,
+            'mode': active.mode,
+            'user_id': current_user.get_id() if current_user.is_authenticated else None,
+            'pid': os.getpid(),
+            'started_at': active.started_at.isoformat(),
+            'duration_ms': round(seconds * 1000, 2),
+            'sql_count': active.queries.count,
+            'sql_ms': round(active.queries.seconds * 1000, 2),
+            'queries': active.queries.top(config.get('PROFILING_TOP_QUERIES', 15)),
+            'functions': active.function_stats(config.get('PROFILING_TOP_FUNCTIONS', 40)),
+            'samples': sum(count for _, count in collapsed),
+            'collapsed': collapsed,
+        }
+
+    def _filename(self, profile):
+        # Duration is encoded in the name so pruning and listing don't need to read the files
+        duration_us = int(profile['duration_ms'] * 1000)
+        return f"{PROFILE_PREFIX}{_safe_name(profile['endpoint'])}__{duration_us:012d}__{profile['id']}.json"
+
+    def store(self, profile):
+        """Keep `profile` if it is among the slowest for its endpoint."""
+        if not self.directory:
+            with self._lock:
+                kept = self._profiles.setdefault(profile['endpoint'], [])
+                kept.append(profile)
+                kept.sort(key=lambda item: item['duration_ms'], reverse=True)
+                del kept[self.keep_per_endpoint:]
+            return
+
+        pattern = os.path.join(self.directory, f"{PROFILE_PREFIX}{_safe_name(profile['endpoint'])}__*.json")
+        existing = sorted(glob.glob(pattern))
+        if len(existing) >= self.keep_per_endpoint:
+            fastest = os.path.basename(existing[0]).split('__')[1]
+            if int(fastest) >= int(profile['duration_ms'] * 1000):
+                return
+
+        path = os.path.join(self.directory, self._filename(profile))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(profile, f)
+        os.replace(tmp_path, path)
+
+        # Another worker may prune concurrently; a missing file is fine
+        for stale in sorted(glob.glob(pattern))[:-self.keep_per_endpoint]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def summaries(self):
+        """All kept profiles without their bulky fields, grouped by endpoint, slowest first."""
+        grouped = {}
+        if not self.directory:
+            with self._lock:
+                for endpoint, kept in self._profiles.items():
+                    grouped[endpoint] = [
+                        {key: value for key, value in profile.items()
+                         if key not in ('queries', 'functions', 'collapsed')}
+                        for profile in kept
+                    ]
+        else:
+            for path in glob.glob(os.path.join(self.directory, f"{PROFILE_PREFIX}*.json")):
+                profile = self._read(path)
+                if profile is None:
+                    continue
+                for key in ('queries', 'functions', 'collapsed'):
+                    profile.pop(key, None)
+                grouped.setdefault(profile['endpoint'], []).append(profile)
+            for kept in grouped.values():
+                kept.sort(key=lambda item: item['duration_ms'], reverse=True)
+
+        return sorted(grouped.items(), key=lambda item: item[1][0]['duration_ms'], reverse=True)
+
+    def get(self, profile_id):
+        """Return the full profile with this id, or None."""
+        if not re.fullmatch(r'[0-9a-f]+', profile_id or ''):
+            return None
+        if not self.directory:
+            with self._lock:
+                for kept in self._profiles.values():
+                    for profile in kept:
+                        if profile['id'] == profile_id:
+                            return profile
+            return None
+        for path in glob.glob(os.path.join(self.directory, f"{PROFILE_PREFIX}*__{profile_id}.json")):
+            return self._read(path)
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, f"{PROFILE_PREFIX}*.json")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            # A profile pruned by another worker mid-listing is skipped
+            logger.debug('Skipping profile %s: %s', path, e)
+            return None
+
+profiler = RequestProfiler()
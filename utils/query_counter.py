@@ -0,0 +1,213 @@
+"""
+SQL query counter.
+Counts and times the SQL statements each request runs, flags statement
+shapes repeated within one request as likely N+1 queries, and checks
+per-endpoint query budgets (QUERY_BUDGETS).
+
+Offenders are logged at the end of the request. Code and tests can also
+collect queries directly:
+
+    with count_queries() as stats:
+        client.get('/history/')
+    assert stats.count <= query_counter.budget_for('history.index')
+
+The request profiler (utils/profiling.py) uses the same collectors.
+"""
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils.metrics import REQUEST_SQL_QUERIES
+
+logger = logging.getLogger(__name__)
+
+MAX_SHAPE_LENGTH = 500
+
+_SHAPE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                     # String literals
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),                  # Numeric literals
+    (re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s'), '?'),            # Named/positional placeholders
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?)'),       # IN lists of any length
+    (re.compile(r'\s+'), ' '),
+)
+
+def statement_shape(statement):
+    """Normalize a statement so executions differing only in parameters compare equal."""
+    for pattern, replacement in _SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()[:MAX_SHAPE_LENGTH]
+
+class QueryBudgetExceeded(Exception):
+    """Raised at the end of a request over its budget when QUERY_BUDGET_RAISE is set."""
+
+class QueryStats:
+    """Queries collected for one request or one count_queries() block."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._statements = {}  # statement text -> [count, total seconds, max seconds]
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = self._statements.get(statement)
+        if entry is None:
+            self._statements[statement] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def shapes(self):
+        """Per-shape [count, total seconds, max seconds]; shapes are computed only when asked for."""
+        shapes = {}
+        for statement, (count, total, longest) in self._statements.items():
+            entry = shapes.setdefault(statement_shape(statement), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], longest)
+        return shapes
+
+    def top(self, limit):
+        """The `limit` shapes with the most total time, as dicts."""
+        rows = [
+            {'statement': shape, 'count': count,
+             'total_ms': round(total * 1000, 3), 'max_ms': round(longest * 1000, 3)}
+            for shape, (count, total, longest) in self.shapes().items()
+        ]
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit]
+
+    def repeated(self, threshold):
+        """Shapes run at least `threshold` times, most frequent first: [(shape, count)]."""
+        rows = [(shape, count) for shape, (count, _, _) in self.shapes().items() if count >= threshold]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows
+
+class QueryCounter:
+    """Flask extension that collects per-request query statistics."""
+
+    def __init__(self):
+        self.enabled = False
+        self.budgets = {}
+        self.default_budget = None
+        self.n_plus_one_threshold = 5
+        self.raise_on_budget = False
+        self._local = threading.local()
+        self._listening = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_COUNTER_ENABLED', True)
+        self.budgets = dict(app.config.get('QUERY_BUDGETS', {}))
+        self.default_budget = app.config.get('QUERY_BUDGET_DEFAULT')
+        self.n_plus_one_threshold = app.config.get('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+        self.raise_on_budget = app.config.get('QUERY_BUDGET_RAISE', False)
+        if not self.enabled:
+            return
+        self.install()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+
+    def install(self):
+        """Register the cursor listeners (once per process)."""
+        if not self._listening:
+            # Registered on the Engine class so every engine (and connection) is covered
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+    def budget_for(self, endpoint):
+        return self.budgets.get(endpoint, self.default_budget)
+
+    # Collectors
+
+    def _collectors(self):
+        collectors = getattr(self._local, 'collectors', None)
+        if collectors is None:
+            collectors = self._local.collectors = []
+        return collectors
+
+    def start_collecting(self):
+        """Collect the queries this thread runs until stop_collecting(); return the QueryStats."""
+        self.install()
+        stats = QueryStats()
+        self._collectors().append(stats)
+        return stats
+
+    def stop_collecting(self, stats):
+        collectors = self._collectors()
+        if stats in collectors:
+            collectors.remove(stats)
+        return stats
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._collectors():
+            conn.info.setdefault('_query_counter_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_query_counter_start')
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        for stats in self._collectors():
+            stats.record(statement, seconds)
+
+    # Request hooks
+
+    def _start(self):
+        g._query_stats = self.start_collecting()
+
+    def _finish(self, response):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return response
+        self.stop_collecting(stats)
+        self.report(request.endpoint, stats)
+        return response
+
+    def _teardown(self, exc):
+        stats = g.pop('_query_stats', None)
+        if stats is not None:
+            self.stop_collecting(stats)
+
+    def check(self, endpoint, stats):
+        """Return (budget, repeated shapes) problems for `stats`; budget is None when within it."""
+        budget = self.budget_for(endpoint)
+        over_budget = budget if budget is not None and stats.count > budget else None
+        if stats.count < self.n_plus_one_threshold:
+            return over_budget, []
+        return over_budget, stats.repeated(self.n_plus_one_threshold)
+
+    def report(self, endpoint, stats):
+        """Log N+1 shapes and budget overruns; raise in strict mode."""
+        REQUEST_SQL_QUERIES.observe(stats.count, endpoint=endpoint or 'unknown')
+
+        over_budget, repeated = self.check(endpoint, stats)
+        for shape, count in repeated:
+            current_app.logger.warning('Possible N+1 in %s: %d x %s', endpoint, count, shape[:200])
+        if over_budget is not None:
+            current_app.logger.warning('Query budget exceeded in %s: %d queries (%.1f ms), budget %d',
+                                       endpoint, stats.count, stats.seconds * 1000, over_budget)
+            if self.raise_on_budget:
+                raise QueryBudgetExceeded(
+                    f"{endpoint} ran {stats.count} queries, budget {over_budget}"
+                )
+
+query_counter = QueryCounter()
+
+@contextmanager
+def count_queries():
+    """Collect the queries run on this thread inside the block."""
+    stats = query_counter.start_collecting()
+    try:
+        yield stats
+    finally:
+        query_counter.stop_collecting(stats)
@@ -0,0 +1,166 @@
+"""
+Sliding-window rate limiting.
+Counts events per key in fixed buckets of `window` seconds and estimates
+the number in the last `window` seconds as the current bucket plus the
+previous one weighted by how much of it still overlaps. This needs two
+counters per key instead of a timestamp per event, and works on any
+key-value store.
+
+RATE_LIMIT_BACKEND 'local' keeps the counters in the worker process;
+'shared' keeps them in the Flask-Caching backend so all workers share a
+limit (increments there are not atomic, so concurrent bursts may slip a
+few attempts past the limit).
+
+Login uses two limiters (see blueprints/auth.py): every attempt counts
+against the client IP, and failed attempts count against the username.
+Both are checked before the user is looked up or a password hash is
+verified.
+"""
+
+import math
+import threading
+import time
+from flask import current_app, request
+from extensions import cache
+from utils.metrics import RATE_LIMITED
+
+CACHE_KEY = 'rate_limit:{}:{}:{}'
+
+class LocalCounters:
+    """Per-process bucket counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}  # (name, key, bucket) -> count
+        self._last_prune = time.monotonic()
+
+    def get(self, name, key, bucket):
+        with self._lock:
+            return self._counts.get((name, key, bucket), 0)
+
+    def incr(self, name, key, bucket, ttl):
+        with self._lock:
+            self._prune(bucket)
+            count = self._counts.get((name, key, bucket), 0) + 1
+            self._counts[(name, key, bucket)] = count
+            return count
+
+    def delete(self, name, key, bucket):
+        with self._lock:
+            self._counts.pop((name, key, bucket), None)
+            self._counts.pop((name, key, bucket - 1), None)
+
+    def _prune(self, bucket):
+        # Drop buckets older than the previous one, at most once a minute
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for counter in [counter for counter in self._counts if counter[2] < bucket - 1]:
+            del self._counts[counter]
+
+class SharedCounters:
+    """Bucket counters in the Flask-Caching backend."""
+
+    def get(self, name, key, bucket):
+        return cache.get(CACHE_KEY.format(name, key, bucket)) or 0
+
+    def incr(self, name, key, bucket, ttl):
+        cache_key = CACHE_KEY.format(name, key, bucket)
+        count = (cache.get(cache_key) or 0) + 1
+        cache.set(cache_key, count, timeout=ttl)
+        return count
+
+    def delete(self, name, key, bucket):
+        cache.delete_many(CACHE_KEY.format(name, key, bucket), CACHE_KEY.format(name, key, bucket - 1))
+
+BACKENDS = {'local': LocalCounters, 'shared': SharedCounters}
+
+_local_counters = LocalCounters()
+_shared_counters = SharedCounters()
+
+def _counters():
+    backend = current_app.config.get('RATE_LIMIT_BACKEND') or 'local'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}; expected one of {sorted(BACKENDS)}")
+    return _shared_counters if backend == 'shared' else _local_counters
+
+class RateLimiter:
+    """
+    Allow `limit` events per key in any `window` seconds.
+
+    Args:
+        name: Namespace for the counters, also the metric label.
+        config_key: App config entry holding (limit, window seconds); a
+            falsy value disables the limiter.
+    """
+
+    def __init__(self, name, config_key):
+        self.name = name
+        self.config_key = config_key
+
+    def _settings(self):
+        return current_app.config.get(self.config_key)
+
+    def _estimate(self, counters, key, now, window):
+        bucket = int(now // window)
+        elapsed = (now % window) / window
+        current = counters.get(self.name, key, bucket)
+        previous = counters.get(self.name, key, bucket - 1)
+        return current + previous * (1 - elapsed), bucket
+
+    def retry_after(self, key, now=None):
+        """
+        Seconds until `key` may try again, or 0 if it is under the limit.
+
+        Counts a rejection in the rate_limited metric.
+        """
+        settings = self._settings()
+        if not settings or key is None:
+            return 0
+        limit, window = settings
+        now = time.time() if now is None else now
+        counters = _counters()
+        estimate, bucket = self._estimate(counters, key, now, window)
+        if estimate < limit:
+            return 0
+
+        RATE_LIMITED.inc(limiter=self.name)
+        # The previous bucket's weight falls linearly; wait until the estimate drops below the limit
+        current = counters.get(self.name, key, bucket)
+        previous = counters.get(self.name, key, bucket - 1)
+        if current >= limit or not previous:
+            return math.ceil((bucket + 1) * window - now)
+        overlap_needed = (limit - current) / previous  # Remaining weight of the previous bucket
+        return max(math.ceil((bucket + 1 - overlap_needed) * window - now), 1)
+
+    def hit(self, key, now=None):
+        """Count one event for `key`."""
+        settings = self._settings()
+        if not settings or key is None:
+            return
+        _, window = settings
+        now = time.time() if now is None else now
+        # Kept for two windows: the current one and as the weighted previous one
+        _counters().incr(self.name, key, int(now // window), ttl=int(window * 2) + 1)
+
+    def reset(self, key, now=None):
+        """Forget `key`'s events (e.g. after a successful login)."""
+        settings = self._settings()
+        if not settings or key is None:
+            return
+        _, window = settings
+        now = time.time() if now is None else now
+        _counters().delete(self.name, key, int(now // window))
+
+def client_ip():
+    """The client address; RATE_LIMIT_IP_HEADER names a header set by a trusted proxy."""
+    header = current_app.config.get('RATE_LIMIT_IP_HEADER')
+    if header and request.headers.get(header):
+        return request.headers[header].split(',')[0].strip()
+    return request.remote_addr
+
+# Every login attempt, per client IP
+login_ip_limiter = RateLimiter('login_ip', 'LOGIN_RATE_LIMIT_PER_IP')
+# Failed login attempts, per username
+login_username_limiter = RateLimiter('login_username', 'LOGIN_RATE_LIMIT_PER_USERNAME')
@@ -34,19 +34,4 @@ application = create_app('pythonanywhere')
 # Add the file handler to the application logger
 application.logger.addHandler(file_handler)
 
-# Print debug information
-print("WSGI file loaded")
-print(f"Python version: {sys.version}")
-print(f"Working directory: {os.getcwd()}")
-print(f"Python path: {sys.path}")
-print(f"Environment: {os.environ.get('FLASK_ENV', 'production')}")
-print(f"Project path exists: {os.path.exists(project_path)}")
-print(f"Templates path exists: {os.path.exists(os.path.join(project_path, 'templates'))}")
-print(f"Log file path: {log_file}")
-
-# List all registered routes for debugging
-print("\nRegistered routes:")
-for rule in application.url_map.iter_rules():
-    print(f"{rule.endpoint}: {rule.rule}")
-
-# No need for __main__ check in production WSGI file 
\ No newline at end of file
+# Registered routes can be listed with `flask routes`